@@ -1,109 +1,63 @@
-import sqlite3
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import tracemalloc
 import tkinter as tk
+import tkinter.font as tkfont
+import tkinter.ttk as ttk
 from abc import abstractmethod
-import time
 from datetime import datetime
-from collections import namedtuple, Counter, OrderedDict
-
-tk_root_base = tk.Tk()
-tk_root_base.geometry('{}x{}'.format(1280, 800))
-tk_root_base.resizable(width=False, height=False)
-tk_root_base.wm_attributes('-fullscreen', 'true')
-
-
-class DBAccess:
-
-    def __init__(self, db_name):
-        self._db_name = db_name
-        self._db_conn = sqlite3.connect(self._db_name)
-        self._cursor = self._db_conn.cursor()
-        self._tr_list_items = None
-
-    def db_get(self, table_name, item_name: str = '', value: str = '*') -> list:
-        """
-        Get db entries by name of item
-        :param table_name: Name of the sqlite table
-        :param value: Specific value to query
-        :param item_name: Name of the db item to be queried
-        :return: List of all db entries belonging to the item
-        """
-        if item_name != '':
-            cmd = "SELECT ({val}) FROM {table_name} WHERE name_short=?".format(
-                val=value,
-                table_name=table_name
-            )
-            self._cursor.execute(cmd, (item_name,))
-        else:
-            cmd = "SELECT {val} FROM {table_name}".format(
-                val=value,
-                table_name=table_name
-            )
-            self._cursor.execute(cmd)
-        return self._cursor.fetchall()
-
-    def db_update_sold(self, table_name, item_short_name, sold=0):
-        """
-        Set db entry for sold items.
-        :param table_name: Name of the sqlite table
-        :param item_short_name: Short name of the db item to be queried
-        :param sold: How many sold items
-        :return: Nothing
-        """
-        cmd = "UPDATE {table_name} SET sold=? WHERE name_short=?".format(
-            table_name=table_name
-        )
-        self._db_conn.execute(cmd, (sold, item_short_name))
-        self._db_conn.commit()
-
-    def db_update_custom_sum(self, table_name, item_short_name, custom_sum=0):
-        """
-        Set db entry for custom sum.
-        :param table_name: Name of the sqlite table
-        :param item_short_name: Short name of the db item to be queried
-        :param custom_sum: Custom sum value
-        :return: Nothing
-        """
-        cmd = "UPDATE {table_name} SET price=? WHERE name_short=?".format(
-            table_name=table_name
-        )
-        self._db_conn.execute(cmd, (custom_sum, item_short_name))
-        self._db_conn.commit()
-
-    def set_tr_list_items(self, tr_list_items: list):
-        """
-        From db.fetchall comes list of tuples. This function can process it and stores it
-        in string for the db access command to be used.
-        :param tr_list_items: List of tuples with short names for db items.
-        :return: zip
-        """
-        item_list = []
-        for item in tr_list_items:
-            item_list.append(item[0])
-
-        self._tr_list_items = item_list
-
-    def get_tr_list_items(self):
-        """
-        :return: List of short names for those items that are stored in the transaction db
-        """
-        return self._tr_list_items
-
-    def db_create_transaction_entry(self, table_name, values: list):
-        """
-        Create db entry
-        :param table_name: Name of the sqlite table
-        :param values: List of values to be inserted into db table.
-        :return: nothing
-        """
-        items = 'date, bill, cash, ' + ','.join(self._tr_list_items)
-        placeholders = ','.join(['?'] * len(values))
-        cmd = 'INSERT INTO {table_name} ({items}) VALUES ({placeholders})'.format(
-            table_name=table_name,
-            items=items,
-            placeholders=placeholders
-        )
-        self._db_conn.execute(cmd, values)
-        self._db_conn.commit()
+from collections import OrderedDict, deque
+from db_schema import to_cents
+from kasse_core import RegisterEngine, WriterBusyError, InsufficientCashError, CartLine, format_cents, \
+    OutOfStockError, measure_commit_latency
+from instrumentation import Instrumentation, ResourceSampler, INSTRUMENTATION_LOG, RESOURCE_SAMPLE_INTERVAL
+from quick_entry import CatalogIndex, parse_entry, MAX_QUANTITY
+from event_db import BackupThread, open_event_db, event_db_name, BACKUP_INTERVAL
+from customer_display import CustomerDisplay
+from stock import STOCK_LOW, STOCK_OUT
+from printing import Sale, PrintSpool, open_printer, render_receipt, render_kitchen_ticket
+from food_layout import food_pages, page_count, placement, FOOD_GRID_COLUMNS, FOOD_GRID_ROWS
+import analytics
+
+"""UI methods measured when instrumentation is switched on"""
+INSTRUMENTED_UI_METHODS = ('display_element_factory', 'update_sum', 'close_transaction', 'end_transaction',
+                           'got_cash', 'custom_price', 'quantity', 'quantity_back', 'show_summary', 'summary_back',
+                           'reset_transaction')
+DIAG_HEARTBEAT_MS = 100
+FOOD_TAB_HEIGHT = 60
+CART_JOURNAL_SUFFIX = '.cart'
+ANALYTICS_POLL_MS = 100
+"""Prep planning time of the analytics screen"""
+ANALYTICS_PREP_TIME = (12, 0)
+DIAG_LOG_INTERVAL_MS = 60 * 1000
+EVENT_CHECK_MS = 60 * 1000
+EVENT_RETRY_MS = 5 * 1000
+
+"""Named fonts shared by all widgets, widgets refer to them by name"""
+NAMED_FONTS = OrderedDict([
+    ('kasse_food', {'family': 'Arial', 'size': 16}),
+    ('kasse_large', {'family': 'Arial', 'size': 20}),
+    ('kasse_display', {'family': 'Arial', 'size': 15}),
+    ('kasse_small', {'family': 'Arial', 'size': 10}),
+    ('kasse_small_bold', {'family': 'Arial', 'size': 10, 'weight': 'bold'}),
+])
+_named_fonts = {}
+
+
+def create_named_fonts(tk_root):
+    """
+    Create the fonts of NAMED_FONTS once. The font objects are kept, tk deletes a named font as soon
+    as its python object is garbage collected.
+    :param tk_root: Tk root
+    :return: Nothing
+    """
+    for name, options in NAMED_FONTS.items():
+        if name not in _named_fonts:
+            _named_fonts[name] = tkfont.Font(tk_root, name=name, **options)
 
 
 class UIFrameItem:
@@ -151,12 +105,75 @@ class UIFrameItem:
         self._frame.destroy()
         self._frame = self.make_frame()
         self._frame.pack_propagate(False)
+        self.show()
 
+    def show(self):
+        """
+        Pack frame object
+        :return: Nothing
+        """
         if self._pos != '':
             self._frame.pack(side=self._pos)
         else:
             self._frame.pack()
 
+    def hide(self):
+        """
+        Unpack frame object, its widgets are kept
+        :return: Nothing
+        """
+        self._frame.pack_forget()
+
+
+class ViewManager:
+    """Switches between screens that are built once, by packing and unpacking their frames"""
+
+    def __init__(self):
+        self._views = {}
+        self._current = None
+        self._switch_latencies = deque(maxlen=1000)
+
+    def add_view(self, name, frames: list, on_show=None):
+        """
+        Register a screen.
+        :param name: Name of the screen
+        :param frames: UIFrameItem objects making up the screen, packed in this order
+        :param on_show: Optional function called every time the screen is shown
+        :return: Nothing
+        """
+        self._views[name] = (frames, on_show)
+
+    def show(self, name):
+        """
+        Hide the frames of the current screen and show those of another one.
+        :param name: Name of the screen
+        :return: Nothing
+        """
+        t_start = time.perf_counter()
+        frames, on_show = self._views[name]
+        if name != self._current:
+            if self._current is not None:
+                for frame in self._views[self._current][0]:
+                    frame.hide()
+            for frame in frames:
+                frame.show()
+            self._current = name
+        if on_show is not None:
+            on_show()
+        self._switch_latencies.append(time.perf_counter() - t_start)
+
+    def get_current(self):
+        """
+        :return: Name of the screen shown
+        """
+        return self._current
+
+    def get_switch_latencies(self) -> list:
+        """
+        :return: Durations in seconds of the most recent screen switches
+        """
+        return list(self._switch_latencies)
+
 
 class UIButtonItem:
 
@@ -173,7 +190,7 @@ class UIButtonItem:
         """
         return tk.Button(self._tk_master,
                          text=self._name,
-                         font=('Arial', 16),
+                         font='kasse_food',
                          width=100,
                          height=2,
                          command=self.button_callback)
@@ -192,11 +209,54 @@ class UIButtonItem:
 
 class FoodButtonItem(UIButtonItem):
 
-    def __init__(self, name, short_name, price, _tk_root):
+    def __init__(self, name, short_name, price, _tk_root, color=None):
         super(FoodButtonItem, self).__init__(name, short_name, _tk_root)
         self._tk_master = _tk_root
         self._price = price
+        self._color = color
         self._sold = 0
+        self._button = None
+        self._stock = (None, None)
+
+    def generate_button(self) -> tk.Button:
+        self._button = super(FoodButtonItem, self).generate_button()
+        self._default_colors = (self._button.cget('bg'), self._button.cget('activebackground'))
+        if self._color:
+            self._button.config(bg=self._color, activebackground=self._color)
+        return self._button
+
+    def rebuild(self, name, price, color=None):
+        """
+        Show a new name, price and colour on the button, at the same place.
+        :param name: Name of the article
+        :param price: Price in cents
+        :param color: Background colour, the default one if None
+        :return: Nothing
+        """
+        self._name = name
+        self._price = price
+        if color != self._color:
+            self._color = color
+            bg, active_bg = (color, color) if color else self._default_colors
+            self._button.config(bg=bg, activebackground=active_bg)
+        self._button.config(text=self._text())
+
+    def set_stock(self, state, pieces_left=None):
+        """
+        Grey out a sold out article, show the pieces left of an article running low.
+        :param state: Stock state, see StockLevels.state, None if the article is not tracked
+        :param pieces_left: Pieces that can still be sold
+        :return: Nothing
+        """
+        self._stock = (state, pieces_left)
+        self._button.config(state=tk.DISABLED if state == STOCK_OUT else tk.NORMAL, text=self._text())
+
+    def _text(self):
+        state, pieces_left = self._stock
+        return '{} ({})'.format(self._name, pieces_left) if state == STOCK_LOW else self._name
+
+    def destroy(self):
+        self._button.destroy()
 
     def button_callback(self):
         if self._event_cb is not None:
@@ -227,7 +287,7 @@ class CashButtonItem(UIButtonItem):
         """
         return tk.Button(self._tk_master,
                          text=self._name,
-                         font=('Arial', 20),
+                         font='kasse_large',
                          width=100,
                          height=2,
                          command=self.button_callback)
@@ -235,30 +295,31 @@ class CashButtonItem(UIButtonItem):
 
 class CashPad:
 
-    def __init__(self, tk_root_frame: UIFrameItem, tk_value_display: tk.Label = None):
-        self._value = 0.0
+    def __init__(self, tk_root_frame: UIFrameItem, tk_value_display: tk.Label = None, change_cb=None):
+        self._value = 0  # cents
         self._tk_root_frame = tk_root_frame
         self._tk_value_display = tk_value_display
+        self._change_cb = change_cb
         self.cash_button_factory()
 
     def cash_button_factory(self):
         b_elem = []
         cash_values_cent = {
-            '1 Cent': 0.01,
-            '2 Cent': 0.02,
-            '5 Cent': 0.05,
-            '10 Cent': 0.1,
-            '20 Cent': 0.2,
-            '50 Cent': 0.5
+            '1 Cent': 1,
+            '2 Cent': 2,
+            '5 Cent': 5,
+            '10 Cent': 10,
+            '20 Cent': 20,
+            '50 Cent': 50
         }
         cash_values_euro = {
-            '1 €': 1,
-            '2 €': 2,
-            '5 €': 5,
-            '10 €': 10,
-            '20 €': 20,
-            '50 €': 50,
-            '100 €': 100
+            '1 €': 100,
+            '2 €': 200,
+            '5 €': 500,
+            '10 €': 1000,
+            '20 €': 2000,
+            '50 €': 5000,
+            '100 €': 10000
         }
 
         tk_cent_button_frame = UIFrameItem('cent buttons',
@@ -294,10 +355,12 @@ class CashPad:
         self._value += value
         if self._tk_value_display is not None:
             self._tk_value_display.config(
-                text="BAR: {cash:.02f} €".format(
-                    cash=self._value
+                text="BAR: {cash} €".format(
+                    cash=format_cents(self._value)
                 )
             )
+        if self._change_cb is not None:
+            self._change_cb(self._value)
 
     def get_value(self):
         return self._value
@@ -307,28 +370,194 @@ class CashPad:
         self.update_value(0)
 
 
+class QuantityPad:
+    """Digit pad to enter how many pieces the next article tap adds"""
+
+    def __init__(self, tk_root_frame: UIFrameItem, tk_value_display: tk.Button = None):
+        self._value = 0
+        self._tk_root_frame = tk_root_frame
+        self._tk_value_display = tk_value_display
+        self.digit_button_factory()
+
+    def digit_button_factory(self):
+        for digits in ((1, 2, 3, 4, 5), (6, 7, 8, 9, 0)):
+            tk_column_frame = UIFrameItem('digit buttons',
+                                          height=650,
+                                          width=320,
+                                          tk_root=self._tk_root_frame.get_frame())
+            tk_column_frame.get_frame().pack_propagate(False)
+            tk_column_frame.get_frame().pack(side=tk.LEFT)
+            for digit in digits:
+                obj = CashButtonItem(str(digit), digit, tk_column_frame.get_frame())
+                obj.attach_external_callback(self.update_value)
+                obj.generate_button().pack()
+
+    def update_value(self, digit):
+        self._value = min(self._value * 10 + digit, MAX_QUANTITY)
+        self.update_display()
+
+    def update_display(self):
+        if self._tk_value_display is not None:
+            text = 'Menge' if self._value < 2 else '{}×'.format(self._value)
+            self._tk_value_display.config(text=text)
+
+    def get_value(self):
+        """
+        :return: Entered quantity, at least 1
+        """
+        return max(self._value, 1)
+
+    def reset_value(self):
+        self._value = 0
+        self.update_display()
+
+
+class ReceiptDisplay:
+    """
+    Receipt pane drawn on a canvas, one line per cart line with quantity and amount. A change only
+    rewrites the text of its line. Tapping '−' or '✕' on a line calls the decrement or void callback
+    with the key of the line. The taps are bound once to the tags 'decrement' and 'void', a binding
+    per line would register a Tcl command per line that lives as long as the canvas.
+    """
+    ROW_HEIGHT = 40
+
+    def __init__(self, tk_canvas: tk.Canvas, width, decrement_cb=None, void_cb=None):
+        self._canvas = tk_canvas
+        self._width = width
+        self._rows = OrderedDict()  # line key -> (tag, amount item id)
+        self._keys = {}  # tag -> line key
+        self._tag_counter = 0
+        if decrement_cb is not None:
+            tk_canvas.tag_bind('decrement', '<Button-1>', lambda _: self._tapped(decrement_cb))
+        if void_cb is not None:
+            tk_canvas.tag_bind('void', '<Button-1>', lambda _: self._tapped(void_cb))
+
+    def _tapped(self, callback):
+        for tag in self._canvas.gettags('current'):
+            if tag in self._keys:
+                callback(self._keys[tag])
+                return
+
+    def show_line(self, line: CartLine):
+        """
+        Draw a cart line, or remove it if its quantity dropped to 0.
+        :param line: Changed cart line
+        :return: Nothing
+        """
+        if line.quantity == 0:
+            self.remove_line(line.key)
+            return
+
+        row = self._rows.get(line.key)
+        if row is None:
+            row = self._create_row(line)
+        self._canvas.itemconfig(row[1], text="{qty} × {price}€ = {amount}€".format(
+            qty=line.quantity,
+            price=format_cents(line.price_cents),
+            amount=format_cents(line.amount_cents)
+        ))
+
+    def _create_row(self, line: CartLine):
+        self._tag_counter += 1
+        tag = 'line{}'.format(self._tag_counter)
+        y = len(self._rows) * self.ROW_HEIGHT + self.ROW_HEIGHT // 2
+        self._canvas.create_text(18, y, text='✕', font='kasse_large', tags=(tag, 'void'))
+        self._canvas.create_text(50, y, text='−', font='kasse_large', tags=(tag, 'decrement'))
+        self._canvas.create_text(75, y, anchor=tk.W, text=line.name, font='kasse_display', tags=(tag,))
+        amount_id = self._canvas.create_text(self._width - 10, y, anchor=tk.E, font='kasse_display', tags=(tag,))
+
+        row = (tag, amount_id)
+        self._rows[line.key] = row
+        self._keys[tag] = line.key
+        self._update_scrollregion()
+        self._canvas.yview_moveto(1.0)
+        return row
+
+    def remove_line(self, key):
+        """
+        Delete the items of a line and move the lines below it up.
+        :param key: Key of the cart line
+        :return: Nothing
+        """
+        self._canvas.delete(self._rows[key][0])
+        del self._keys[self._rows[key][0]]
+        below = False
+        for other_key, (other_tag, _) in self._rows.items():
+            if below:
+                self._canvas.move(other_tag, 0, -self.ROW_HEIGHT)
+            elif other_key == key:
+                below = True
+        del self._rows[key]
+        self._update_scrollregion()
+
+    def _update_scrollregion(self):
+        self._canvas.configure(scrollregion=(0, 0, self._width, len(self._rows) * self.ROW_HEIGHT))
+
+    def clear(self):
+        """
+        Remove all lines
+        :return: Nothing
+        """
+        self._canvas.delete('all')
+        self._rows.clear()
+        self._keys.clear()
+        self._update_scrollregion()
+        self._canvas.yview_moveto(0)
+
+
 class TouchRegisterUI:
     """Main class for tkinter UI"""
 
-    def __init__(self):
-        self.display_elements = []
+    def __init__(self, tk_root, db_name='touchReg.db', replicate_url=None, instrumentation: Instrumentation = None,
+                 journal_file=None, catalog_file=None, backup_dir=None, backup_interval=BACKUP_INTERVAL,
+                 customer_display=False, printer=None, kitchen_printer=None, kitchen_categories=None,
+                 event_dir=None, event_template='touchReg.db'):
+        """
+        :param event_dir: Directory of the event dbs, see event_db.py; the register rotates to the db of
+                          the new event day when the day changes, db_name is the db of the current one
+        :param event_template: Register db a new event db gets its articles from
+        :param printer: Target of the receipt printer, see printing.open_printer; no receipts if None
+        :param kitchen_printer: Target of the kitchen printer, every sale prints a kitchen ticket
+        :param kitchen_categories: Categories printed on the kitchen ticket, all articles if None
+        """
+        self._tk_root = tk_root
+        self._db_name = db_name
         self.button_shortnames = []
-        self.tr_counter = Counter()
         self.total_cash = 0.0
         self.current_cash = 0.0
-        self.current_sum = 0.0
-        self.current_custom_sum = 0.0
-        self.db_interface = DBAccess('touchReg.db')
-        self.transaction_done = False
-        self.cash_pad = None
-
-        self.db_elements = self.db_interface.db_get('food_list')
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            # before any widget binds a callback, so the buttons call the measured methods
+            instrumentation.wrap_methods(self, INSTRUMENTED_UI_METHODS, 'ui')
+        self._replicate_url = replicate_url
+        self._catalog_file = catalog_file
+        self._backup_dir = backup_dir
+        self._backup_interval = backup_interval
+        self._event_dir = event_dir
+        self._event_template = event_template
+        self.engine = None
+        self.backup = None
+        self.open_engine(db_name, journal_file or db_name + CART_JOURNAL_SUFFIX)
+        self.customer_display = CustomerDisplay() if customer_display else None
+        self.receipt_spool = None
+        self.kitchen_spool = None
+        if printer is not None:
+            self.receipt_spool = PrintSpool(open_printer(printer), name='ReceiptSpool')
+            self.receipt_spool.start()
+        if kitchen_printer is not None:
+            self.kitchen_spool = PrintSpool(open_printer(kitchen_printer), name='KitchenSpool')
+            self.kitchen_spool.start()
+        self._kitchen_categories = kitchen_categories
+        self._print_receipt = False
+
+        self.db_elements = self.db_interface.get_catalog()
+        create_named_fonts(self._tk_root)
 
         """Main frame"""
         self.tk_main_frame = UIFrameItem('main_frame',
                                          width=1280,
                                          height=800,
-                                         tk_root=tk_root_base)
+                                         tk_root=self._tk_root)
         self.tk_main_frame.get_frame().pack()
 
         """Display"""
@@ -352,21 +581,17 @@ class TouchRegisterUI:
         self._display_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self._display_scrollbar.config(command=self._display_canvas.yview)
 
-        self._display_inner_frame = tk.Frame(self._display_canvas)
-        self._display_canvas.create_window((0, 0), window=self._display_inner_frame, anchor=tk.NW)
-        self._display_inner_frame.bind(
-            '<Configure>',
-            lambda _: self._display_canvas.configure(
-                scrollregion=self._display_canvas.bbox('all')
-            )
-        )
+        self.receipt = ReceiptDisplay(self._display_canvas,
+                                      width=640 - 34,
+                                      decrement_cb=self.decrement_line,
+                                      void_cb=self.void_line)
 
         self.tk_display_sum = tk.Label(self.tk_display_frame.get_frame(),
                                        text='SUMME',
                                        justify=tk.LEFT,
                                        anchor=tk.W,
                                        width=640,
-                                       font=('Arial', 20),
+                                       font='kasse_large',
                                        pady=10,
                                        padx=10
                                        )
@@ -378,7 +603,7 @@ class TouchRegisterUI:
                                         justify=tk.LEFT,
                                         anchor=tk.W,
                                         width=640,
-                                        font=('Arial', 20),
+                                        font='kasse_large',
                                         pady=10,
                                         padx=10
                                         )
@@ -398,7 +623,6 @@ class TouchRegisterUI:
                                          tk_root=self.tk_food_function_frame)
         self.tk_food_frame.get_frame().pack_propagate(False)
         self.tk_food_frame.get_frame().pack()
-        self.food_buttons = self.food_button_factory()
 
         """Frame für Funktionstasten"""
         self.tk_function_frame = UIFrameItem('function_buttons',
@@ -408,112 +632,506 @@ class TouchRegisterUI:
                                              tk_root=self.tk_food_function_frame)
         self.tk_function_frame.get_frame().pack_propagate(False)
         self.tk_function_frame.get_frame().pack()
-        self.food_function_element_factory()
 
-        """prepare db access function for transfer list"""
-        tr_list_items = self.db_interface.db_get('food_list', value='name_short')
-        self.db_interface.set_tr_list_items(tr_list_items)
+        """Screens, built once and switched by the view manager"""
+        self.views = ViewManager()
+
+        food_view = self.view_frame_factory('food_view', self.tk_food_frame, height=650)
+        food_function_view = self.view_frame_factory('food_function_view', self.tk_function_frame, height=150)
+        self.food_buttons = self.food_button_factory(food_view)
+        self.food_function_element_factory(food_function_view)
+        self.views.add_view('food', [food_view, food_function_view])
+
+        cash_view = self.view_frame_factory('cash_view', self.tk_food_frame, height=650)
+        cash_function_view = self.view_frame_factory('cash_function_view', self.tk_function_frame, height=150)
+        self.cash_pad = CashPad(cash_view, self.tk_display_cash, change_cb=self.cash_changed)
+        self.got_cash_function_element_factory(cash_function_view)
+        self.views.add_view('cash', [cash_view, cash_function_view], on_show=self.cash_pad.reset_value)
+
+        custom_view = self.view_frame_factory('custom_view', self.tk_food_frame, height=650)
+        custom_function_view = self.view_frame_factory('custom_function_view', self.tk_function_frame, height=150)
+        self.custom_pad = CashPad(custom_view, self.tk_display_cash)
+        self.custom_price_function_element_factory(custom_function_view)
+        self.views.add_view('custom', [custom_view, custom_function_view], on_show=self.custom_pad.reset_value)
+
+        quantity_view = self.view_frame_factory('quantity_view', self.tk_food_frame, height=650)
+        quantity_function_view = self.view_frame_factory('quantity_function_view', self.tk_function_frame, height=150)
+        self.quantity_pad = QuantityPad(quantity_view, self.quantity_button)
+        self.quantity_function_element_factory(quantity_function_view)
+        self.views.add_view('quantity', [quantity_view, quantity_function_view])
+
+        summary_view = self.view_frame_factory('summary_view', self.tk_food_frame, height=650)
+        summary_function_view = self.view_frame_factory('summary_function_view', self.tk_function_frame, height=150)
+        self.summary_element_factory(summary_view)
+        self.summary_function_element_factory(summary_function_view)
+        self.views.add_view('summary', [summary_view, summary_function_view], on_show=self.update_summary)
+
+        if analytics.np is not None:
+            analytics_view = self.view_frame_factory('analytics_view', self.tk_food_frame, height=650)
+            analytics_function_view = self.view_frame_factory('analytics_function_view', self.tk_function_frame,
+                                                              height=150)
+            self.analytics_element_factory(analytics_view)
+            self.analytics_function_element_factory(analytics_function_view)
+            self.views.add_view('analytics', [analytics_view, analytics_function_view], on_show=self.update_analytics)
+
+        if instrumentation is not None:
+            instrumentation.wrap_methods(self.views, ('show',), 'view')
+            diagnostics_view = self.view_frame_factory('diagnostics_view', self.tk_food_frame, height=650)
+            diagnostics_function_view = self.view_frame_factory('diagnostics_function_view', self.tk_function_frame,
+                                                                height=150)
+            self.diagnostics_element_factory(diagnostics_view)
+            self.diagnostics_function_element_factory(diagnostics_function_view)
+            self.views.add_view('diagnostics', [diagnostics_view, diagnostics_function_view],
+                                on_show=self.update_diagnostics)
+            # hidden entry: tap the sum display three times
+            self.tk_display_sum.bind('<Triple-Button-1>', lambda event: self.views.show('diagnostics'))
+            self._heartbeat_due = time.perf_counter() + DIAG_HEARTBEAT_MS / 1000.0
+            self._tk_root.after(DIAG_HEARTBEAT_MS, self.loop_lag_heartbeat)
+            self._tk_root.after(DIAG_LOG_INTERVAL_MS, self.dump_instrumentation)
+            self.resource_sampler = ResourceSampler(self._tk_root, instrumentation)
+            self._tk_root.after(RESOURCE_SAMPLE_INTERVAL * 1000, self.sample_resources)
+
+        """Keyboard, keypad and barcode scanner entry"""
+        self.catalog_index = CatalogIndex(self.db_elements)
+        self._entry_text = ''
+        self._tk_root.bind('<Key>', self.quick_entry_key)
+
+        self.views.show('food')
+        self.restore_cart()
+        self.poll_writer()
+        if event_dir is not None:
+            self._tk_root.after(EVENT_CHECK_MS, self.check_event_day)
+
+    def open_engine(self, db_name, journal_file):
+        """
+        Open the register engine of a db, with its backup if there is a backup dir.
+        :param db_name: Path of the register db
+        :param journal_file: Path of the cart journal
+        :return: Nothing
+        """
+        self._db_name = db_name
+        self.engine = RegisterEngine(db_name, background_writes=True, replicate_url=self._replicate_url,
+                                     instrumentation=self.instrumentation, journal_file=journal_file,
+                                     watch_catalog=True, catalog_file=self._catalog_file)
+        self.engine.catalog_listener = self.catalog_changed
+        self.engine.stock_listener = self.update_stock_buttons
+        self.db_interface = self.engine.db_interface
+        if self._backup_dir is not None:
+            self.backup = BackupThread(db_name, self._backup_dir, interval=self._backup_interval)
+            self.backup.start()
+
+    def check_event_day(self):
+        """
+        Rotate to the db of the new event day once the day has changed. An order being rung up is
+        finished in the db of its day, the rotation is tried again shortly after.
+        :return: Nothing
+        """
+        delay = EVENT_CHECK_MS
+        if event_db_name(self._event_dir) != self._db_name:
+            order_open = self.engine.cart.get_lines() and not self.engine.transaction_done
+            if self.views.get_current() == 'food' and not order_open:
+                self.rotate_db(open_event_db(self._event_dir, self._event_template))
+            else:
+                delay = EVENT_RETRY_MS
+        self._tk_root.after(delay, self.check_event_day)
 
-    def food_button_factory(self):
-        b_elem = []
+    def rotate_db(self, db_name):
+        """
+        Write all queued sales to the current db, close it and continue with another one.
+        :param db_name: Path of the db to continue with
+        :return: Nothing
+        """
+        if self.engine.transaction_done:
+            self.reset_transaction()
+        if self.backup is not None:
+            self.backup.stop()
+        self.engine.close()  # drains the writer, the callbacks of the written sales run here
+        self.open_engine(db_name, db_name + CART_JOURNAL_SUFFIX)
+        self.db_elements = self.db_interface.get_catalog()
+        self.catalog_changed({'changed': list(self.db_elements.values()), 'added': [], 'removed': []})
+        self.update_stock_buttons()
+        self.update_sum()
+        self.tk_display_cash.config(text='Neuer Veranstaltungstag: {}'.format(os.path.basename(db_name)))
 
-        col1_frame = tk.Frame(self.tk_food_frame.get_frame(), width=320, height=650)
-        col1_frame.pack_propagate(False)
-        col1_frame.pack(side=tk.LEFT)
-
-        col2_frame = tk.Frame(self.tk_food_frame.get_frame(), width=320, height=650)
-        col2_frame.pack_propagate(False)
-        col2_frame.pack(side=tk.LEFT)
-
-        col1_count = 0
-        for element in self.db_elements:
-            """db entry: id|name|shortname|price|sold """
-            name = element[1]
-            short_name = element[2]
-            price = element[3]
-            if name != '':
-                parent = col1_frame if col1_count < 10 else col2_frame
-                obj = FoodButtonItem(name, short_name, price, parent)
-                obj.attach_external_callback(self.display_element_factory)
-                obj.generate_button().pack()
-                b_elem.append(short_name)
-                col1_count += 1
+    @staticmethod
+    def view_frame_factory(name, parent: UIFrameItem, height) -> UIFrameItem:
+        """
+        Create the frame of one screen inside the food or function area.
+        :param name: Name of the frame
+        :param parent: Area the screen is shown in
+        :param height: Height of the area
+        :return: Frame object, not packed yet
+        """
+        view = UIFrameItem(name, width=640, height=height, tk_root=parent.get_frame())
+        view.get_frame().pack_propagate(False)
+        return view
 
-        return b_elem
+    def food_button_factory(self, view: UIFrameItem):
+        """
+        Build the tab bar and the empty page area of the food screen. The buttons of a page are
+        built on its first visit, see show_food_page.
+        :param view: Frame of the food screen
+        :return: Short names of the articles with a button
+        """
+        self._food_tab_bar = tk.Frame(view.get_frame(), width=640, height=FOOD_TAB_HEIGHT)
+        self._food_tab_bar.pack_propagate(False)
+        self._food_tab_bar.pack(side=tk.TOP)
+        self._food_page_area = tk.Frame(view.get_frame(), width=640, height=650 - FOOD_TAB_HEIGHT)
+        self._food_page_area.pack_propagate(False)
+        self._food_page_area.pack(side=tk.TOP)
+
+        self._food_layout = food_pages(self.db_elements)
+        self._food_pages = {}  # (category, page) -> tk.Frame, built on first visit
+        self._food_page = None
+        self._food_tabs = OrderedDict()  # category -> tk.Button
+        self._food_page_button = None
+        self._food_button_items = OrderedDict()
+        self._stock_shown = {}  # short name -> (state, pieces left) shown on the built button
+        self.food_tab_factory()
+        self.show_food_page(next(iter(self._food_layout), None))
+        return [item.name_short for page in self._food_layout.values() for _, _, item in page]
+
+    def food_tab_factory(self):
+        """
+        Build one tab per category and the page button, shown for categories with several pages.
+        :return: Nothing
+        """
+        for tab in self._food_tabs.values():
+            tab.destroy()
+        if self._food_page_button is not None:
+            self._food_page_button.destroy()
+        self._food_page_button = tk.Button(self._food_tab_bar, font='kasse_food', width=5,
+                                           command=self.next_food_page)
+        self._food_tabs = OrderedDict()
+        for category, _ in self._food_layout:
+            if category not in self._food_tabs:
+                tab = tk.Button(self._food_tab_bar, text=category, font='kasse_food',
+                                command=lambda c=category: self.show_food_page((c, 0)))
+                tab.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+                self._food_tabs[category] = tab
+
+    def food_page_factory(self, key) -> tk.Frame:
+        """
+        Build the buttons of one page.
+        :param key: (category, page number)
+        :return: Frame of the page, not packed yet
+        """
+        cell_width = 640 // FOOD_GRID_COLUMNS
+        cell_height = (650 - FOOD_TAB_HEIGHT) // FOOD_GRID_ROWS
+        page = tk.Frame(self._food_page_area, width=640, height=650 - FOOD_TAB_HEIGHT)
+        page.grid_propagate(False)
+        for row in range(FOOD_GRID_ROWS):
+            page.grid_rowconfigure(row, minsize=cell_height)
+        for column in range(FOOD_GRID_COLUMNS):
+            page.grid_columnconfigure(column, minsize=cell_width)
+        for row, column, element in self._food_layout[key]:
+            cell = tk.Frame(page, width=cell_width, height=cell_height)
+            cell.pack_propagate(False)
+            cell.grid(row=row, column=column)
+            obj = FoodButtonItem(element.name, element.name_short, to_cents(element.price), cell, color=element.color)
+            obj.attach_external_callback(self.display_element_factory)
+            obj.generate_button().pack(fill=tk.BOTH, expand=True)
+            obj.page = key
+            self._food_button_items[element.name_short] = obj
+            self._stock_shown.pop(element.name_short, None)
+        self.update_stock_buttons([element.name_short for _, _, element in self._food_layout[key]])
+        return page
+
+    def show_food_page(self, key):
+        """
+        Show a page of the food screen, building it on its first visit.
+        :param key: (category, page number), the first page if there is no such page
+        :return: Nothing
+        """
+        if key not in self._food_layout:
+            key = next(iter(self._food_layout), None)
+            if key is None:
+                return
+        page = self._food_pages.get(key)
+        if page is None:
+            page = self._food_pages[key] = self.food_page_factory(key)
+        if self._food_page != key:
+            if self._food_page in self._food_pages:
+                self._food_pages[self._food_page].pack_forget()
+            page.pack()
+            self._food_page = key
+        category, number = key
+        for tab_category, tab in self._food_tabs.items():
+            tab.config(relief=tk.SUNKEN if tab_category == category else tk.RAISED)
+        pages = page_count(self._food_layout, category)
+        if pages > 1:
+            self._food_page_button.config(text='{}/{} ▶'.format(number + 1, pages))
+            self._food_page_button.pack(side=tk.RIGHT, fill=tk.Y)
+        else:
+            self._food_page_button.pack_forget()
 
-    def display_element_factory(self, name, short_name, price):
-        if self.transaction_done is True:
+    def next_food_page(self):
+        category, number = self._food_page
+        self.show_food_page((category, (number + 1) % page_count(self._food_layout, category)))
+
+    def drop_food_page(self, key):
+        """
+        Destroy a built page and its buttons, it is built again on its next visit.
+        :param key: (category, page number)
+        :return: Nothing
+        """
+        page = self._food_pages.pop(key)
+        for short_name in [name for name, obj in self._food_button_items.items() if obj.page == key]:
+            del self._food_button_items[short_name]
+            self._stock_shown.pop(short_name, None)
+        page.destroy()
+        if self._food_page == key:
+            self._food_page = None
+
+    def catalog_changed(self, changes: dict):
+        """
+        Update the food screen to articles changed in the db or catalog file: built pages whose
+        buttons keep their places only rebuild the buttons of changed articles, the others are
+        dropped and built again on their next visit. Open carts keep the prices their lines were
+        rung up at.
+        :param changes: Change dict of the CatalogWatcher
+        :return: Nothing
+        """
+        if 'error' in changes:
+            self.tk_display_cash.config(text='Katalogfehler: {}'.format(changes['error']))
+            return
+        old_layout = self._food_layout
+        current = self._food_page
+        self._food_layout = food_pages(self.db_elements)
+        changed = {element.name_short for element in changes['changed']}
+        for key in list(self._food_pages):
+            if placement(old_layout, key) != placement(self._food_layout, key):
+                self.drop_food_page(key)
+                continue
+            for _, _, element in self._food_layout[key]:
+                if element.name_short in changed:
+                    self._food_button_items[element.name_short].rebuild(element.name, to_cents(element.price),
+                                                                        element.color)
+        if [c for c, _ in old_layout] != [c for c, _ in self._food_layout]:
+            self.food_tab_factory()
+        self.show_food_page(current)
+        self.food_buttons = [item.name_short for page in self._food_layout.values() for _, _, item in page]
+        self.catalog_index = CatalogIndex(self.db_elements)
+
+    def update_stock_buttons(self, short_names=None):
+        """
+        Show the stock on the built food buttons, computed from memory without db access. An article
+        that runs low or sells out with this update is announced on the cash display.
+        :param short_names: Articles to update, all built buttons if None
+        :return: Nothing
+        """
+        if short_names is None:
+            short_names = list(self._food_button_items)
+        if not self.engine.stock.recipes and not self._stock_shown:
+            return
+        states = self.engine.stock_states(short_names)
+        alerts = []
+        for short_name in short_names:
+            button = self._food_button_items.get(short_name)
+            if button is None:
+                continue
+            state, pieces_left = states.get(short_name, (None, None))
+            shown = self._stock_shown.get(short_name)
+            if shown == (state, pieces_left):
+                continue
+            button.set_stock(state, pieces_left)
+            if state is None:
+                self._stock_shown.pop(short_name, None)
+                continue
+            self._stock_shown[short_name] = (state, pieces_left)
+            if shown is not None and shown[0] != state:
+                name = self.db_elements[short_name].name
+                if state == STOCK_OUT:
+                    alerts.append('{} ausverkauft'.format(name))
+                elif state == STOCK_LOW:
+                    alerts.append('Nur noch {}x {}'.format(pieces_left, name))
+        if alerts:
+            self.tk_display_cash.config(text=' | '.join(alerts))
+
+    def restore_cart(self):
+        """
+        Show the order restored from the cart journal, with the cash screen if cash was already tapped.
+        :return: Nothing
+        """
+        if self.engine.recovered_sales:
+            self.tk_display_cash.config(text='{} Verkäufe aus dem Journal gespeichert'.format(
+                self.engine.recovered_sales))
+            self.log('%d sales from the cart journal written', self.engine.recovered_sales)
+        if len(self.engine.cart) == 0:
+            return
+        for line in self.engine.cart.get_lines():
+            self.show_line(line)
+        self.update_sum()
+        cash = self.engine.cash_cents
+        if cash:
+            self.got_cash()
+            self.cash_pad.update_value(cash)
+        else:
+            self.tk_display_cash.config(text='Bestellung wiederhergestellt')
+
+    def display_element_factory(self, name, short_name, price_cents, quantity=None) -> bool:
+        """
+        Add an article or a custom amount to the order, shared by the buttons, the keyboard and the scanner.
+        More pieces than the stock has left are rejected with a message on the cash display.
+        :return: True if the order was changed
+        """
+        if self.engine.transaction_done is True:
             self.reset_transaction()
 
         #self.got_cash_button.config(state='active')
 
-        disp_obj = {
-            'tk_name': tk.Label(self._display_inner_frame,
-                                text=name,
-                                font=('Arial', 15),
-                                justify=tk.LEFT,
-                                anchor=tk.W,
-                                width=250,
-                                padx=10
-                                ),
-            'tk_price': tk.Label(self._display_inner_frame,
-                                 text="{price:.02f}€".format(price=price),
-                                 font=('Arial', 15),
-                                 justify=tk.LEFT,
-                                 anchor=tk.W,
-                                 width=250,
-                                 padx=20
-                                 ),
-            'name': name,
-            'short_name': short_name,
-            'price': price
-        }
-        disp_obj['tk_name'].pack()
-        disp_obj['tk_price'].pack()
+        if quantity is None:
+            quantity = self.quantity_pad.get_value()
+        self.quantity_pad.reset_value()
+
+        if short_name == 'EB':
+            line = self.engine.add_custom_amount(price_cents, name, quantity)
+        else:
+            try:
+                line = self.engine.add_item(short_name, quantity, price_cents)
+            except OutOfStockError as e:
+                if e.state == STOCK_OUT:
+                    self.tk_display_cash.config(text='{} ausverkauft'.format(name))
+                else:
+                    self.tk_display_cash.config(text='Nur noch {}x {}'.format(e.pieces_left, name))
+                return False
+        self.show_line(line)
+        self.update_sum()
+        self.update_stock_buttons(self.engine.stock_affected(short_name))
+        return True
 
-        self.display_elements.append(disp_obj)
-        self._display_inner_frame.update_idletasks()
-        self._display_canvas.yview_moveto(1.0)
+    def quick_entry_key(self, event):
+        """
+        Collect typed characters on the food screen and add the article on Return. While typing,
+        the matching articles are shown on the cash display.
+        :param event: Key event of the root window
+        :return: Nothing
+        """
+        if self.views.get_current() != 'food':
+            return
+        if event.keysym in ('Return', 'KP_Enter'):
+            self.quick_entry_commit()
+            return
+        if event.keysym == 'Escape':
+            self._entry_text = ''
+        elif event.keysym == 'BackSpace':
+            self._entry_text = self._entry_text[:-1]
+        elif event.char and event.char.isprintable():
+            self._entry_text += event.char
+        else:
+            return
+        self.show_quick_entry()
+
+    def show_quick_entry(self):
+        if not self._entry_text:
+            self.tk_display_cash.config(text='BAR')
+            return
+        try:
+            quantity, code = parse_entry(self._entry_text)
+        except ValueError:
+            self.tk_display_cash.config(text='> {}  Ungültige Menge'.format(self._entry_text))
+            return
+        names = [item.name for item in self.catalog_index.search(code)[:3]]
+        self.tk_display_cash.config(text='> {}  {}'.format(self._entry_text, ' | '.join(names) or '?'))
+
+    def quick_entry_commit(self):
+        """
+        Add the article of the typed entry, see CatalogIndex.resolve.
+        :return: True if an article was added
+        """
+        text = self._entry_text
+        self._entry_text = ''
+        if not text:
+            return False
+        try:
+            item, quantity = self.catalog_index.resolve(text)
+        except ValueError:
+            self.tk_display_cash.config(text='Ungültige Menge: {}'.format(text))
+            return False
+        if item is None:
+            self.tk_display_cash.config(text='Unbekannt: {}'.format(text))
+            return False
+        if not self.display_element_factory(item.name, item.name_short, to_cents(item.price), quantity):
+            return False
+        self.tk_display_cash.config(text='BAR')
+        return True
+
+    def decrement_line(self, key):
+        if self.engine.transaction_done is True:
+            return
+        self.show_line(self.engine.decrement(key))
+        self.update_sum()
+        self.update_stock_buttons(self.engine.stock_affected(key[0]))
 
-        self.tr_counter = self.update_sum()
+    def void_line(self, key):
+        if self.engine.transaction_done is True:
+            return
+        self.show_line(self.engine.void(key))
+        self.update_sum()
+        self.update_stock_buttons(self.engine.stock_affected(key[0]))
 
-    def food_function_element_factory(self):
-        got_cash_button_frame = tk.Frame(self.tk_function_frame.get_frame(),
-                                         width=160,
+    def show_line(self, line: CartLine):
+        """
+        Show a changed cart line on the receipt and on the customer display.
+        :param line: Changed line, removed if its quantity is 0
+        :return: Nothing
+        """
+        self.receipt.show_line(line)
+        if self.customer_display is not None:
+            self.customer_display.show_line(line)
+
+    def cash_changed(self, cash_cents):
+        self.engine.set_cash(cash_cents)
+        if self.customer_display is not None:
+            self.customer_display.show_cash(cash_cents)
+
+    def food_function_element_factory(self, view: UIFrameItem):
+        got_cash_button_frame = tk.Frame(view.get_frame(),
+                                         width=128,
                                          height=150)
         self.got_cash_button = tk.Button(got_cash_button_frame,
                                          text='Gegeben',
-                                         font=('Arial', 20),
+                                         font='kasse_large',
                                          width=100,
                                          height=100,
                                          command=self.got_cash)
 
-        cancel_button_frame = tk.Frame(self.tk_function_frame.get_frame(),
-                                       width=160,
+        cancel_button_frame = tk.Frame(view.get_frame(),
+                                       width=128,
                                        height=150)
         cancel_button = tk.Button(cancel_button_frame,
                                   text='Abbrechen',
-                                  font=('Arial', 20),
+                                  font='kasse_large',
                                   width=100,
                                   height=100,
                                   command=lambda: self.end_transaction('cancel'))
 
-        custom_price_button_frame = tk.Frame(self.tk_function_frame.get_frame(),
-                                             width=160,
+        custom_price_button_frame = tk.Frame(view.get_frame(),
+                                             width=128,
                                              height=150)
         self.custom_price_button = tk.Button(custom_price_button_frame,
                                              text='Betrag',
-                                             font=('Arial', 20),
+                                             font='kasse_large',
                                              width=100,
                                              height=100,
                                              command=self.custom_price)
 
-        summary_button_frame = tk.Frame(self.tk_function_frame.get_frame(),
-                                        width=160,
+        quantity_button_frame = tk.Frame(view.get_frame(),
+                                         width=128,
+                                         height=150)
+        self.quantity_button = tk.Button(quantity_button_frame,
+                                         text='Menge',
+                                         font='kasse_large',
+                                         width=100,
+                                         height=100,
+                                         command=self.quantity)
+
+        summary_button_frame = tk.Frame(view.get_frame(),
+                                        width=128,
                                         height=150)
         summary_button = tk.Button(summary_button_frame,
                                    text='Übersicht',
-                                   font=('Arial', 20),
+                                   font='kasse_large',
                                    width=100,
                                    height=100,
                                    command=self.show_summary)
@@ -524,40 +1142,44 @@ class TouchRegisterUI:
         cancel_button_frame.pack(side=tk.LEFT)
         custom_price_button_frame.pack_propagate(False)
         custom_price_button_frame.pack(side=tk.LEFT)
+        quantity_button_frame.pack_propagate(False)
+        quantity_button_frame.pack(side=tk.LEFT)
         summary_button_frame.pack_propagate(False)
         summary_button_frame.pack(side=tk.LEFT)
         self.got_cash_button.pack()
         self.custom_price_button.pack()
         cancel_button.pack()
+        self.quantity_button.pack()
         summary_button.pack()
 
-    def got_cash_function_element_factory(self):
-        got_cash_ok_button_frame = tk.Frame(self.tk_function_frame.get_frame(),
-                                            width=215,
+    def got_cash_function_element_factory(self, view: UIFrameItem):
+        widths = (160, 160, 160) if self.receipt_spool is not None else (215, 215, 210)
+        got_cash_ok_button_frame = tk.Frame(view.get_frame(),
+                                            width=widths[0],
                                             height=150)
         got_cash_ok_button = tk.Button(got_cash_ok_button_frame,
                                        text='Ok',
-                                       font=('Arial', 20),
+                                       font='kasse_large',
                                        width=100,
                                        height=100,
                                        command=lambda: self.end_transaction('ok'))
 
-        got_cash_reset_button_frame = tk.Frame(self.tk_function_frame.get_frame(),
-                                               width=215,
+        got_cash_reset_button_frame = tk.Frame(view.get_frame(),
+                                               width=widths[1],
                                                height=150)
         got_cash_reset_button = tk.Button(got_cash_reset_button_frame,
                                           text='Löschen',
-                                          font=('Arial', 20),
+                                          font='kasse_large',
                                           width=100,
                                           height=100,
                                           command=self.cash_pad.reset_value)
 
-        got_cash_cancel_button_frame = tk.Frame(self.tk_function_frame.get_frame(),
-                                                width=210,
+        got_cash_cancel_button_frame = tk.Frame(view.get_frame(),
+                                                width=widths[2],
                                                 height=150)
         got_cash_cancel_button = tk.Button(got_cash_cancel_button_frame,
                                            text='Abbrechen',
-                                           font=('Arial', 20),
+                                           font='kasse_large',
                                            width=100,
                                            height=100,
                                            command=lambda: self.end_transaction('cancel'))
@@ -572,34 +1194,56 @@ class TouchRegisterUI:
         got_cash_reset_button.pack()
         got_cash_cancel_button.pack()
 
-    def custom_price_function_element_factory(self):
-        custom_price_ok_button_frame = tk.Frame(self.tk_function_frame.get_frame(),
+        if self.receipt_spool is not None:
+            receipt_button_frame = tk.Frame(view.get_frame(), width=160, height=150)
+            self.receipt_button = tk.Button(receipt_button_frame,
+                                            text='Bon',
+                                            font='kasse_large',
+                                            width=100,
+                                            height=100,
+                                            command=self.toggle_receipt)
+            receipt_button_frame.pack_propagate(False)
+            receipt_button_frame.pack(side=tk.LEFT)
+            self.receipt_button.pack()
+
+    def toggle_receipt(self, on=None):
+        """
+        Switch printing a receipt for the sale being paid on or off.
+        :param on: New setting, the opposite of the current one if None
+        :return: Nothing
+        """
+        self._print_receipt = not self._print_receipt if on is None else on
+        if self.receipt_spool is not None:
+            self.receipt_button.config(relief=tk.SUNKEN if self._print_receipt else tk.RAISED)
+
+    def custom_price_function_element_factory(self, view: UIFrameItem):
+        custom_price_ok_button_frame = tk.Frame(view.get_frame(),
                                                 width=215,
                                                 height=150)
         custom_price_ok_button = tk.Button(custom_price_ok_button_frame,
                                            text='Ok',
-                                           font=('Arial', 20),
+                                           font='kasse_large',
                                            width=100,
                                            height=100,
                                            command=lambda: self.end_transaction('custom price')
                                            )
 
-        custom_price_reset_button_frame = tk.Frame(self.tk_function_frame.get_frame(),
+        custom_price_reset_button_frame = tk.Frame(view.get_frame(),
                                                    width=215,
                                                    height=150)
         custom_price_reset_button = tk.Button(custom_price_reset_button_frame,
                                               text='Löschen',
-                                              font=('Arial', 20),
+                                              font='kasse_large',
                                               width=100,
                                               height=100,
-                                              command=self.cash_pad.reset_value)
+                                              command=self.custom_pad.reset_value)
 
-        custom_price_cancel_button_frame = tk.Frame(self.tk_function_frame.get_frame(),
+        custom_price_cancel_button_frame = tk.Frame(view.get_frame(),
                                                     width=210,
                                                     height=150)
         custom_price_cancel_button = tk.Button(custom_price_cancel_button_frame,
                                                text='Abbrechen',
-                                               font=('Arial', 20),
+                                               font='kasse_large',
                                                width=100,
                                                height=100,
                                                command=lambda: self.end_transaction('cancel'))
@@ -614,200 +1258,506 @@ class TouchRegisterUI:
         custom_price_reset_button.pack()
         custom_price_cancel_button.pack()
 
+    def quantity_function_element_factory(self, view: UIFrameItem):
+        quantity_ok_button_frame = tk.Frame(view.get_frame(),
+                                            width=215,
+                                            height=150)
+        quantity_ok_button = tk.Button(quantity_ok_button_frame,
+                                       text='Ok',
+                                       font='kasse_large',
+                                       width=100,
+                                       height=100,
+                                       command=lambda: self.views.show('food'))
+
+        quantity_reset_button_frame = tk.Frame(view.get_frame(),
+                                               width=215,
+                                               height=150)
+        quantity_reset_button = tk.Button(quantity_reset_button_frame,
+                                          text='Löschen',
+                                          font='kasse_large',
+                                          width=100,
+                                          height=100,
+                                          command=self.quantity_pad.reset_value)
+
+        quantity_cancel_button_frame = tk.Frame(view.get_frame(),
+                                                width=210,
+                                                height=150)
+        quantity_cancel_button = tk.Button(quantity_cancel_button_frame,
+                                           text='Abbrechen',
+                                           font='kasse_large',
+                                           width=100,
+                                           height=100,
+                                           command=self.quantity_back)
+
+        quantity_ok_button_frame.pack_propagate(False)
+        quantity_ok_button_frame.pack(side=tk.LEFT)
+        quantity_reset_button_frame.pack_propagate(False)
+        quantity_reset_button_frame.pack(side=tk.LEFT)
+        quantity_cancel_button_frame.pack_propagate(False)
+        quantity_cancel_button_frame.pack(side=tk.LEFT)
+        quantity_ok_button.pack()
+        quantity_reset_button.pack()
+        quantity_cancel_button.pack()
+
     def clear_display_element_list(self):
-        for widget in self._display_inner_frame.winfo_children():
-            widget.destroy()
-        self.display_elements.clear()
-        self._display_canvas.yview_moveto(0)
+        self.receipt.clear()
+        if self.customer_display is not None:
+            self.customer_display.clear()
+        self.engine.cancel()
         self.update_sum()
+        self.update_stock_buttons()
 
     def got_cash(self):
-        self.tk_food_frame.clear()
-        self.tk_function_frame.clear()
-
-        self.cash_pad = CashPad(self.tk_food_frame, self.tk_display_cash)
-
-        self.got_cash_function_element_factory()
+        self.views.show('cash')
 
     def custom_price(self):
-        self.tk_food_frame.clear()
-        self.tk_function_frame.clear()
+        self.views.show('custom')
 
-        self.cash_pad = CashPad(self.tk_food_frame, self.tk_display_cash)
+    def quantity(self):
+        self.views.show('quantity')
 
-        self.custom_price_function_element_factory()
+    def quantity_back(self):
+        self.quantity_pad.reset_value()
+        self.views.show('food')
 
     def end_transaction(self, outcome):
         if outcome == 'ok':
-            try:
-                self.close_transaction()
-            except Exception:
-                self.tk_display_cash.config(text="Zu wenig erhalten")
-                raise Exception
-            else:
-                self.transaction_done = True
-            finally:
-                self.tk_food_frame.clear()
-                self.tk_function_frame.clear()
-                self.food_buttons = self.food_button_factory()  # restore food buttons
-                self.food_function_element_factory()  # restore function buttons
+            # a rejected sale stays on the cash view with the cash tapped so far, Ok can be tapped again
+            if self.close_transaction():
+                self.views.show('food')  # restore food and function buttons
 
         elif outcome == 'custom price':
-            self.display_element_factory('Eigener Betrag', 'EB', self.cash_pad.get_value())
-            self.tk_food_frame.clear()
-            self.tk_function_frame.clear()
-            self.food_buttons = self.food_button_factory()  # restore food buttons
-            self.food_function_element_factory()  # restore function buttons
+            self.display_element_factory('Eigener Betrag', 'EB', self.custom_pad.get_value())
+            self.views.show('food')
 
         elif outcome == 'cancel':
             self.reset_transaction()
 
-    def close_transaction(self):
+    def close_transaction(self) -> bool:
         """
-        Display return money and check in data in DB.
-        :return:
+        Display return money and hand the sale to the writer thread.
+        :return: True if the sale was accepted
         """
-        transaction_log_items = list()
-        item_short_names = self.db_interface.get_tr_list_items()
-        item_dict = OrderedDict([(i, 0) for i in item_short_names])
-
-        cash_back = self.cash_pad.get_value() - self.current_sum
-
-        if cash_back < 0:
-            raise Exception
+        bill = self.engine.cart.get_total_cents()
+        counts = self.engine.cart.get_counts()
+        sale = None
+        if self.kitchen_spool is not None or (self._print_receipt and self.receipt_spool is not None):
+            # the tr_id is filled in once the sale is written
+            sale = Sale(None, time.time(), [(line.name, line.short_name, line.quantity, line.price_cents)
+                                            for line in self.engine.cart.get_lines() if line.short_name != 'EB'],
+                        self.engine.cart.get_custom_cents(), bill, self.cash_pad.get_value())
+        print_receipt = self._print_receipt
+        try:
+            cash_back = self.engine.pay(self.cash_pad.get_value(),
+                                        on_done=lambda tr_id: self.checkout_written(tr_id, bill, counts, sale,
+                                                                                    print_receipt),
+                                        on_error=self.checkout_failed)
+        except InsufficientCashError:
+            self.tk_display_cash.config(text="Zu wenig erhalten")
+            return False
+        except WriterBusyError:
+            self.tk_display_cash.config(text="Speichern ausgelastet, nochmal Ok")
+            return False
 
         self.tk_display_cash.config(
-            text="ZURÜCK: {cash:.02f} €".format(
-                cash=cash_back
+            text="ZURÜCK: {cash} €".format(
+                cash=format_cents(cash_back)
             )
         )
+        if self.customer_display is not None:
+            self.customer_display.show_change(cash_back)
+        self.toggle_receipt(False)
+        return True
 
-        date = datetime.now()
+    def checkout_written(self, tr_id, bill, counts, sale: Sale = None, print_receipt=False):
+        """
+        Log the written sale and queue its bons, the printers never delay the register.
+        :param tr_id: Id of the written transaction
+        :param bill: Total in cents
+        :param counts: Pieces per short name
+        :param sale: Sale to print, None if nothing is printed
+        :param print_receipt: Print a receipt for the customer
+        :return: Nothing
+        """
+        self.log('sale %s written: %s %s', tr_id, format_cents(bill), counts)
+        if sale is None:
+            return
+        sale = sale._replace(tr_id=tr_id)
+        if print_receipt and self.receipt_spool is not None:
+            self.receipt_spool.submit(render_receipt, sale)
+        if self.kitchen_spool is not None:
+            kitchen_items = None
+            if self._kitchen_categories is not None:
+                kitchen_items = {line[1] for line in sale.lines
+                                 if line[1] in self.db_elements
+                                 and self.db_elements[line[1]].category in self._kitchen_categories}
+            self.kitchen_spool.submit(render_kitchen_ticket, sale, kitchen_items)
+
+    def checkout_failed(self, error):
+        self.tk_display_cash.config(text="Fehler beim Speichern: {}".format(error))
+        self.log('checkout failed: %r', error)
+
+    def log(self, message, *args):
+        """
+        Write a line to the instrumentation log, nothing without --instrument.
+        :param message: Format string, formatted with args only if the line is written
+        :return: Nothing
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.log(message, *args)
+
+    def poll_writer(self):
+        self.engine.process_results()
+        for spool in (self.receipt_spool, self.kitchen_spool):
+            if spool is not None:
+                for error in spool.get_errors():
+                    self.tk_display_cash.config(text=error)
+        if self.customer_display is not None:
+            self.customer_display.flush()
+        self._tk_root.after(50, self.poll_writer)
+
+    def loop_lag_heartbeat(self):
+        """
+        Record how much later than scheduled the Tk event loop ran this heartbeat.
+        :return: Nothing
+        """
+        now = time.perf_counter()
+        self.instrumentation.record('tk.loop_lag', max(0.0, now - self._heartbeat_due))
+        self._heartbeat_due = now + DIAG_HEARTBEAT_MS / 1000.0
+        self._tk_root.after(DIAG_HEARTBEAT_MS, self.loop_lag_heartbeat)
 
-        transaction_log_items.append(date.ctime())
-        transaction_log_items.append(round(self.current_sum, 2))
-        transaction_log_items.append(self.cash_pad.get_value())
+    def dump_instrumentation(self):
+        self.instrumentation.dump()
+        self._tk_root.after(DIAG_LOG_INTERVAL_MS, self.dump_instrumentation)
 
-        for short_name in self.tr_counter:
-            sold = self.tr_counter[short_name]
-            item_dict[short_name] = sold
-            sold_cumul = sold + self.db_interface.db_get('food_list', item_name=short_name, value='sold')[0][0]
-            # Update db with new sold value or custom sum for EB... not perfect but works for now
-            if short_name == 'EB':
-                total_custom_sum = self.db_interface.db_get('food_list', item_name=short_name, value='price')[0][0] + self.current_custom_sum
-                self.db_interface.db_update_custom_sum('food_list', item_short_name=short_name, custom_sum=total_custom_sum)
-            else:
-                self.db_interface.db_update_sold('food_list', item_short_name=short_name, sold=sold_cumul)
+    def sample_resources(self):
+        self.resource_sampler.sample()
+        self._tk_root.after(RESOURCE_SAMPLE_INTERVAL * 1000, self.sample_resources)
 
+    def diagnostics_element_factory(self, view: UIFrameItem):
+        """
+        Build the table of the diagnostics screen, one row per measurement.
+        :param view: Frame of the diagnostics screen
+        :return: Nothing
+        """
+        columns = ('total', 'count', 'p50', 'p95', 'p99', 'max')
+        tree = ttk.Treeview(view.get_frame(), columns=columns, style='Summary.Treeview')
+        tree.heading('#0', text='Messpunkt', anchor=tk.W)
+        tree.column('#0', width=220)
+        for column, text in zip(columns, ('Aufrufe', 'Puffer', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms')):
+            tree.heading(column, text=text, anchor=tk.E)
+            tree.column(column, width=70, anchor=tk.E)
+        tree.pack(fill=tk.BOTH, expand=True)
+        self._diagnostics_tree = tree
+
+    def diagnostics_function_element_factory(self, view: UIFrameItem):
+        function_frame = tk.Frame(view.get_frame(), width=640, height=150)
+        function_frame.pack_propagate(False)
+        function_frame.pack()
+        tk.Button(function_frame, text='Aktualisieren', font='kasse_large',
+                  command=self.update_diagnostics).pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        tk.Button(function_frame, text='Zurück', font='kasse_large',
+                  command=self.summary_back).pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+    def update_diagnostics(self):
+        """
+        Show the current statistics of all measurements and write them to the log.
+        :return: Nothing
+        """
+        tree = self._diagnostics_tree
+        for name, stats in self.instrumentation.get_stats().items():
+            if stats['count'] == 0:
+                values = (stats['total'], 0, '', '', '', '')
+            else:
+                values = (stats['total'], stats['count']) + tuple(
+                    '{:.2f}'.format(stats[key]) for key in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms'))
+            if tree.exists(name):
+                tree.item(name, values=values)
+            else:
+                tree.insert('', tk.END, iid=name, text=name, values=values)
 
-        for key in item_dict.keys():
-            transaction_log_items.append(item_dict[key])
+        # current value in the first column, growth since the first sample in the second
+        sample = self.resource_sampler.sample()
+        growth = self.resource_sampler.growth()
+        for key, value in sample.items():
+            if not isinstance(value, int):
+                continue
+            iid = 'resource.' + key
+            values = (value, '{:+d}'.format(growth.get(key, 0)), '', '', '', '')
+            if tree.exists(iid):
+                tree.item(iid, values=values)
+            else:
+                tree.insert('', tk.END, iid=iid, text=iid, values=values)
+        self.instrumentation.dump()
 
-        print(transaction_log_items)
-        self.db_interface.db_create_transaction_entry('tr_list', transaction_log_items)
+    def shutdown(self):
+        """
+        Write all pending sales, then close the window.
+        :return: Nothing
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.dump()
+        if self.backup is not None:
+            self.backup.stop()
+        if self.customer_display is not None:
+            self.customer_display.close()
+        for spool in (self.receipt_spool, self.kitchen_spool):
+            if spool is not None:
+                spool.stop(timeout=2.0)
+        self.engine.close()
+        self._tk_root.destroy()
 
     def reset_transaction(self):
-        self.tk_food_frame.clear()
-        self.tk_function_frame.clear()
-        self.food_buttons = self.food_button_factory()  # restore food buttons
-        self.food_function_element_factory()
-        if self.cash_pad is not None:
-            self.cash_pad.reset_value()
+        self.toggle_receipt(False)
+        self.views.show('food')
+        self.cash_pad.reset_value()
         self.clear_display_element_list()
         self.update_sum()
-        self.transaction_done = False
         # self.got_cash_button.config(state='disabled')
 
-    def show_summary(self):
-        if self.cash_pad is not None:
-            self.cash_pad.reset_value()
-        self.clear_display_element_list()
-        self.transaction_done = False
-
-        self.tk_food_frame.clear()
-        self.tk_function_frame.clear()
-
-        items = self.db_interface.db_get('food_list')
-        frame = self.tk_food_frame.get_frame()
-
-        col_widths = (380, 110, 120)  # Pixel-Breiten: Artikel, Verkauft, Umsatz
-        font_normal = ('Arial', 10)
-        font_bold = ('Arial', 10, 'bold')
-
-        def make_row(parent, col1, col2, col3, font, bg=None):
-            kw = {'bg': bg} if bg else {}
-            row = tk.Frame(parent, **kw)
-            row.pack(fill=tk.X, padx=10)
-            for text, w, anchor in [(col1, col_widths[0], tk.W),
-                                     (col2, col_widths[1], tk.E),
-                                     (col3, col_widths[2], tk.E)]:
-                cell = tk.Frame(row, width=w, height=25, **kw)
-                cell.pack_propagate(False)
-                cell.pack(side=tk.LEFT)
-                tk.Label(cell, text=text, font=font, anchor=anchor, **kw).pack(fill=tk.BOTH, expand=True)
-
-        # Header
-        make_row(frame, 'Artikel', 'Verkauft', 'Umsatz', font_bold, bg='lightgray')
-        tk.Frame(frame, height=1, bg='gray').pack(fill=tk.X, padx=10)
-
-        total_income = 0.0
-        total_expenses = 0.0
-
-        for item in items:
-            name = item[1]
-            price = item[3]
-            sold = item[4]
-            if name == '':
-                continue
-
-            amount = price * sold
-            if price >= 0:
-                total_income += amount
-            else:
-                total_expenses += amount
-
-            total_custom_income = self.db_interface.db_get('food_list', item_name='EB', value='price')[0][0]
-
-            make_row(frame, name, str(sold), '{:.2f}€'.format(amount), font_normal)
-
-        # Separator
-        tk.Frame(frame, height=2, bg='black').pack(fill=tk.X, padx=10, pady=5)
-
-        make_row(frame, 'Einnahmen', '', '{:.2f}€'.format(total_income), font_bold)
-        make_row(frame, 'Einnahmen (Eigenbetrag)', '', '{:.2f}€'.format(total_custom_income), font_bold)
-        make_row(frame, 'Ausgaben (Pfand)', '', '{:.2f}€'.format(total_expenses), font_bold)
-        make_row(frame, 'Gesamt', '', '{:.2f}€'.format(total_income + total_expenses + total_custom_income),
-                 font_bold, bg='lightyellow')
-
+    def summary_element_factory(self, view: UIFrameItem):
+        """
+        Build the summary table once as a single Treeview: one row per article, the totals and the
+        figures of the day with one child row per hour. update_summary changes the row values in place.
+        :param view: Frame of the summary screen
+        :return: Nothing
+        """
+        style = ttk.Style(self._tk_root)
+        style.configure('Summary.Treeview', font='kasse_small', rowheight=22)
+        style.configure('Summary.Treeview.Heading', font='kasse_small_bold')
+
+        scrollbar = ttk.Scrollbar(view.get_frame(), orient=tk.VERTICAL)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree = ttk.Treeview(view.get_frame(),
+                            columns=('sold', 'amount'),
+                            style='Summary.Treeview',
+                            yscrollcommand=scrollbar.set)
+        scrollbar.config(command=tree.yview)
+        tree.heading('#0', text='Artikel', anchor=tk.W)
+        tree.heading('sold', text='Verkauft', anchor=tk.E)
+        tree.heading('amount', text='Umsatz', anchor=tk.E)
+        tree.column('#0', width=360)
+        tree.column('sold', width=110, anchor=tk.E)
+        tree.column('amount', width=120, anchor=tk.E)
+        tree.tag_configure('total', font='kasse_small_bold')
+        tree.tag_configure('grand_total', font='kasse_small_bold', background='lightyellow')
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        for item in self.db_interface.get_catalog().values():
+            if item.name != '':
+                tree.insert('', tk.END, iid=item.name_short, text=item.name)
+        tree.insert('', tk.END, iid='income', text='Einnahmen', tags=('total',))
+        tree.insert('', tk.END, iid='custom_income', text='Einnahmen (Eigenbetrag)', tags=('total',))
+        tree.insert('', tk.END, iid='expenses', text='Ausgaben (Pfand)', tags=('total',))
+        tree.insert('', tk.END, iid='total', text='Gesamt', tags=('grand_total',))
+        tree.insert('', tk.END, iid='day', text='Heute', tags=('total',), open=True)
+        tree.insert('day', tk.END, iid='day_change', text='Rückgeld gegeben')
+        self._summary_tree = tree
+        self._summary_hours = set()
+
+    def summary_function_element_factory(self, view: UIFrameItem):
         # Zurück-Button im Funktionsbereich
-        back_frame = tk.Frame(self.tk_function_frame.get_frame(), width=640, height=150)
+        back_frame = tk.Frame(view.get_frame(), width=640, height=150)
         back_frame.pack_propagate(False)
         back_frame.pack()
-        tk.Button(back_frame, text='Zurück', font=('Arial', 20),
-                  width=100, height=100, command=self.summary_back).pack()
+        if analytics.np is not None:
+            tk.Button(back_frame, text='Analyse', font='kasse_large',
+                      command=lambda: self.views.show('analytics')).pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            tk.Button(back_frame, text='Zurück', font='kasse_large',
+                      command=self.summary_back).pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        else:
+            tk.Button(back_frame, text='Zurück', font='kasse_large',
+                      width=100, height=100, command=self.summary_back).pack()
+
+    def analytics_element_factory(self, view: UIFrameItem):
+        self._analytics_canvas = tk.Canvas(view.get_frame(), width=640, height=650, bg='white', highlightthickness=0)
+        self._analytics_canvas.pack(fill=tk.BOTH, expand=True)
+        self._analytics_result = None
+        self._analytics_thread = None
+
+    def analytics_function_element_factory(self, view: UIFrameItem):
+        function_frame = tk.Frame(view.get_frame(), width=640, height=150)
+        function_frame.pack_propagate(False)
+        function_frame.pack()
+        tk.Button(function_frame, text='Zurück', font='kasse_large',
+                  command=self.show_summary).pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+    def update_analytics(self):
+        """
+        Load the sales history in a thread of its own, a long season must not stop the register loop.
+        poll_analytics draws the result.
+        :return: Nothing
+        """
+        canvas = self._analytics_canvas
+        canvas.delete('all')
+        canvas.create_text(320, 300, text='Lade Verkäufe...', font='kasse_large')
+        if self._analytics_thread is None:
+            self._analytics_thread = threading.Thread(target=self._load_analytics, name='Analytics', daemon=True)
+            self._analytics_thread.start()
+            self._tk_root.after(ANALYTICS_POLL_MS, self.poll_analytics)
+
+    def _load_analytics(self):
+        try:
+            data = analytics.load_sales(self._db_name)
+            hour, minute = ANALYTICS_PREP_TIME
+            self._analytics_result = (data, analytics.rush_curve(data)[0], analytics.expected_by(data, hour, minute))
+        except Exception as e:
+            self._analytics_result = e
+
+    def poll_analytics(self):
+        if self._analytics_thread.is_alive():
+            self._tk_root.after(ANALYTICS_POLL_MS, self.poll_analytics)
+            return
+        self._analytics_thread = None
+        result, self._analytics_result = self._analytics_result, None
+        canvas = self._analytics_canvas
+        canvas.delete('all')
+        if isinstance(result, Exception):
+            canvas.create_text(320, 300, text='Analyse fehlgeschlagen:\n{}'.format(result), font='kasse_small',
+                               width=600)
+        elif result is not None:
+            self.draw_analytics(*result)
+
+    def draw_analytics(self, data, sales, expected):
+        """
+        Rush curve of an average day as bars per 15 minutes, below the pieces needed by the prep time.
+        :param data: analytics.SalesData
+        :param sales: Mean sales per bucket, from analytics.rush_curve
+        :param expected: Mean pieces per article by ANALYTICS_PREP_TIME, from analytics.expected_by
+        :return: Nothing
+        """
+        canvas = self._analytics_canvas
+        canvas.create_text(20, 15, anchor=tk.NW, font='kasse_small_bold',
+                           text='Verkäufe je {} Minuten, Mittel über {} Tage ({} Verkäufe)'.format(
+                               analytics.BUCKET_MINUTES, data.days, len(data)))
+        busy = analytics.np.flatnonzero(sales)
+        if len(busy) == 0:
+            canvas.create_text(320, 300, text='Noch keine Verkäufe', font='kasse_large')
+            return
+        per_hour = 60 // analytics.BUCKET_MINUTES
+        first = busy[0] // per_hour * per_hour
+        last = busy[-1] // per_hour * per_hour + per_hour
+        left, right, top, bottom = 40, 620, 45, 330
+        width = (right - left) / (last - first)
+        peak = sales.max()
+        for bucket in range(first, last):
+            x = left + (bucket - first) * width
+            height = (bottom - top) * sales[bucket] / peak
+            canvas.create_rectangle(x + 1, bottom - height, x + width - 1, bottom, fill='steelblue', outline='')
+            if bucket % per_hour == 0:
+                canvas.create_text(x, bottom + 4, anchor=tk.N, font='kasse_small',
+                                   text=analytics.bucket_label(bucket)[:2])
+        canvas.create_line(left, bottom, right, bottom)
+        canvas.create_text(left - 4, top, anchor=tk.E, font='kasse_small', text='{:.1f}'.format(peak))
+
+        hour, minute = ANALYTICS_PREP_TIME
+        canvas.create_text(20, 365, anchor=tk.NW, font='kasse_small_bold',
+                           text='Bis {:02d}:{:02d} im Mittel verkauft'.format(hour, minute))
+        ranked = [i for i in analytics.np.argsort(-expected, kind='stable') if expected[i] >= 0.05]
+        for row, i in enumerate(ranked[:20]):
+            x = 20 + row // 10 * 300
+            y = 390 + row % 10 * 24
+            canvas.create_text(x, y, anchor=tk.NW, font='kasse_small', text=data.articles[i].name[:28])
+            canvas.create_text(x + 280, y, anchor=tk.NE, font='kasse_small', text='{:.0f}'.format(expected[i]))
+
+    def update_summary(self):
+        """
+        Write the current sales figures into the summary table, rows are only added for new hours.
+        :return: Nothing
+        """
+        tree = self._summary_tree
+        summary = self.engine.summary()
+        for short_name, name, sold, amount in summary['items']:
+            if name == '':
+                continue
+            if not tree.exists(short_name):
+                tree.insert('', tree.index('income'), iid=short_name)
+            tree.item(short_name, text=name, values=(sold, format_cents(amount) + '€'))
+
+        for iid in ('income', 'custom_income', 'expenses', 'total'):
+            tree.item(iid, values=('', format_cents(summary[iid]) + '€'))
+
+        transactions, bill, cash = summary['day']
+        tree.item('day', text='Heute ({} Verkäufe)'.format(transactions), values=('', format_cents(bill) + '€'))
+        tree.item('day_change', values=('', format_cents(cash - bill) + '€'))
+
+        hours = set()
+        for hour_ts, qty, amount in summary['hours']:
+            iid = 'hour{}'.format(hour_ts)
+            hours.add(iid)
+            if iid not in self._summary_hours:
+                start = datetime.fromtimestamp(hour_ts)
+                tree.insert('day', tk.END, iid=iid, text='{:%H}:00 – {:%H}:59 Uhr'.format(start, start))
+            tree.item(iid, values=(qty, format_cents(amount) + '€'))
+        for iid in self._summary_hours - hours:
+            tree.delete(iid)
+        self._summary_hours = hours
+
+    def show_summary(self):
+        self.cash_pad.reset_value()
+        self.clear_display_element_list()
+        self.views.show('summary')
 
     def summary_back(self):
-        self.tk_food_frame.clear()
-        self.tk_function_frame.clear()
-        self.food_buttons = self.food_button_factory()
-        self.food_function_element_factory()
+        self.views.show('food')
 
     def update_sum(self):
-        cnt = Counter()
-        _sum = 0.0
-        _custom_sum = 0.0
-        for e in self.display_elements:
-            _sum = _sum + e['price']
-            cnt[e['short_name']] += 1
-            if e['short_name'] == 'EB':
-                _custom_sum = _custom_sum + e['price']
-        txt = "SUMME: {sum:.02f}€".format(sum=_sum)
+        txt = "SUMME: {sum}€".format(sum=format_cents(self.engine.cart.get_total_cents()))
         self.tk_display_sum.config(text=txt)
-        self.current_sum = _sum
-        self.current_custom_sum = _custom_sum
-        return cnt
+        if self.customer_display is not None:
+            self.customer_display.show_sum(self.engine.cart.get_total_cents())
 
 
 if __name__ == "__main__":
-    TouchRegisterUI()
-    tk_root_base.mainloop()
+    parser = argparse.ArgumentParser(description='Touch register')
+    parser.add_argument('--measure-commit', type=int, nargs='?', const=200, metavar='ROUNDS',
+                        help='measure the commit latency of the db profiles and exit')
+    parser.add_argument('--replicate', metavar='URL', help='replicate the sales to an aggregator')
+    parser.add_argument('--instrument', nargs='?', const=INSTRUMENTATION_LOG, metavar='LOG',
+                        help='measure the hot paths, triple tap on the sum shows the diagnostics')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='with --instrument: trace the python allocations, the log names the lines that grow')
+    parser.add_argument('--catalog-file', metavar='CSV', help='catalog file applied whenever it changes')
+    parser.add_argument('--event-dir', metavar='DIR',
+                        help='one db per event in DIR, new ones start with the articles of touchReg.db')
+    parser.add_argument('--event', help='name of the event, the event day if not given')
+    parser.add_argument('--backup-dir', metavar='DIR', help='back up the db to DIR while selling')
+    parser.add_argument('--backup-interval', type=int, default=BACKUP_INTERVAL, metavar='SECONDS')
+    parser.add_argument('--customer-display', action='store_true',
+                        help='show the order in a second window, run in its own process')
+    parser.add_argument('--printer', metavar='TARGET',
+                        help='receipt printer: device or file path, or tcp://host:port')
+    parser.add_argument('--kitchen-printer', metavar='TARGET', help='printer of the kitchen tickets')
+    parser.add_argument('--kitchen-category', action='append', metavar='CATEGORY',
+                        help='only articles of this category on the kitchen ticket, can be repeated')
+    args = parser.parse_args()
+
+    if args.measure_commit is not None:
+        for _profile, _stats in measure_commit_latency('touchReg.db', rounds=args.measure_commit).items():
+            print(_profile, _stats)
+        sys.exit(0)
+
+    if args.instrument and args.tracemalloc:
+        tracemalloc.start()
+    tk_root_base = tk.Tk()
+    tk_root_base.geometry('{}x{}'.format(1280, 800))
+    tk_root_base.resizable(width=False, height=False)
+    tk_root_base.wm_attributes('-fullscreen', 'true')
+
+    db_template = db_name_base = 'touchReg.db'
+    if args.event_dir:
+        db_name_base = open_event_db(args.event_dir, db_template, args.event)
+
+    ui = TouchRegisterUI(tk_root_base, db_name=db_name_base, replicate_url=args.replicate,
+                         instrumentation=Instrumentation(log_file=args.instrument) if args.instrument else None,
+                         catalog_file=args.catalog_file, backup_dir=args.backup_dir,
+                         backup_interval=args.backup_interval, customer_display=args.customer_display,
+                         printer=args.printer, kitchen_printer=args.kitchen_printer,
+                         kitchen_categories=args.kitchen_category,
+                         event_dir=args.event_dir if args.event is None else None, event_template=db_template)
+    tk_root_base.protocol('WM_DELETE_WINDOW', ui.shutdown)
+    signal.signal(signal.SIGTERM, lambda *_: ui.shutdown())
+    try:
+        tk_root_base.mainloop()
+    finally:
+        ui.engine.close()
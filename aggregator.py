@@ -0,0 +1,176 @@
+"""
+Aggregator collecting the sales of several TouchKasse terminals (see replication.py).
+
+The sales are stored per (terminal, tr_id) in their own db, a sale that is already known is ignored.
+Combined figures per article and per terminal are updated together with every new sale, so the live
+summary is only a read of a few rows.
+
+Usage:
+    python aggregator.py [--db aggregate.db] [--host 0.0.0.0] [--port 8750]
+"""
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+AGGREGATOR_PORT = 8750
+
+AGGREGATOR_SCHEMA = """
+create table if not exists agg_transactions (
+terminal text not null,
+tr_id integer not null,
+ts integer not null,
+bill_cents integer not null,
+cash_cents integer not null,
+primary key (terminal, tr_id)
+) without rowid;
+create table if not exists agg_items (
+terminal text not null,
+tr_id integer not null,
+name_short text not null,
+qty integer not null,
+unit_price_cents integer not null
+);
+create table if not exists agg_by_item (
+name_short text primary key,
+qty integer not null,
+amount_cents integer not null
+);
+create table if not exists agg_by_terminal (
+terminal text primary key,
+transactions integer not null,
+bill_cents integer not null,
+cash_cents integer not null,
+last_ts integer not null
+);
+"""
+
+
+class AggregatorStore:
+    """
+    Db of the aggregator. All methods may be called from several request threads.
+    """
+
+    def __init__(self, db_name):
+        self._db_conn = sqlite3.connect(db_name, check_same_thread=False)
+        self._db_conn.execute('PRAGMA journal_mode=WAL')
+        self._db_conn.execute('PRAGMA synchronous=NORMAL')
+        self._db_conn.executescript(AGGREGATOR_SCHEMA)
+        self._lock = threading.Lock()
+
+    def store_batch(self, terminal, transactions: list) -> int:
+        """
+        Store a batch of sales of one terminal in one db transaction, known sales are skipped.
+        :param terminal: Terminal id
+        :param transactions: List of sale dicts of the batch protocol
+        :return: Number of new sales
+        """
+        stored = 0
+        with self._lock, self._db_conn:
+            for t in transactions:
+                cursor = self._db_conn.execute('INSERT OR IGNORE INTO agg_transactions '
+                                               '(terminal, tr_id, ts, bill_cents, cash_cents) VALUES (?,?,?,?,?)',
+                                               (terminal, t['tr_id'], t['ts'], t['bill_cents'], t['cash_cents']))
+                if cursor.rowcount != 1:
+                    continue
+                stored += 1
+                items = [(short_name, int(qty), int(unit_price_cents))
+                         for short_name, qty, unit_price_cents in t['items']]
+                self._db_conn.executemany('INSERT INTO agg_items (terminal, tr_id, name_short, qty, unit_price_cents) '
+                                          'VALUES (?,?,?,?,?)', [(terminal, t['tr_id']) + i for i in items])
+                self._db_conn.executemany(
+                    'INSERT INTO agg_by_item (name_short, qty, amount_cents) VALUES (?,?,?) '
+                    'ON CONFLICT (name_short) DO UPDATE SET qty = qty + excluded.qty, '
+                    'amount_cents = amount_cents + excluded.amount_cents',
+                    [(short_name, qty, qty * unit_price_cents) for short_name, qty, unit_price_cents in items])
+                self._db_conn.execute(
+                    'INSERT INTO agg_by_terminal (terminal, transactions, bill_cents, cash_cents, last_ts) '
+                    'VALUES (?,1,?,?,?) ON CONFLICT (terminal) DO UPDATE SET transactions = transactions + 1, '
+                    'bill_cents = bill_cents + excluded.bill_cents, cash_cents = cash_cents + excluded.cash_cents, '
+                    'last_ts = max(last_ts, excluded.last_ts)',
+                    (terminal, t['bill_cents'], t['cash_cents'], t['ts']))
+        return stored
+
+    def summary(self) -> dict:
+        """
+        :return: Dict with 'items' (list of (short name, qty, amount_cents)), 'terminals' (list of
+                 (terminal, transactions, bill_cents, cash_cents, last_ts)) and 'total' in cents
+        """
+        with self._lock:
+            items = self._db_conn.execute('SELECT name_short, qty, amount_cents FROM agg_by_item '
+                                          'ORDER BY name_short').fetchall()
+            terminals = self._db_conn.execute('SELECT terminal, transactions, bill_cents, cash_cents, last_ts '
+                                              'FROM agg_by_terminal ORDER BY terminal').fetchall()
+        return {'items': items, 'terminals': terminals, 'total': sum(t[2] for t in terminals)}
+
+    def close(self):
+        with self._lock:
+            self._db_conn.close()
+
+
+class AggregatorRequestHandler(BaseHTTPRequestHandler):
+    """Handles POST /batch and GET /summary, the store is set by make_server"""
+    store = None
+
+    def do_POST(self):
+        if self.path != '/batch':
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            batch = json.loads(self.rfile.read(length).decode('utf-8'))
+            stored = self.store.store_batch(str(batch['terminal']), batch['transactions'])
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error(400, explain=repr(e))
+            return
+        self._send_json({'stored': stored})
+
+    def do_GET(self):
+        if self.path != '/summary':
+            self.send_error(404)
+            return
+        self._send_json(self.store.summary())
+
+    def _send_json(self, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(store: AggregatorStore, host='0.0.0.0', port=AGGREGATOR_PORT) -> ThreadingHTTPServer:
+    """
+    :param store: Db of the aggregator
+    :param host: Address to listen on
+    :param port: Port to listen on, 0 picks a free one
+    :return: Server, not yet started (call serve_forever)
+    """
+    handler = type('BoundAggregatorRequestHandler', (AggregatorRequestHandler,), {'store': store})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Collect the sales of several TouchKasse terminals')
+    parser.add_argument('--db', default='aggregate.db')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=AGGREGATOR_PORT)
+    args = parser.parse_args(argv)
+
+    store = AggregatorStore(args.db)
+    server = make_server(store, args.host, args.port)
+    print('aggregator listening on {}:{}'.format(*server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        store.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,318 @@
+"""
+Sales analytics for prep planning: rush hour curve, item velocity per 15 minutes, basket sizes and
+which articles are bought together.
+
+The sales are read in one read transaction, one bulk read per table straight into NumPy arrays,
+so the sales and their lines always belong together even while the register is selling. The lines of the sales
+are turned into a basket matrix (one row per sale, one column per article, the pieces as values),
+the normalized counterpart of the wide per-article columns of the old tr_list. All figures are
+computed from these arrays without a loop over the sales.
+
+NumPy is optional for the register, it is only needed here: pip install numpy
+
+Usage:
+    python analytics.py touchReg.db [--from 2026-06-01] [--to 2026-09-30] [--by 12:00] [--csv DIR]
+"""
+import os
+import sys
+import csv
+import time
+import argparse
+import itertools
+from collections import OrderedDict
+from datetime import datetime
+from db_schema import CatalogItem, CATALOG_COLUMNS
+from kasse_core import connect_read_only, format_cents
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BUCKET_MINUTES = 15
+BUCKETS_PER_DAY = 24 * 60 // BUCKET_MINUTES
+CO_OCCURRENCE_CHUNK = 65536
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError('analytics needs numpy: pip install numpy')
+
+
+def bucket_label(bucket) -> str:
+    """
+    :param bucket: Number of a 15 minute bucket of the day
+    :return: Start of the bucket, e.g. '12:15'
+    """
+    minutes = bucket * BUCKET_MINUTES
+    return '{:02d}:{:02d}'.format(minutes // 60, minutes % 60)
+
+
+def _local_seconds(ts):
+    """
+    :param ts: Array of unix times
+    :return: Array of the same times in local time, as seconds since the epoch
+    """
+    # the utc offset only changes on full hours, so it is looked up once per distinct hour
+    hours, inverse = np.unique(ts // 3600, return_inverse=True)
+    offsets = np.array([time.localtime(int(hour) * 3600).tm_gmtoff for hour in hours], dtype=np.int64)
+    return ts + offsets[inverse.reshape(-1)]
+
+
+class SalesData:
+    """
+    Column arrays of the sales of a db: per sale its time, bill, local day and 15 minute bucket;
+    per line its sale, article column and pieces. Articles are the columns of basket, in catalog
+    order, without the custom amount (EB).
+    """
+
+    def __init__(self, catalog: OrderedDict, transactions, lines):
+        """
+        :param catalog: OrderedDict of short name -> CatalogItem
+        :param transactions: int64 array of (tr_id, ts, bill_cents) rows, ordered by tr_id
+        :param lines: int64 array of (tr_id, item_id, qty) rows
+        """
+        require_numpy()
+        self.articles = [item for item in catalog.values() if item.name != '']
+        item_ids = np.array([item.id for item in self.articles], dtype=np.int64)
+        column_of = np.full(int(max([item.id for item in catalog.values()] + [0])) + 1, -1, dtype=np.int64)
+        column_of[item_ids] = np.arange(len(self.articles))
+
+        transactions = transactions.reshape(-1, 3)
+        lines = lines.reshape(-1, 3)
+        lines = lines[np.isin(lines[:, 0], transactions[:, 0])]
+        self.tr_ids = transactions[:, 0]
+        self.ts = transactions[:, 1]
+        self.bill_cents = transactions[:, 2]
+        local = _local_seconds(self.ts)
+        self.day = local // 86400
+        self.bucket = local % 86400 // (BUCKET_MINUTES * 60)
+        self.days = len(np.unique(self.day))
+
+        # lines of articles no longer in the catalog and of custom amounts have no column
+        known = lines[:, 1] < len(column_of)
+        columns = np.full(len(lines), -1, dtype=np.int64)
+        columns[known] = column_of[lines[known, 1]]
+        keep = columns >= 0
+        self.line_sale = np.searchsorted(self.tr_ids, lines[keep, 0])
+        self.line_column = columns[keep]
+        self.line_qty = lines[keep, 2]
+
+    def __len__(self):
+        return len(self.tr_ids)
+
+    def basket(self):
+        """
+        :return: int64 matrix sales x articles with the pieces of every article in every sale
+        """
+        cells = self.line_sale * len(self.articles) + self.line_column
+        matrix = np.bincount(cells, weights=self.line_qty, minlength=len(self) * len(self.articles))
+        return matrix.astype(np.int64).reshape(len(self), len(self.articles))
+
+
+def _read_rows(db_conn, cmd, params, columns):
+    """
+    :return: int64 array with one row per result row of the query
+    """
+    values = np.fromiter(itertools.chain.from_iterable(db_conn.execute(cmd, params)), dtype=np.int64)
+    return values.reshape(-1, columns)
+
+
+def load_sales(db_name, ts_from=None, ts_to=None) -> SalesData:
+    """
+    Read the sales of a db, opened read-only.
+    :param db_name: Path of the register db
+    :param ts_from: Unix time, inclusive lower bound
+    :param ts_to: Unix time, exclusive upper bound
+    :return: SalesData
+    """
+    require_numpy()
+    conditions = []
+    params = []
+    if ts_from is not None:
+        conditions.append('ts >= ?')
+        params.append(int(ts_from))
+    if ts_to is not None:
+        conditions.append('ts < ?')
+        params.append(int(ts_to))
+    where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+    db_conn = connect_read_only(db_name, timeout=5.0)
+    try:
+        # one read transaction: a sale committed meanwhile is either read with its lines or not at all
+        db_conn.execute('BEGIN')
+        rows = db_conn.execute('SELECT {} FROM food_list ORDER BY id'.format(CATALOG_COLUMNS)).fetchall()
+        catalog = OrderedDict((row[2], CatalogItem(*row)) for row in rows)
+        transactions = _read_rows(db_conn, 'SELECT tr_id, ts, bill_cents FROM transactions{} '
+                                           'ORDER BY tr_id'.format(where), params, 3)
+        cmd = 'SELECT tr_id, item_id, qty FROM transaction_items'
+        if conditions:
+            # the lines of the tr_id range, SalesData drops those of sales outside of the time range
+            first, last = (int(transactions[0, 0]), int(transactions[-1, 0])) if len(transactions) else (0, -1)
+            lines = _read_rows(db_conn, cmd + ' WHERE tr_id BETWEEN ? AND ?', (first, last), 3)
+        else:
+            lines = _read_rows(db_conn, cmd, (), 3)
+        db_conn.commit()
+    finally:
+        db_conn.close()
+    return SalesData(catalog, transactions, lines)
+
+
+def rush_curve(data: SalesData) -> tuple:
+    """
+    :param data: SalesData
+    :return: (sales, revenue_cents), float arrays with the mean per day of every 15 minute bucket
+    """
+    days = max(data.days, 1)
+    sales = np.bincount(data.bucket, minlength=BUCKETS_PER_DAY) / days
+    revenue = np.bincount(data.bucket, weights=data.bill_cents, minlength=BUCKETS_PER_DAY) / days
+    return sales, revenue
+
+
+def item_velocity(data: SalesData):
+    """
+    :param data: SalesData
+    :return: Float matrix articles x 15 minute buckets with the mean pieces sold per day
+    """
+    cells = data.line_column * BUCKETS_PER_DAY + data.bucket[data.line_sale]
+    pieces = np.bincount(cells, weights=data.line_qty, minlength=len(data.articles) * BUCKETS_PER_DAY)
+    return pieces.reshape(len(data.articles), BUCKETS_PER_DAY) / max(data.days, 1)
+
+
+def expected_by(data: SalesData, hour, minute=0):
+    """
+    Pieces of every article sold on an average day before a time of day, e.g. how many Knöchle
+    have to be ready by 12:00.
+    :param data: SalesData
+    :param hour: Hour of the time of day
+    :param minute: Minute of the time of day
+    :return: Float array, one entry per article
+    """
+    buckets = (hour * 60 + minute) // BUCKET_MINUTES
+    return item_velocity(data)[:, :buckets].sum(axis=1)
+
+
+def basket_sizes(data: SalesData):
+    """
+    :param data: SalesData
+    :return: int64 array, entry n is the number of sales with n pieces (custom amounts not counted)
+    """
+    pieces = np.bincount(data.line_sale, weights=data.line_qty, minlength=len(data)).astype(np.int64)
+    return np.bincount(pieces)
+
+
+def co_occurrence(data: SalesData):
+    """
+    :param data: SalesData
+    :return: int64 matrix articles x articles, the number of sales containing both articles; the
+             diagonal holds the number of sales containing the article
+    """
+    basket = data.basket() > 0
+    result = np.zeros((len(data.articles), len(data.articles)))
+    for start in range(0, len(basket), CO_OCCURRENCE_CHUNK):
+        # float matrix products run in BLAS, the counts stay exact far beyond any season
+        chunk = basket[start:start + CO_OCCURRENCE_CHUNK].astype(np.float64)
+        result += chunk.T @ chunk
+    return result.astype(np.int64)
+
+
+def top_pairs(data: SalesData, count=10) -> list:
+    """
+    :param data: SalesData
+    :param count: Number of pairs
+    :return: List of (short name, short name, sales with both) of the pairs bought together most often
+    """
+    matrix = co_occurrence(data)
+    first, second = np.triu_indices(len(data.articles), k=1)
+    together = matrix[first, second]
+    order = np.argsort(-together, kind='stable')[:count]
+    return [(data.articles[first[i]].name_short, data.articles[second[i]].name_short, int(together[i]))
+            for i in order if together[i] > 0]
+
+
+def report_text(data: SalesData, hour=12, minute=0) -> str:
+    """
+    :param data: SalesData
+    :param hour: Hour of the prep planning time
+    :param minute: Minute of the prep planning time
+    :return: Text report
+    """
+    lines = ['{} Verkäufe an {} Tagen'.format(len(data), data.days), '']
+    sales, revenue = rush_curve(data)
+    lines.append('Verkäufe pro Tag und Viertelstunde')
+    peak = max(sales.max(), 1e-9)
+    for bucket in np.flatnonzero(sales):
+        lines.append('{} {:7.1f} {:>9}€ {}'.format(bucket_label(bucket), sales[bucket],
+                                                    format_cents(int(round(revenue[bucket]))),
+                                                    '#' * int(round(sales[bucket] / peak * 40))))
+    lines.append('')
+    lines.append('Stück pro Tag bis {:02d}:{:02d}'.format(hour, minute))
+    ready = expected_by(data, hour, minute)
+    for item, pieces in zip(data.articles, ready):
+        lines.append('{:8} {:30} {:7.1f}'.format(item.name_short, item.name, pieces))
+    lines.append('')
+    lines.append('Stück pro Verkauf')
+    sizes = basket_sizes(data)
+    for pieces in np.flatnonzero(sizes):
+        lines.append('{:3d} {:7d}'.format(pieces, sizes[pieces]))
+    lines.append('')
+    lines.append('Zusammen gekauft')
+    for first, second, together in top_pairs(data):
+        lines.append('{:8} {:8} {:7d}'.format(first, second, together))
+    return '\n'.join(lines) + '\n'
+
+
+def write_csv(data: SalesData, directory):
+    """
+    Write rush.csv, velocity.csv, baskets.csv and pairs.csv.
+    :param data: SalesData
+    :param directory: Output directory, created if missing
+    :return: Nothing
+    """
+    os.makedirs(directory, exist_ok=True)
+    sales, revenue = rush_curve(data)
+    velocity = item_velocity(data)
+    with open(os.path.join(directory, 'rush.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['time', 'sales_per_day', 'revenue_per_day'])
+        for bucket in range(BUCKETS_PER_DAY):
+            writer.writerow([bucket_label(bucket), '{:.2f}'.format(sales[bucket]),
+                             format_cents(int(round(revenue[bucket])))])
+    with open(os.path.join(directory, 'velocity.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['time'] + [item.name_short for item in data.articles])
+        for bucket in range(BUCKETS_PER_DAY):
+            writer.writerow([bucket_label(bucket)] + ['{:.2f}'.format(v) for v in velocity[:, bucket]])
+    with open(os.path.join(directory, 'baskets.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['pieces', 'sales'])
+        writer.writerows(enumerate(basket_sizes(data).tolist()))
+    with open(os.path.join(directory, 'pairs.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow([''] + [item.name_short for item in data.articles])
+        for item, row in zip(data.articles, co_occurrence(data).tolist()):
+            writer.writerow([item.name_short] + row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sales analytics for prep planning')
+    parser.add_argument('db_file')
+    parser.add_argument('--from', dest='date_from', help='first day, YYYY-MM-DD')
+    parser.add_argument('--to', dest='date_to', help='last day, YYYY-MM-DD')
+    parser.add_argument('--by', default='12:00', help='time of day of the prep planning, HH:MM')
+    parser.add_argument('--csv', metavar='DIR', help='write the figures as CSV files to DIR')
+    args = parser.parse_args(argv)
+
+    ts_from = int(datetime.strptime(args.date_from, '%Y-%m-%d').timestamp()) if args.date_from else None
+    ts_to = int(datetime.strptime(args.date_to, '%Y-%m-%d').timestamp()) + 86400 if args.date_to else None
+    hour, minute = (int(part) for part in args.by.split(':'))
+    t_start = time.perf_counter()
+    data = load_sales(args.db_file, ts_from=ts_from, ts_to=ts_to)
+    sys.stdout.write(report_text(data, hour, minute))
+    if args.csv:
+        write_csv(data, args.csv)
+    print('{:.3f}s'.format(time.perf_counter() - t_start), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
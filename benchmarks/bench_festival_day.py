@@ -0,0 +1,233 @@
+"""
+Replays a synthetic festival day against a temporary register db and reports latencies as JSON.
+
+The day runs from 10:00 to 22:00 with a lunch and an evening rush. Orders use the articles of
+food_list with a weighted mix, some carry custom amounts (EB), some get a line voided and some
+are cancelled. The register is driven headless through RegisterEngine, the UI paths are covered by
+their engine counterparts (display_element_factory/update_sum -> tap, close_transaction -> checkout,
+show_summary -> summary).
+
+Usage:
+    python benchmarks/bench_festival_day.py [--orders 5000] [--seed 1] [--profile balanced]
+                                            [--tracemalloc] [--output result.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import resource
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_schema import init_db  # noqa: E402
+from kasse_core import RegisterEngine, DB_PROFILES, DB_DEFAULT_PROFILE, latency_stats, format_cents  # noqa: E402
+
+"""Relative popularity of the articles, articles not listed get weight 1"""
+ITEM_WEIGHTS = {
+    'KK': 8, 'LK': 6, 'LKW': 10, 'LSB': 4, 'GB': 3, 'MB': 3, 'POKR': 2, 'PORKS': 2, 'SLK': 2,
+    'B': 4, 'SB': 2, 'LS': 3, 'POTTK': 9, 'CAPP': 5, 'CAPPFUE': 3, 'TOR': 4, 'KUCH': 6
+}
+CUSTOM_AMOUNT_RATE = 0.05
+VOID_RATE = 0.05
+CANCEL_RATE = 0.03
+SUMMARY_EVERY = 250
+
+
+def day_timestamps(rng: random.Random, count, day=None) -> list:
+    """
+    :param rng: Random generator
+    :param count: Number of orders
+    :param day: Date of the festival day, today if not given
+    :return: Sorted unix timestamps between 10:00 and 22:00 with rushes at 12:30 and 18:30
+    """
+    day = day or datetime.now()
+    opening = datetime(day.year, day.month, day.day, 10).timestamp()
+    closing = opening + 12 * 3600
+    stamps = []
+    while len(stamps) < count:
+        pick = rng.random()
+        if pick < 0.35:
+            ts = rng.gauss(opening + 2.5 * 3600, 3600)
+        elif pick < 0.7:
+            ts = rng.gauss(opening + 8.5 * 3600, 1.5 * 3600)
+        else:
+            ts = rng.uniform(opening, closing)
+        if opening <= ts < closing:
+            stamps.append(int(ts))
+    stamps.sort()
+    return stamps
+
+
+def cash_for(bill_cents, rng: random.Random):
+    """
+    :return: Cash a customer hands over: exact, or the next matching note
+    """
+    if rng.random() < 0.2:
+        return bill_cents
+    for note in (500, 1000, 2000, 5000, 10000):
+        if note >= bill_cents:
+            return note
+    return (bill_cents // 10000 + 1) * 10000
+
+
+def run(orders=5000, seed=1, profile=DB_DEFAULT_PROFILE, trace_memory=False) -> dict:
+    """
+    Replay the day and collect the measurements.
+    :param orders: Number of orders
+    :param seed: Seed of the random generator
+    :param profile: Durability profile of the db
+    :param trace_memory: Also report the peak of python allocations (slows the run down)
+    :return: Result dict
+    """
+    rng = random.Random(seed)
+    if trace_memory:
+        tracemalloc.start()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_name = os.path.join(tmp_dir, 'bench.db')
+        init_db(db_name)
+        engine = RegisterEngine(db_name, profile=profile)
+
+        articles = [item.name_short for item in engine.get_catalog().values() if item.name != '']
+        weights = [ITEM_WEIGHTS.get(short_name, 1) for short_name in articles]
+
+        tap_times = []
+        checkout_times = []
+        summary_times = []
+        cancelled = 0
+
+        t_day = time.perf_counter()
+        for number, ts in enumerate(day_timestamps(rng, orders), start=1):
+            basket_size = rng.choice((1, 1, 2, 2, 2, 3, 3, 4, 5, 6))
+            for short_name in rng.choices(articles, weights, k=basket_size):
+                quantity = 1 if rng.random() < 0.9 else rng.randint(2, 5)
+                t_start = time.perf_counter()
+                engine.add_item(short_name, quantity)
+                _ = "SUMME: {}€".format(format_cents(engine.cart.get_total_cents()))
+                tap_times.append(time.perf_counter() - t_start)
+            if rng.random() < CUSTOM_AMOUNT_RATE:
+                t_start = time.perf_counter()
+                engine.add_custom_amount(rng.choice((50, 100, 150, 200, 500)))
+                tap_times.append(time.perf_counter() - t_start)
+            if rng.random() < VOID_RATE and len(engine.cart) > 1:
+                t_start = time.perf_counter()
+                engine.void(engine.cart.get_lines()[0].key)
+                tap_times.append(time.perf_counter() - t_start)
+
+            if rng.random() < CANCEL_RATE:
+                engine.cancel()
+                cancelled += 1
+            else:
+                t_start = time.perf_counter()
+                engine.pay(cash_for(engine.cart.get_total_cents(), rng), timestamp=ts)
+                checkout_times.append(time.perf_counter() - t_start)
+
+            if number % SUMMARY_EVERY == 0:
+                t_start = time.perf_counter()
+                summary = engine.summary()
+                _ = [(name, str(sold), format_cents(amount)) for _, name, sold, amount in summary['items']]
+                summary_times.append(time.perf_counter() - t_start)
+        day_seconds = time.perf_counter() - t_day
+
+        db_results = bench_db_methods(engine, rng)
+        read_pool = engine.db_interface.read_pool.get_stats() if engine.db_interface.read_pool else None
+        engine.close()
+        db_size = os.path.getsize(db_name)
+
+    result = {
+        'meta': {
+            'orders': orders,
+            'cancelled': cancelled,
+            'seed': seed,
+            'profile': profile,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+            'date': datetime.now().isoformat(timespec='seconds')
+        },
+        'tap': latency_stats(tap_times),
+        'checkout': latency_stats(checkout_times),
+        'summary': latency_stats(summary_times),
+        'db': db_results,
+        'read_pool': read_pool,
+        'throughput_orders_per_s': orders / day_seconds,
+        'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'db_size_bytes': db_size
+    }
+    if trace_memory:
+        result['tracemalloc_peak_kib'] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    return result
+
+
+def bench_db_methods(engine: RegisterEngine, rng: random.Random, rounds=200) -> dict:
+    """
+    Time the individual DBAccess methods on the db filled by the replay.
+    :return: Dict of method name -> latency stats
+    """
+    db = engine.db_interface
+    catalog = db.get_catalog()
+    articles = [item.name_short for item in catalog.values() if item.name != '']
+    transactions = db.db_get_transactions()
+    first_ts, last_ts = transactions[0][1], transactions[-1][1]
+
+    def sold_unchanged():
+        short_name = rng.choice(articles)
+        db.db_update_sold('food_list', short_name, sold=db.get_catalog_item(short_name).sold)
+
+    def reload_catalog():
+        db.invalidate_catalog()
+        db.get_catalog()
+
+    def hour_range():
+        ts_from = rng.randint(first_ts, last_ts)
+        db.db_get_transactions(ts_from=ts_from, ts_to=ts_from + 3600)
+
+    calls = {
+        'db_get': lambda: db.db_get('food_list'),
+        'db_get_item': lambda: db.db_get('food_list', item_name=rng.choice(articles), value='sold'),
+        'db_update_sold': sold_unchanged,
+        'db_update_custom_sum': lambda: db.db_update_custom_sum('food_list', 'EB', db.get_catalog_item('EB').price),
+        'get_catalog_reload': reload_catalog,
+        'db_get_transactions_hour': hour_range,
+        'db_get_transactions_item': lambda: db.db_get_transactions(item_short_name=rng.choice(articles)),
+        'db_get_transaction_items': lambda: db.db_get_transaction_items(rng.choice(transactions)[0])
+    }
+    results = {}
+    for name, call in calls.items():
+        samples = []
+        for _ in range(rounds):
+            t_start = time.perf_counter()
+            call()
+            samples.append(time.perf_counter() - t_start)
+        results[name] = latency_stats(samples)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a synthetic festival day against a temporary db')
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--profile', choices=list(DB_PROFILES.keys()), default=DB_DEFAULT_PROFILE)
+    parser.add_argument('--tracemalloc', action='store_true', help='report the peak of python allocations')
+    parser.add_argument('--output', help='write the JSON result to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    result = run(orders=args.orders, seed=args.seed, profile=args.profile, trace_memory=args.tracemalloc)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
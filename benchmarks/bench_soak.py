@@ -0,0 +1,266 @@
+"""
+Soak check: thousands of orders through one register, failing if memory or the Tk widgets grow.
+
+The orders (the article mix of bench_festival_day, with voided lines, decrements, custom amounts,
+cancelled orders and a look at the summary every SUMMARY_EVERY orders) are rung up through the
+methods the buttons of TouchRegisterUI call. After a warm-up the ResourceSampler takes a baseline
+with tracemalloc tracing, then a sample every --sample-every orders. The check fails (exit code 1)
+if the Python memory still allocated, the Python objects, the resident set size, the Tk widgets, the
+canvas items or the Tcl commands grew more than allowed from the baseline to the end.
+
+Tk needs a display, run it with xvfb-run on a machine without one. Without any display only the
+RegisterEngine is driven and the widget checks are skipped. tests/test_soak.py runs the same check.
+
+Usage:
+    python benchmarks/bench_soak.py [--orders 10000] [--warmup 1000] [--sample-every 1000] [--seed 1]
+                                    [--max-python-growth 512] [--max-object-growth 2000] [--max-rss-growth 16384]
+                                    [--driver ui|engine] [--output result.json]
+"""
+import os
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_schema import init_db, to_cents  # noqa: E402
+from kasse_core import RegisterEngine  # noqa: E402
+from instrumentation import ResourceSampler  # noqa: E402
+from bench_festival_day import ITEM_WEIGHTS, CUSTOM_AMOUNT_RATE, VOID_RATE, CANCEL_RATE, SUMMARY_EVERY, \
+    cash_for  # noqa: E402
+
+DECREMENT_RATE = 0.05
+"""Allowed growth from the baseline to the end, in KiB and objects; widgets, canvas items and Tcl commands
+must not grow"""
+MAX_PYTHON_GROWTH_KIB = 512
+MAX_OBJECT_GROWTH = 2000
+MAX_RSS_GROWTH_KIB = 16 * 1024
+
+
+class UIDriver:
+    """Rings up orders through the methods the buttons of TouchRegisterUI call"""
+
+    def __init__(self, db_name):
+        import tkinter as tk
+        from TouchKasse import TouchRegisterUI
+
+        self.tk_root = tk.Tk()
+        self.tk_root.withdraw()
+        self.ui = TouchRegisterUI(self.tk_root, db_name=db_name)
+        self.catalog = self.ui.db_elements
+
+    def add(self, short_name, quantity):
+        item = self.catalog[short_name]
+        self.ui.display_element_factory(item.name, short_name, to_cents(item.price), quantity)
+
+    def add_custom_amount(self, amount_cents):
+        self.ui.display_element_factory('Eigener Betrag', 'EB', amount_cents, 1)
+
+    def lines(self):
+        return self.ui.engine.cart.get_lines()
+
+    def void(self, key):
+        self.ui.void_line(key)
+
+    def decrement(self, key):
+        self.ui.decrement_line(key)
+
+    def cancel(self):
+        self.ui.end_transaction('cancel')
+
+    def pay(self, cash_cents):
+        self.ui.got_cash()
+        self.ui.cash_pad.update_value(cash_cents)
+        self.ui.end_transaction('ok')
+
+    def summary(self):
+        self.ui.show_summary()
+        self.ui.summary_back()
+
+    def idle(self):
+        """Let the Tk loop run the scheduled callbacks, e.g. the writer results"""
+        self.tk_root.update()
+
+    def settle(self):
+        """Clear the finished order, so every sample sees the same screen"""
+        self.idle()
+        self.ui.reset_transaction()
+        self.idle()
+
+    def close(self):
+        self.ui.shutdown()
+
+
+class EngineDriver:
+    """Rings up orders through RegisterEngine, used without a display"""
+
+    def __init__(self, db_name):
+        self.tk_root = None
+        self.engine = RegisterEngine(db_name, background_writes=True, journal_file=db_name + '.cart')
+        self.catalog = self.engine.get_catalog()
+
+    def add(self, short_name, quantity):
+        self.engine.add_item(short_name, quantity)
+
+    def add_custom_amount(self, amount_cents):
+        self.engine.add_custom_amount(amount_cents)
+
+    def lines(self):
+        return self.engine.cart.get_lines()
+
+    def void(self, key):
+        self.engine.void(key)
+
+    def decrement(self, key):
+        self.engine.decrement(key)
+
+    def cancel(self):
+        self.engine.cancel()
+
+    def pay(self, cash_cents):
+        self.engine.pay(cash_cents)
+
+    def summary(self):
+        self.engine.summary()
+
+    def idle(self):
+        self.engine.process_results()
+
+    def settle(self):
+        """Wait for the writer and drop the finished order"""
+        while self.engine.writer.pending():
+            time.sleep(0.01)
+        self.idle()
+        self.engine.cancel()
+
+    def close(self):
+        self.engine.close()
+
+
+def run(orders=10000, warmup=1000, sample_every=1000, seed=1, max_python_growth=MAX_PYTHON_GROWTH_KIB,
+        max_object_growth=MAX_OBJECT_GROWTH, max_rss_growth=MAX_RSS_GROWTH_KIB, driver=None) -> dict:
+    """
+    Ring up the orders and compare the samples.
+    :param orders: Orders after the warm-up
+    :param warmup: Orders before the baseline, they fill the caches
+    :param sample_every: Orders between two samples
+    :param seed: Seed of the random generator
+    :param max_python_growth: KiB the traced Python memory may grow
+    :param max_object_growth: Number of objects the garbage collector tracks more at the end
+    :param max_rss_growth: KiB the resident set size may grow
+    :param driver: 'ui' or 'engine', None for the UI if there is a display
+    :return: Result dict, 'failures' lists the exceeded limits
+    """
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_name = os.path.join(tmp_dir, 'soak.db')
+        init_db(db_name)
+        if driver == 'engine':
+            driver = EngineDriver(db_name)
+        elif driver == 'ui':
+            driver = UIDriver(db_name)
+        else:
+            try:
+                driver = UIDriver(db_name)
+            except Exception as e:  # tkinter.TclError without a display, ImportError without tkinter
+                print('no display, driving the engine only: {!r}'.format(e), file=sys.stderr)
+                driver = EngineDriver(db_name)
+        sampler = ResourceSampler(driver.tk_root, top_every=1)
+        articles = [item.name_short for item in driver.catalog.values() if item.name != '']
+        weights = [ITEM_WEIGHTS.get(short_name, 1) for short_name in articles]
+
+        samples = []
+        t_start = time.perf_counter()
+        for number in range(1, warmup + orders + 1):
+            for short_name in rng.choices(articles, weights, k=rng.choice((1, 1, 2, 2, 2, 3, 3, 4, 5, 6))):
+                driver.add(short_name, 1 if rng.random() < 0.9 else rng.randint(2, 5))
+            if rng.random() < CUSTOM_AMOUNT_RATE:
+                driver.add_custom_amount(rng.choice((50, 100, 150, 200, 500)))
+            if rng.random() < VOID_RATE and len(driver.lines()) > 1:
+                driver.void(driver.lines()[0].key)
+            if rng.random() < DECREMENT_RATE and driver.lines():
+                driver.decrement(driver.lines()[-1].key)
+            if rng.random() < CANCEL_RATE or not driver.lines():
+                driver.cancel()
+            else:
+                driver.pay(cash_for(sum(line.amount_cents for line in driver.lines()), rng))
+            if number % SUMMARY_EVERY == 0:
+                driver.summary()
+            driver.idle()
+
+            if number == warmup or (number > warmup and (number - warmup) % sample_every == 0):
+                driver.settle()
+                gc.collect()
+                if number == warmup:
+                    tracemalloc.start()
+                samples.append(sampler.sample())
+        seconds = time.perf_counter() - t_start
+        growth = sampler.growth()
+        top_growth = samples[-1]['top_growth']
+        tracemalloc.stop()
+        driver.close()
+
+    failures = []
+    if growth.get('traced_kib', 0) > max_python_growth:
+        failures.append('python memory grew by {} KiB'.format(growth['traced_kib']))
+    if growth.get('python_objects', 0) > max_object_growth:
+        failures.append('python objects grew by {}'.format(growth['python_objects']))
+    if growth.get('rss_kib', 0) > max_rss_growth:
+        failures.append('rss grew by {} KiB'.format(growth['rss_kib']))
+    for key in ('widgets', 'canvas_items', 'tcl_commands'):
+        if growth.get(key, 0) > 0:
+            failures.append('{} grew by {}'.format(key, growth[key]))
+    return {
+        'meta': {
+            'orders': orders,
+            'warmup': warmup,
+            'seed': seed,
+            'driver': 'ui' if isinstance(driver, UIDriver) else 'engine',
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'date': datetime.now().isoformat(timespec='seconds')
+        },
+        'throughput_orders_per_s': (warmup + orders) / seconds,
+        'growth': growth,
+        'top_growth': top_growth,
+        'samples': [{key: value for key, value in sample.items() if key != 'top_growth'} for sample in samples],
+        'failures': failures
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Soak check of one register for memory and widget growth')
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--warmup', type=int, default=1000)
+    parser.add_argument('--sample-every', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--max-python-growth', type=int, default=MAX_PYTHON_GROWTH_KIB, metavar='KIB')
+    parser.add_argument('--max-object-growth', type=int, default=MAX_OBJECT_GROWTH, metavar='OBJECTS')
+    parser.add_argument('--max-rss-growth', type=int, default=MAX_RSS_GROWTH_KIB, metavar='KIB')
+    parser.add_argument('--driver', choices=('ui', 'engine'), help='default: the UI if there is a display')
+    parser.add_argument('--output', help='write the JSON result to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    result = run(orders=args.orders, warmup=args.warmup, sample_every=args.sample_every, seed=args.seed,
+                 max_python_growth=args.max_python_growth, max_object_growth=args.max_object_growth,
+                 max_rss_growth=args.max_rss_growth, driver=args.driver)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    for failure in result['failures']:
+        print('FAILED: ' + failure, file=sys.stderr)
+    return 1 if result['failures'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""
+Load and soak test: several register processes selling into one shared db, reported as JSON.
+
+Every worker process opens its own DBAccess on the db and writes randomized orders (the article
+mix of bench_festival_day) through db_checkout as fast as it can, with a simulated clock advancing
+ORDER_GAP seconds per order on average, so the rollups see hours and days of operation. A sale
+failing with SQLITE_BUSY is counted and written again. The workers report throughput, commit
+latency (including the wait for the write lock), busy incidents and their RSS per interval;
+the parent samples the size of the db and its WAL meanwhile.
+
+No display is needed. A long run shows whether throughput, latency, memory or the db degrade:
+
+Usage:
+    python benchmarks/bench_terminals.py [--workers 4] [--duration 60 | --orders 5000] [--interval 10]
+                                         [--profile balanced] [--timeout 5] [--db shared.db]
+                                         [--output result.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_schema import init_db, to_cents  # noqa: E402
+from kasse_core import DBAccess, Cart, DB_PROFILES, DB_DEFAULT_PROFILE, latency_stats, is_busy_error  # noqa: E402
+from instrumentation import current_rss_kib  # noqa: E402
+from bench_festival_day import ITEM_WEIGHTS, CUSTOM_AMOUNT_RATE, cash_for  # noqa: E402
+
+"""Mean simulated seconds between two orders of one terminal"""
+ORDER_GAP = 30
+"""Commit latencies kept per worker for the overall percentiles"""
+RESERVOIR_SIZE = 100000
+
+
+def file_size(path) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def run_worker(job) -> dict:
+    """
+    Sell orders into the shared db until the number of orders or the duration is reached.
+    :param job: Tuple (worker number, db path, orders or None, duration or None, seed, profile,
+                timeout, interval)
+    :return: Dict with 'worker', 'orders', 'busy', 'commit_samples' (a sample of the commit
+             latencies) and 'intervals' (one dict per interval)
+    """
+    worker, db_name, orders, duration, seed, profile, timeout, interval = job
+    rng = random.Random(seed * 1000 + worker)
+    busy = 0
+    while True:
+        try:
+            db = DBAccess(db_name, profile=profile, timeout=timeout)
+            break
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e):
+                raise
+            busy += 1
+    catalog = db.get_catalog()
+    articles = [item.name_short for item in catalog.values() if item.name != '']
+    weights = [ITEM_WEIGHTS.get(short_name, 1) for short_name in articles]
+    cart = Cart()
+    opening = datetime.now().replace(hour=10, minute=0, second=0, microsecond=0).timestamp()
+    sim_ts = opening
+
+    done = 0
+    reservoir = []
+    intervals = []
+    window = []
+    window_busy = 0
+    t_start = time.perf_counter()
+    next_report = t_start + interval
+    while (orders is None or done < orders) and (duration is None or time.perf_counter() - t_start < duration):
+        cart.clear()
+        for short_name in rng.choices(articles, weights, k=rng.choice((1, 1, 2, 2, 2, 3, 3, 4, 5, 6))):
+            item = catalog[short_name]
+            cart.add(item.name, short_name, to_cents(item.price), 1 if rng.random() < 0.9 else rng.randint(2, 5))
+        if rng.random() < CUSTOM_AMOUNT_RATE:
+            cart.add('Eigener Betrag', 'EB', rng.choice((50, 100, 150, 200, 500)))
+        bill_cents = cart.get_total_cents()
+        sim_ts += rng.expovariate(1.0 / ORDER_GAP)
+
+        while True:
+            t_commit = time.perf_counter()
+            try:
+                db.db_checkout(bill_cents, cash_for(bill_cents, rng), cart.get_counts(), cart.get_custom_amounts(),
+                               timestamp=sim_ts, lines=cart.get_item_lines())
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e):
+                    raise
+                busy += 1
+                window_busy += 1
+                continue
+            latency = time.perf_counter() - t_commit
+            break
+        done += 1
+        window.append(latency)
+        # reservoir sample, so a soak run does not grow the memory it measures
+        if len(reservoir) < RESERVOIR_SIZE:
+            reservoir.append(latency)
+        else:
+            slot = rng.randrange(done)
+            if slot < RESERVOIR_SIZE:
+                reservoir[slot] = latency
+
+        now = time.perf_counter()
+        if now >= next_report:
+            intervals.append(_interval(now - t_start, window, window_busy, sim_ts - opening))
+            window = []
+            window_busy = 0
+            next_report += interval
+    if window or window_busy:
+        intervals.append(_interval(time.perf_counter() - t_start, window, window_busy, sim_ts - opening))
+    db.close()
+    return {
+        'worker': worker,
+        'orders': done,
+        'busy': busy,
+        'seconds': time.perf_counter() - t_start,
+        'commit_samples': reservoir,
+        'intervals': intervals
+    }
+
+
+def _interval(elapsed, latencies, busy, simulated) -> dict:
+    stats = latency_stats(latencies)
+    return {
+        'elapsed_s': elapsed,
+        'orders': len(latencies),
+        'busy': busy,
+        'p99_ms': stats.get('p99_ms'),
+        'max_ms': stats.get('max_ms'),
+        'rss_kib': current_rss_kib(),
+        'simulated_hours': simulated / 3600.0
+    }
+
+
+def merge_intervals(worker_results: list) -> list:
+    """
+    :param worker_results: Results of run_worker
+    :return: One dict per interval over all workers: summed orders and busy incidents, the worst
+             p99 and max of the workers and their summed RSS
+    """
+    timeline = []
+    for number in range(max(len(r['intervals']) for r in worker_results)):
+        rows = [r['intervals'][number] for r in worker_results if number < len(r['intervals'])]
+        timeline.append({
+            'elapsed_s': max(row['elapsed_s'] for row in rows),
+            'orders': sum(row['orders'] for row in rows),
+            'busy': sum(row['busy'] for row in rows),
+            'p99_ms': max(row['p99_ms'] or 0 for row in rows),
+            'max_ms': max(row['max_ms'] or 0 for row in rows),
+            'rss_kib': sum(row['rss_kib'] for row in rows),
+            'simulated_hours': max(row['simulated_hours'] for row in rows)
+        })
+    return timeline
+
+
+def run(workers=4, orders=None, duration=60, interval=10, seed=1, profile=DB_DEFAULT_PROFILE, timeout=5.0,
+        db_name=None) -> dict:
+    """
+    Run the workers against one db and collect the measurements.
+    :param workers: Number of register processes
+    :param orders: Orders per worker, unlimited if None
+    :param duration: Seconds per worker, unlimited if None
+    :param interval: Seconds per timeline entry and between two db size samples
+    :param seed: Seed of the random generators
+    :param profile: Durability profile of all connections
+    :param timeout: Seconds a write waits for the lock before SQLITE_BUSY
+    :param db_name: Db to sell into, a new temporary db if None
+    :return: Result dict
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if db_name is None:
+            db_name = os.path.join(tmp_dir, 'terminals.db')
+            init_db(db_name)
+        # schema and journal mode are set up once, before the workers race for them
+        DBAccess(db_name, profile=profile).close()
+        db_start = file_size(db_name)
+
+        growth = []
+        t_start = time.perf_counter()
+        with Pool(workers) as pool:
+            pending = pool.map_async(run_worker, [(worker, db_name, orders, duration, seed, profile, timeout, interval)
+                                                  for worker in range(workers)])
+            while not pending.ready():
+                pending.wait(interval)
+                growth.append({'elapsed_s': time.perf_counter() - t_start, 'db_bytes': file_size(db_name),
+                               'wal_bytes': file_size(db_name + '-wal')})
+            worker_results = pending.get()
+        seconds = time.perf_counter() - t_start
+        db_end = file_size(db_name)
+
+    total_orders = sum(r['orders'] for r in worker_results)
+    timeline = merge_intervals(worker_results)
+    return {
+        'meta': {
+            'workers': workers,
+            'orders_per_worker': orders,
+            'duration_s': duration,
+            'seed': seed,
+            'profile': profile,
+            'timeout_s': timeout,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'date': datetime.now().isoformat(timespec='seconds')
+        },
+        'orders': total_orders,
+        'throughput_orders_per_s': total_orders / seconds,
+        'commit': latency_stats([s for r in worker_results for s in r['commit_samples']]),
+        'busy_incidents': sum(r['busy'] for r in worker_results),
+        'simulated_hours': max(row['simulated_hours'] for row in timeline) if timeline else 0,
+        'db_bytes': {'start': db_start, 'end': db_end,
+                     'per_1000_orders': (db_end - db_start) * 1000 // max(1, total_orders)},
+        'rss_kib': {'first': timeline[0]['rss_kib'], 'last': timeline[-1]['rss_kib']} if timeline else None,
+        'timeline': timeline,
+        'db_growth': growth
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Several register processes selling into one db')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--duration', type=float, help='seconds per worker, 60 if --orders is not given')
+    parser.add_argument('--orders', type=int, help='orders per worker')
+    parser.add_argument('--interval', type=float, default=10, help='seconds per timeline entry')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--profile', choices=list(DB_PROFILES.keys()), default=DB_DEFAULT_PROFILE)
+    parser.add_argument('--timeout', type=float, default=5.0, help='busy timeout of the connections in seconds')
+    parser.add_argument('--db', help='sell into this db instead of a temporary one')
+    parser.add_argument('--output', help='write the JSON result to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    duration = args.duration if args.duration is not None or args.orders is not None else 60
+    result = run(workers=args.workers, orders=args.orders, duration=duration, interval=args.interval,
+                 seed=args.seed, profile=args.profile, timeout=args.timeout, db_name=args.db)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
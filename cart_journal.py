@@ -0,0 +1,138 @@
+"""
+Append-only journal of the cart changes, kept in a memory-mapped file so an order being rung up
+survives a power loss.
+
+The file starts with JOURNAL_MAGIC, followed by records of a 6 byte header (payload length and
+crc32 of the payload) and a JSON payload [seq, kind, args...]. The first header with length 0 ends
+the journal, a record with a wrong crc (a torn write) or a sequence number that is not increasing
+ends it as well. Appending only writes into
+the mapping; the mapping is flushed to disk at most every sync_interval seconds, or right away for
+records appended with sync=True. After a sale is written to the db the journal is compacted down
+to the records that follow its checkout record.
+"""
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+
+JOURNAL_MAGIC = b'KASSEJ01'
+JOURNAL_SIZE = 64 * 1024
+_RECORD_HEADER = struct.Struct('<HI')
+
+
+class CartJournal:
+
+    def __init__(self, file_name, size=JOURNAL_SIZE, sync_interval=0.2):
+        """
+        :param file_name: Path of the journal, created if missing
+        :param size: Initial size of the file, it grows if the records do not fit
+        :param sync_interval: Maximum seconds an appended record stays unflushed, if sync() is called regularly
+        """
+        self._sync_interval = sync_interval
+        self._file = open(file_name, 'r+b' if os.path.exists(file_name) else 'w+b')
+        if os.fstat(self._file.fileno()).st_size < size:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._offset = 0
+        self._dirty = False
+        self._last_sync = time.monotonic()
+        self._records = []
+        if self._map[:len(JOURNAL_MAGIC)] == JOURNAL_MAGIC:
+            self._records = self._read()
+        else:
+            self._rewrite([])
+        self._seq = self._records[-1][0] if self._records else 0
+
+    def _read(self) -> list:
+        records = []
+        offset = len(JOURNAL_MAGIC)
+        while offset + _RECORD_HEADER.size <= len(self._map):
+            length, crc = _RECORD_HEADER.unpack_from(self._map, offset)
+            payload = self._map[offset + _RECORD_HEADER.size:offset + _RECORD_HEADER.size + length]
+            if length == 0 or len(payload) != length or zlib.crc32(payload) != crc:
+                break
+            record = json.loads(payload.decode('utf-8'))
+            if records and record[0] <= records[-1][0]:
+                break  # left over from an interrupted compaction
+            records.append(record)
+            offset += _RECORD_HEADER.size + length
+        self._offset = offset
+        return records
+
+    @staticmethod
+    def _encode(record) -> bytes:
+        payload = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        return _RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def _ensure_size(self, end):
+        # always leave room for the terminating empty header
+        if end + _RECORD_HEADER.size <= len(self._map):
+            return
+        size = len(self._map)
+        while end + _RECORD_HEADER.size > size:
+            size *= 2
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def _rewrite(self, records: list):
+        data = JOURNAL_MAGIC + b''.join(self._encode(r) for r in records)
+        self._ensure_size(len(data))
+        old_end = max(self._offset, len(data))
+        self._map[:len(data)] = data
+        self._map[len(data):old_end + _RECORD_HEADER.size] = bytes(old_end + _RECORD_HEADER.size - len(data))
+        self._offset = len(data)
+        self._records = list(records)
+        self._map.flush()
+        self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def append(self, kind, *args, sync=False) -> int:
+        """
+        :param kind: Kind of the change, e.g. 'add'
+        :param args: JSON serializable arguments of the change
+        :param sync: Flush to disk before returning
+        :return: Sequence number of the record
+        """
+        self._seq += 1
+        record = [self._seq, kind] + list(args)
+        data = self._encode(record)
+        self._ensure_size(self._offset + len(data))
+        self._map[self._offset:self._offset + len(data)] = data
+        self._offset += len(data)
+        self._records.append(record)
+        self._dirty = True
+        if sync or time.monotonic() - self._last_sync >= self._sync_interval:
+            self.sync()
+        return self._seq
+
+    def sync(self):
+        """
+        Flush appended records to disk.
+        :return: Nothing
+        """
+        if self._dirty:
+            self._map.flush()
+            self._dirty = False
+            self._last_sync = time.monotonic()
+
+    def get_records(self) -> list:
+        """
+        :return: Records of the journal as lists [seq, kind, args...]
+        """
+        return list(self._records)
+
+    def compact(self, up_to_seq):
+        """
+        Drop all records up to a sequence number, e.g. those of an order written to the db.
+        :param up_to_seq: Sequence number of the last record to drop
+        :return: Nothing
+        """
+        self._rewrite([r for r in self._records if r[0] > up_to_seq])
+
+    def close(self):
+        self.sync()
+        self._map.close()
+        self._file.close()
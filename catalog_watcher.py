@@ -0,0 +1,175 @@
+"""
+Live reload of the article catalog (food_list) while the register is running.
+
+CatalogWatcher is a thread with its own db connection. It imports an external catalog file when
+the file changes, and compares the articles in the db with the last known ones whenever
+PRAGMA data_version says another connection has committed. The differences are queued and handed
+to the register thread by get_changes(), so neither the file import nor the db reads block the UI.
+On the same occasions it reads the stock, handed over by get_stock().
+
+Catalog file: CSV with a header line, columns name_short, name and price (euro), optionally plu,
+barcode, category, position and color. Articles are matched by name_short, new ones are added.
+Articles missing from the file are left alone, the sales refer to them.
+"""
+import os
+import csv
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from db_schema import CatalogItem, CATALOG_COLUMNS
+from stock import StockLevels, read_stock
+
+"""Fields that make an article look different at the register, the sold counter is not among them"""
+CATALOG_WATCH_FIELDS = ('id', 'name', 'name_short', 'price', 'plu', 'barcode', 'category', 'position', 'color')
+"""Optional columns of a catalog file, an empty value clears the column"""
+CATALOG_FILE_COLUMNS = ('plu', 'barcode', 'category', 'position', 'color')
+
+
+def import_catalog_file(db_conn: sqlite3.Connection, file_name) -> int:
+    """
+    Write the articles of a catalog file to food_list in one transaction.
+    :param db_conn: Open sqlite connection of the register db
+    :param file_name: Path of the CSV catalog file
+    :return: Number of added or changed articles
+    """
+    with open(file_name, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    changed = 0
+    with db_conn:
+        for row in rows:
+            short_name = row['name_short'].strip()
+            if not short_name or short_name == 'EB':
+                continue
+            fields = OrderedDict([('name', row['name'].strip()),
+                                  ('price', float(row['price'].replace(',', '.')))])
+            for column in CATALOG_FILE_COLUMNS:
+                if column in row:
+                    value = (row[column] or '').strip()
+                    fields[column] = (int(value) if column in ('plu', 'position') else value) if value else None
+            current = db_conn.execute('SELECT {} FROM food_list WHERE name_short=?'.format(','.join(fields)),
+                                      (short_name,)).fetchone()
+            if current is None:
+                db_conn.execute('INSERT INTO food_list (name_short, sold, {}) VALUES (?, 0, {})'.format(
+                    ','.join(fields), ','.join('?' * len(fields))), [short_name] + list(fields.values()))
+            elif tuple(current) != tuple(fields.values()):
+                db_conn.execute('UPDATE food_list SET {} WHERE name_short=?'.format(
+                    ','.join(c + '=?' for c in fields)), list(fields.values()) + [short_name])
+            else:
+                continue
+            changed += 1
+    return changed
+
+
+def read_catalog(db_conn: sqlite3.Connection) -> OrderedDict:
+    """
+    :param db_conn: Open sqlite connection of the register db
+    :return: OrderedDict of short name -> CatalogItem, without the custom amount (EB)
+    """
+    rows = db_conn.execute("SELECT {} FROM food_list WHERE name_short != 'EB' ORDER BY id".format(
+        CATALOG_COLUMNS)).fetchall()
+    return OrderedDict((row[2], CatalogItem(*row)) for row in rows)
+
+
+def catalog_changes(old: OrderedDict, new: OrderedDict) -> dict:
+    """
+    :param old: Known articles, short name -> CatalogItem
+    :param new: Current articles, short name -> CatalogItem
+    :return: Dict with 'changed' and 'added' (lists of CatalogItem) and 'removed' (short names)
+    """
+    def key(item):
+        return tuple(getattr(item, field) for field in CATALOG_WATCH_FIELDS)
+
+    return {
+        'changed': [item for short_name, item in new.items()
+                    if short_name in old and key(old[short_name]) != key(item)],
+        'added': [item for short_name, item in new.items() if short_name not in old],
+        'removed': [short_name for short_name in old if short_name not in new]
+    }
+
+
+class CatalogWatcher(threading.Thread):
+
+    def __init__(self, db_name, known: OrderedDict, catalog_file=None, interval=1.0):
+        """
+        :param db_name: Path of the register db
+        :param known: Catalog the register currently shows, short name -> CatalogItem
+        :param catalog_file: Optional CSV catalog file imported whenever it changes
+        :param interval: Seconds between two checks
+        """
+        super(CatalogWatcher, self).__init__(name='CatalogWatcher', daemon=True)
+        self._db_name = db_name
+        self._known = OrderedDict((k, v) for k, v in known.items() if k != 'EB')
+        self._catalog_file = catalog_file
+        self._file_mtime = None
+        self._interval = interval
+        self._stopping = threading.Event()
+        self._changes = queue.Queue()
+        self._stock = queue.Queue()
+
+    def run(self):
+        db_conn = sqlite3.connect(self._db_name)
+        try:
+            data_version = None
+            while True:
+                imported = self._check_file(db_conn)
+                version = db_conn.execute('PRAGMA data_version').fetchone()[0]
+                if imported or version != data_version:
+                    data_version = version
+                    current = read_catalog(db_conn)
+                    changes = catalog_changes(self._known, current)
+                    self._known = current
+                    if any(changes.values()):
+                        self._changes.put(changes)
+                    self._stock.put(read_stock(db_conn))
+                if self._stopping.wait(self._interval):
+                    break
+        finally:
+            db_conn.close()
+
+    def _check_file(self, db_conn) -> bool:
+        """
+        :return: True if the catalog file changed and was imported
+        """
+        if self._catalog_file is None:
+            return False
+        try:
+            mtime = os.stat(self._catalog_file).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._file_mtime:
+            return False
+        self._file_mtime = mtime
+        try:
+            import_catalog_file(db_conn, self._catalog_file)
+        except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+            self._changes.put({'error': e})
+            return False
+        return True
+
+    def get_changes(self) -> list:
+        """
+        :return: Change dicts found since the last call, see catalog_changes(); a dict with 'error'
+                 if importing the catalog file failed
+        """
+        changes = []
+        while True:
+            try:
+                changes.append(self._changes.get_nowait())
+            except queue.Empty:
+                return changes
+
+    def get_stock(self) -> StockLevels:
+        """
+        :return: Latest stock read since the last call, None if there is none
+        """
+        stock = None
+        while True:
+            try:
+                stock = self._stock.get_nowait()
+            except queue.Empty:
+                return stock
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.join(timeout)
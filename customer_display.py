@@ -0,0 +1,280 @@
+"""
+Customer display: a second window showing the order being rung up, run in its own process so it
+never costs the cashier's Tk main loop any time.
+
+The register side (CustomerDisplay) collects cart deltas: changed lines, the sum, the cash tapped
+(BAR) and the change (ZURÜCK). flush() hands them to a sender thread which merges everything
+collected since its last message into one, so a burst of taps costs one message per flush, and
+the newest value wins. Only the sender thread writes to the pipe: if the display is slow the pipe
+fills up and the sender blocks, the register never does. A crashed display is started again with
+the complete order after DISPLAY_RESTART_INTERVAL seconds.
+
+The display process polls the pipe from its own Tk loop and ends when the register closes the pipe.
+
+Usage (a window showing a demo order, to place the display):
+    python customer_display.py
+"""
+import sys
+import time
+import threading
+import multiprocessing
+from collections import OrderedDict
+from kasse_core import CartLine, format_cents
+
+DISPLAY_POLL_MS = 30
+DISPLAY_RESTART_INTERVAL = 5.0
+
+
+class CustomerDisplay:
+
+    def __init__(self, restart_interval=DISPLAY_RESTART_INTERVAL):
+        """
+        :param restart_interval: Seconds before a crashed display process is started again
+        """
+        # spawn: a forked child would inherit the Tk state and the threads of the register
+        self._context = multiprocessing.get_context('spawn')
+        self._restart_interval = restart_interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._lines = OrderedDict()  # key -> (name, quantity, amount_cents), what the display should show
+        self._sum_cents = 0
+        self._status = None  # ('BAR' or 'ZURÜCK', cents)
+        self._pending = {}
+        self._process = None
+        self._conn = None
+        self.updates = 0
+        self.messages = 0
+        self.restarts = 0
+        self.last_error = None
+        self._sender = threading.Thread(target=self._send_loop, name='CustomerDisplay', daemon=True)
+        self._sender.start()
+
+    def _update(self, **delta):
+        with self._lock:
+            lines = delta.pop('lines', None)
+            if lines:
+                self._pending.setdefault('lines', OrderedDict()).update(lines)
+            self._pending.update(delta)
+            self.updates += 1
+
+    def show_line(self, line: CartLine):
+        """
+        :param line: Changed cart line, a line with quantity 0 is removed
+        :return: Nothing
+        """
+        value = (line.name, line.quantity, line.amount_cents) if line.quantity != 0 else None
+        with self._lock:
+            if value is None:
+                self._lines.pop(line.key, None)
+            else:
+                self._lines[line.key] = value
+        self._update(lines={line.key: value})
+
+    def show_sum(self, total_cents):
+        self._sum_cents = total_cents
+        self._update(sum=total_cents)
+
+    def show_cash(self, cash_cents):
+        """
+        :param cash_cents: Cash tapped so far, 0 hides the cash line
+        :return: Nothing
+        """
+        self._status = ('BAR', cash_cents) if cash_cents else None
+        self._update(status=self._status)
+
+    def show_change(self, change_cents):
+        self._status = ('ZURÜCK', change_cents)
+        self._update(status=self._status)
+
+    def clear(self):
+        """
+        Start a new order on the display.
+        :return: Nothing
+        """
+        with self._lock:
+            self._lines.clear()
+            self._pending.clear()
+        self._sum_cents = 0
+        self._status = None
+        self._update(clear=True, sum=0, status=None)
+
+    def flush(self):
+        """
+        Send the collected changes, called regularly from the register loop. Never blocks.
+        :return: Nothing
+        """
+        if self._pending:
+            self._wakeup.set()
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            self._pending.clear()
+            return {'clear': True, 'lines': OrderedDict(self._lines), 'sum': self._sum_cents,
+                    'status': self._status}
+
+    def _start(self):
+        recv_conn, send_conn = self._context.Pipe(duplex=False)
+        self._process = self._context.Process(target=run_display, args=(recv_conn,), name='CustomerDisplay',
+                                              daemon=True)
+        self._process.start()
+        recv_conn.close()
+        self._conn = send_conn
+
+    def _send_loop(self):
+        message = None
+        while not self._stopping:
+            try:
+                if self._conn is None:
+                    self._start()
+                    message = self._snapshot()
+                if message is None:
+                    self._wakeup.wait()
+                    self._wakeup.clear()
+                    with self._lock:
+                        message, self._pending = self._pending, {}
+                    if not message:
+                        message = None
+                        continue
+                self._conn.send(message)
+                self.messages += 1
+                message = None
+            except (OSError, EOFError) as e:
+                if self._stopping:
+                    break
+                self.last_error = repr(e)
+                self._drop_process()
+                self.restarts += 1
+                message = None
+                time.sleep(self._restart_interval)
+
+    def _drop_process(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._process is not None:
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process.join(1.0)
+            self._process = None
+
+    def get_stats(self) -> dict:
+        """
+        :return: Dict with 'updates' (changes shown), 'messages' (sent to the display), 'restarts',
+                 'alive' and 'last_error'
+        """
+        return {
+            'updates': self.updates,
+            'messages': self.messages,
+            'restarts': self.restarts,
+            'alive': self._process is not None and self._process.is_alive(),
+            'last_error': self.last_error
+        }
+
+    def close(self, timeout=1.0):
+        """
+        End the display process. Does not wait for a display that does not read anymore.
+        :param timeout: Seconds to wait for the sender thread
+        :return: Nothing
+        """
+        self._stopping = True
+        self._wakeup.set()
+        self._sender.join(timeout)
+        if not self._sender.is_alive():
+            self._drop_process()
+        elif self._process is not None:
+            self._process.terminate()
+
+
+def merge_messages(messages: list) -> dict:
+    """
+    :param messages: Messages in the order they were sent
+    :return: One message with the same effect
+    """
+    merged = {}
+    for message in messages:
+        if message.get('clear'):
+            merged = {}
+        lines = merged.get('lines', OrderedDict())
+        lines.update(message.get('lines', {}))
+        merged.update(message)
+        merged['lines'] = lines
+    return merged
+
+
+def run_display(conn):
+    """
+    Main function of the display process.
+    :param conn: Receiving end of the pipe from CustomerDisplay
+    :return: Nothing
+    """
+    import tkinter as tk
+
+    tk_root = tk.Tk()
+    tk_root.title('Kundenanzeige')
+    tk_root.geometry('800x480')
+    lines_frame = tk.Frame(tk_root)
+    lines_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+    tk_status = tk.Label(tk_root, text='', anchor=tk.W, font=('Arial', 26), padx=10)
+    tk_status.pack(side=tk.BOTTOM, fill=tk.X)
+    tk_sum = tk.Label(tk_root, text='SUMME: 0.00€', anchor=tk.W, font=('Arial', 32, 'bold'), padx=10)
+    tk_sum.pack(side=tk.BOTTOM, fill=tk.X)
+    rows = OrderedDict()
+
+    def apply(message):
+        if message.get('clear'):
+            for row in rows.values():
+                row.destroy()
+            rows.clear()
+        for key, value in message.get('lines', {}).items():
+            row = rows.get(key)
+            if value is None:
+                if row is not None:
+                    rows.pop(key).destroy()
+                continue
+            name, quantity, amount_cents = value
+            text = '{:3d} x {:30} {:>9}€'.format(quantity, name, format_cents(amount_cents))
+            if row is None:
+                row = rows[key] = tk.Label(lines_frame, anchor=tk.W, font=('Courier', 20), padx=10)
+                row.pack(side=tk.TOP, fill=tk.X)
+            row.config(text=text)
+        if 'sum' in message:
+            tk_sum.config(text='SUMME: {}€'.format(format_cents(message['sum'])))
+        if 'status' in message:
+            status = message['status']
+            tk_status.config(text='{}: {} €'.format(status[0], format_cents(status[1])) if status else '')
+
+    def poll():
+        messages = []
+        try:
+            while conn.poll():
+                messages.append(conn.recv())
+        except (EOFError, OSError):
+            tk_root.destroy()
+            return
+        if messages:
+            apply(merge_messages(messages))
+        tk_root.after(DISPLAY_POLL_MS, poll)
+
+    poll()
+    tk_root.mainloop()
+
+
+def main():
+    display = CustomerDisplay()
+    for name, short_name, price, quantity in (('Kaffee', 'KK', 250, 2), ('Kuchen', 'KUCH', 300, 1)):
+        display.show_line(CartLine(name, short_name, price, quantity))
+    display.show_sum(800)
+    display.show_cash(1000)
+    display.flush()
+    try:
+        while display.restarts == 0 and (display.messages == 0 or display.get_stats()['alive']):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    display.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
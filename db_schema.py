@@ -0,0 +1,357 @@
+"""
+Transaction schema of the register db and migration of the old wide tr_list table.
+
+Every sale is stored as one row in `transactions` plus one row per sold article in
+`transaction_items`. Money is stored in integer cents, the timestamp as unix time in seconds.
+
+Usage as migration tool:
+    python db_schema.py touchReg.db [more.db ...] [--drop-tr-list]
+"""
+import os
+import sys
+import uuid
+import sqlite3
+import argparse
+from datetime import datetime
+from collections import namedtuple
+
+"""Script creating a new, empty register db"""
+DB_INIT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db_init_script.sqlite')
+
+TRANSACTION_SCHEMA = """
+create table if not exists transactions (
+tr_id integer primary key autoincrement,
+ts integer not null,
+bill_cents integer not null,
+cash_cents integer not null,
+sale_id text
+);
+create index if not exists transactions_ts on transactions (ts);
+create table if not exists transaction_items (
+tr_id integer not null references transactions (tr_id),
+item_id integer not null references food_list (id),
+qty integer not null,
+unit_price_cents integer not null
+);
+create index if not exists transaction_items_tr_id on transaction_items (tr_id);
+create index if not exists transaction_items_item_id on transaction_items (item_id, tr_id);
+"""
+
+"""
+Sales rollups, updated in the checkout transaction. Hours are unix times of the start of the hour, the
+pieces of an hour do not count the custom amounts (EB), their amount does.
+"""
+ROLLUP_SCHEMA = """
+create table if not exists sales_by_item (
+item_id integer primary key references food_list (id),
+qty integer not null,
+amount_cents integer not null
+);
+create table if not exists sales_by_hour (
+hour_ts integer not null,
+item_id integer not null references food_list (id),
+qty integer not null,
+amount_cents integer not null,
+primary key (hour_ts, item_id)
+) without rowid;
+create table if not exists sales_by_day (
+day text primary key,
+transactions integer not null,
+bill_cents integer not null,
+cash_cents integer not null
+);
+"""
+
+ROLLUP_REBUILD = """
+delete from sales_by_item;
+insert into sales_by_item (item_id, qty, amount_cents)
+select item_id, sum(qty), sum(qty * unit_price_cents) from transaction_items group by item_id;
+delete from sales_by_hour;
+insert into sales_by_hour (hour_ts, item_id, qty, amount_cents)
+select t.ts - t.ts % 3600, i.item_id,
+sum(i.qty) * (i.item_id not in (select id from food_list where name_short = 'EB')), sum(i.qty * i.unit_price_cents)
+from transaction_items i join transactions t on t.tr_id = i.tr_id group by 1, 2;
+delete from sales_by_day;
+insert into sales_by_day (day, transactions, bill_cents, cash_cents)
+select date(ts, 'unixepoch', 'localtime'), count(*), sum(bill_cents), sum(cash_cents) from transactions group by 1;
+"""
+
+"""
+Replication: register_meta holds the terminal id, replication_outbox the ids of the transactions not
+yet acknowledged by the aggregator. Together with the terminal id a tr_id is globally unique.
+"""
+REPLICATION_SCHEMA = """
+create table if not exists register_meta (
+key text primary key,
+value text not null
+);
+create table if not exists replication_outbox (
+tr_id integer primary key references transactions (tr_id)
+);
+"""
+
+"""
+Stock: stock holds the pieces on hand of every tracked component (e.g. 'Knöchle' or 'Kraut') and the
+level below which the register warns, recipes how many pieces of which components one piece of an
+article consumes. Articles without a recipe are not tracked.
+"""
+STOCK_SCHEMA = """
+create table if not exists stock (
+component text primary key,
+qty integer not null,
+warn_below integer not null default 0
+);
+create table if not exists recipes (
+item_id integer not null references food_list (id),
+component text not null references stock (component),
+qty integer not null,
+primary key (item_id, component)
+) without rowid;
+"""
+
+"""
+One article of food_list as held by the in-memory catalog of DBAccess. category, position (slot
+on the pages of the category, counted from 1) and color (button colour) place the food button.
+"""
+CatalogItem = namedtuple('CatalogItem', ['id', 'name', 'name_short', 'price', 'sold', 'plu', 'barcode',
+                                         'category', 'position', 'color'], defaults=(None, None, None))
+"""Columns of food_list in the order of CatalogItem, for SELECTs creating CatalogItem objects"""
+CATALOG_COLUMNS = ', '.join(CatalogItem._fields)
+
+"""Format of the DATE column in tr_list, written with datetime.ctime()"""
+TR_LIST_DATE_FORMAT = '%a %b %d %H:%M:%S %Y'
+
+
+def to_cents(value) -> int:
+    """
+    :param value: Amount in euro
+    :return: Amount in integer cents
+    """
+    return int(round(value * 100))
+
+
+def ensure_schema(db_conn: sqlite3.Connection):
+    """
+    Create the transaction, rollup, replication and stock tables and the entry code and layout
+    columns if they are missing. As long as a db still has a tr_list table,
+    new transaction ids start above its highest tr_id, so not yet migrated rows keep their id.
+    :param db_conn: Open sqlite connection
+    :return: Nothing
+    """
+    ensure_entry_codes(db_conn)
+    ensure_layout_columns(db_conn)
+    new_rollups = not has_table(db_conn, 'sales_by_day')
+    new_outbox = not has_table(db_conn, 'replication_outbox')
+    db_conn.executescript(TRANSACTION_SCHEMA)
+    ensure_sale_ids(db_conn)
+    db_conn.executescript(ROLLUP_SCHEMA)
+    db_conn.executescript(REPLICATION_SCHEMA)
+    db_conn.executescript(STOCK_SCHEMA)
+    if new_rollups:
+        rebuild_rollups(db_conn)
+    with db_conn:
+        # hours written before the custom amounts were left out of the pieces
+        db_conn.execute("UPDATE sales_by_hour SET qty = 0 WHERE qty != 0 AND item_id IN "
+                        "(SELECT id FROM food_list WHERE name_short = 'EB')")
+    with db_conn:
+        db_conn.execute("INSERT OR IGNORE INTO register_meta (key, value) VALUES ('terminal_id', ?)",
+                        (uuid.uuid4().hex,))
+        if new_outbox:
+            db_conn.execute('INSERT INTO replication_outbox (tr_id) SELECT tr_id FROM transactions')
+    if not has_table(db_conn, 'tr_list'):
+        return
+
+    last_tr_list_id = db_conn.execute('SELECT ifnull(max(tr_id), 0) FROM tr_list').fetchone()[0]
+    row = db_conn.execute("SELECT seq FROM sqlite_sequence WHERE name='transactions'").fetchone()
+    with db_conn:
+        if row is None:
+            db_conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('transactions', ?)", (last_tr_list_id,))
+        elif row[0] < last_tr_list_id:
+            db_conn.execute("UPDATE sqlite_sequence SET seq=? WHERE name='transactions'", (last_tr_list_id,))
+
+
+def ensure_entry_codes(db_conn: sqlite3.Connection):
+    """
+    Add the plu and barcode columns used by the keyboard and scanner entry to food_list. Articles of
+    an older db get their id as plu.
+    :param db_conn: Open sqlite connection
+    :return: Nothing
+    """
+    columns = [row[1] for row in db_conn.execute('PRAGMA table_info(food_list)').fetchall()]
+    with db_conn:
+        if 'plu' not in columns:
+            db_conn.execute('ALTER TABLE food_list ADD COLUMN plu integer')
+            db_conn.execute("UPDATE food_list SET plu = id WHERE name != ''")
+        if 'barcode' not in columns:
+            db_conn.execute('ALTER TABLE food_list ADD COLUMN barcode text')
+        db_conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS food_list_plu ON food_list (plu) WHERE plu IS NOT NULL')
+        db_conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS food_list_barcode ON food_list (barcode) '
+                        'WHERE barcode IS NOT NULL')
+
+
+def ensure_sale_ids(db_conn: sqlite3.Connection):
+    """
+    Add the sale_id column of transactions and its unique index. The cart journal identifies a
+    checkout by its sale id, sales of an older db have none.
+    :param db_conn: Open sqlite connection of a db with a transactions table
+    :return: Nothing
+    """
+    columns = [row[1] for row in db_conn.execute('PRAGMA table_info(transactions)').fetchall()]
+    with db_conn:
+        if 'sale_id' not in columns:
+            db_conn.execute('ALTER TABLE transactions ADD COLUMN sale_id text')
+        db_conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS transactions_sale_id ON transactions (sale_id)')
+
+
+def ensure_layout_columns(db_conn: sqlite3.Connection):
+    """
+    Add the category, position and color columns of the food button layout to food_list. Articles
+    of an older db have none, they are shown in the order of their ids.
+    :param db_conn: Open sqlite connection
+    :return: Nothing
+    """
+    columns = [row[1] for row in db_conn.execute('PRAGMA table_info(food_list)').fetchall()]
+    with db_conn:
+        for column, column_type in (('category', 'text'), ('position', 'integer'), ('color', 'text')):
+            if column not in columns:
+                db_conn.execute('ALTER TABLE food_list ADD COLUMN {} {}'.format(column, column_type))
+
+
+def init_db(db_name):
+    """
+    Create a new register db from DB_INIT_SCRIPT.
+    :param db_name: Path of the db file, must not exist yet
+    :return: Nothing
+    """
+    if os.path.exists(db_name):
+        raise FileExistsError(db_name)
+    db_conn = sqlite3.connect(db_name)
+    try:
+        with open(DB_INIT_SCRIPT, encoding='utf-8') as f:
+            db_conn.executescript(f.read())
+    finally:
+        db_conn.close()
+
+
+def rebuild_rollups(db_conn: sqlite3.Connection):
+    """
+    Recompute all rollup tables from the transactions.
+    :param db_conn: Open sqlite connection
+    :return: Nothing
+    """
+    db_conn.executescript('BEGIN;' + ROLLUP_REBUILD + 'COMMIT;')
+
+
+def get_terminal_id(db_conn: sqlite3.Connection) -> str:
+    """
+    :param db_conn: Open sqlite connection of a db passed through ensure_schema
+    :return: Id of the terminal owning the db, created once per db
+    """
+    return db_conn.execute("SELECT value FROM register_meta WHERE key='terminal_id'").fetchone()[0]
+
+
+def has_table(db_conn: sqlite3.Connection, table_name) -> bool:
+    """
+    :param db_conn: Open sqlite connection
+    :param table_name: Name of the table
+    :return: True if the table exists
+    """
+    row = db_conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table_name,)).fetchone()
+    return row is not None
+
+
+def schema_is_current(db_conn: sqlite3.Connection) -> bool:
+    """
+    :param db_conn: Open sqlite connection, may be read-only
+    :return: True if ensure_schema would not create any table or column the register reads
+    """
+    tables = ('transactions', 'transaction_items', 'sales_by_item', 'sales_by_hour', 'sales_by_day', 'register_meta',
+              'replication_outbox', 'stock', 'recipes')
+    columns = [row[1] for row in db_conn.execute('PRAGMA table_info(food_list)').fetchall()]
+    return all(has_table(db_conn, table) for table in tables) and all(c in columns for c in CatalogItem._fields)
+
+
+def migrate_tr_list(db_conn: sqlite3.Connection, drop_tr_list=False, chunk_size=1000) -> int:
+    """
+    Copy all rows of the wide tr_list table into transactions/transaction_items. The tr_id is kept,
+    rows that already exist in transactions are skipped, so the migration can be run repeatedly.
+    Historic unit prices are not stored in tr_list, the current food_list price is used. The custom
+    amounts (EB) of a sale are written as one line with the part of the bill not covered by articles.
+    :param db_conn: Open sqlite connection
+    :param drop_tr_list: Drop tr_list after a successful migration
+    :param chunk_size: Number of tr_list rows read per fetch
+    :return: Number of migrated transactions
+    """
+    ensure_schema(db_conn)
+    if not has_table(db_conn, 'tr_list'):
+        return 0
+
+    items = db_conn.execute('SELECT id, name_short, price FROM food_list').fetchall()
+    item_ids = {short_name: (item_id, to_cents(price)) for item_id, short_name, price in items}
+    columns = [row[1] for row in db_conn.execute('PRAGMA table_info(tr_list)').fetchall()]
+    item_columns = [c for c in columns if c in item_ids]
+
+    read_cursor = db_conn.cursor()
+    read_cursor.execute('SELECT tr_id, DATE, BILL, CASH, {} FROM tr_list ORDER BY tr_id'.format(
+        ','.join(item_columns)))
+
+    migrated = 0
+    with db_conn:
+        while True:
+            rows = read_cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            header_params = []
+            item_params = []
+            existing = set(r[0] for r in db_conn.execute('SELECT tr_id FROM transactions WHERE tr_id BETWEEN ? AND ?',
+                                                         (rows[0][0], rows[-1][0])))
+            for row in rows:
+                tr_id, date, bill, cash = row[:4]
+                if tr_id in existing:
+                    continue
+                ts = int(datetime.strptime(date, TR_LIST_DATE_FORMAT).timestamp())
+                bill_cents = to_cents(bill)
+                header_params.append((tr_id, ts, bill_cents, to_cents(cash)))
+
+                articles_cents = 0
+                for short_name, qty in zip(item_columns, row[4:]):
+                    if not qty or short_name == 'EB':
+                        continue
+                    item_id, price_cents = item_ids[short_name]
+                    item_params.append((tr_id, item_id, qty, price_cents))
+                    articles_cents += qty * price_cents
+                if 'EB' in item_columns and row[4 + item_columns.index('EB')]:
+                    item_params.append((tr_id, item_ids['EB'][0], 1, bill_cents - articles_cents))
+
+            db_conn.executemany('INSERT INTO transactions (tr_id, ts, bill_cents, cash_cents) VALUES (?,?,?,?)',
+                                header_params)
+            db_conn.executemany('INSERT INTO transaction_items (tr_id, item_id, qty, unit_price_cents) '
+                                'VALUES (?,?,?,?)', item_params)
+            db_conn.executemany('INSERT OR IGNORE INTO replication_outbox (tr_id) VALUES (?)',
+                                [p[:1] for p in header_params])
+            migrated += len(header_params)
+
+        if drop_tr_list:
+            db_conn.execute('DROP TABLE tr_list')
+    if migrated:
+        rebuild_rollups(db_conn)
+    return migrated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migrate tr_list of register dbs to the transaction tables')
+    parser.add_argument('db_files', nargs='+', help='db files to migrate')
+    parser.add_argument('--drop-tr-list', action='store_true', help='drop tr_list after migration')
+    args = parser.parse_args(argv)
+
+    for db_file in args.db_files:
+        db_conn = sqlite3.connect(db_file)
+        try:
+            count = migrate_tr_list(db_conn, drop_tr_list=args.drop_tr_list)
+        finally:
+            db_conn.close()
+        print('{}: {} transactions migrated'.format(db_file, count))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
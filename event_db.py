@@ -0,0 +1,285 @@
+"""
+One register db per event day, online backups while selling and reports across many event dbs.
+
+Event dbs are named <prefix>-<event>.db in an event directory, the event defaults to the event day
+(a day starts at EVENT_DAY_START_HOUR, so sales after midnight still count to the evening before).
+A new event db gets the articles of a template db with all counters reset, so every event starts
+from zero and article ids stay the same across events. All event dbs of a register share the terminal
+id of the template, and the transaction ids of a new event db start above those of the event dbs
+before it, so the aggregator sees one terminal whose sales never share an id. A register running through the night
+rotates to the db of the new event day once the day changes, see TouchRegisterUI.check_event_day.
+
+BackupThread copies the db with the sqlite online backup API in small page steps, sales continue
+while it runs. season_report() sums up many event dbs, one worker process per db.
+
+Usage:
+    python event_db.py report events/*.db [--processes 4]
+    python event_db.py backup touchReg.db /media/usb/kasse
+"""
+import os
+import sys
+import glob
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from multiprocessing import Pool
+from db_schema import init_db, has_table, ensure_schema, get_terminal_id
+from kasse_core import format_cents, connect_read_only
+
+EVENT_DB_PREFIX = 'touchReg'
+EVENT_DAY_START_HOUR = 6
+BACKUP_INTERVAL = 300
+BACKUP_PAGES_PER_STEP = 64
+BACKUP_STEP_SLEEP = 0.01
+
+
+def event_day(now: datetime = None) -> str:
+    """
+    :param now: Time, now if not given
+    :return: Event day as 'YYYY-MM-DD', changing at EVENT_DAY_START_HOUR instead of midnight
+    """
+    now = now or datetime.now()
+    return (now - timedelta(hours=EVENT_DAY_START_HOUR)).strftime('%Y-%m-%d')
+
+
+def event_db_name(event_dir, event=None) -> str:
+    """
+    :param event_dir: Directory of the event dbs
+    :param event: Name of the event, the event day if not given
+    :return: Path of the event db
+    """
+    return os.path.join(event_dir, '{}-{}.db'.format(EVENT_DB_PREFIX, event or event_day()))
+
+
+def last_tr_id(db_files: list) -> int:
+    """
+    :param db_files: Paths of register dbs, opened read-only
+    :return: Highest transaction id ever used in any of the dbs, 0 if none
+    """
+    last = 0
+    for db_file in db_files:
+        db_conn = connect_read_only(db_file, timeout=5.0)
+        try:
+            if has_table(db_conn, 'transactions'):
+                last = max(last, db_conn.execute('SELECT ifnull(max(tr_id), 0) FROM transactions').fetchone()[0])
+            if has_table(db_conn, 'sqlite_sequence'):
+                row = db_conn.execute("SELECT seq FROM sqlite_sequence WHERE name='transactions'").fetchone()
+                last = max(last, row[0] if row is not None else 0)
+        finally:
+            db_conn.close()
+    return last
+
+
+def create_event_db(db_name, template_db, first_tr_id=1):
+    """
+    Create an event db with the articles of a template db, sold counters and custom sum (EB) reset.
+    The recipes and the stock levels of the template are copied as the stock the event starts with,
+    the terminal id of the template is kept.
+    :param db_name: Path of the new db, must not exist yet
+    :param template_db: Register db whose food_list, stock, recipes and terminal id are copied
+    :param first_tr_id: Id of the first transaction of the new db
+    :return: Nothing
+    """
+    template_conn = sqlite3.connect(template_db)
+    try:
+        ensure_schema(template_conn)
+        terminal_id = get_terminal_id(template_conn)
+        articles = template_conn.execute('SELECT id, name, name_short, price, plu, barcode, category, position, color '
+                                         'FROM food_list').fetchall()
+        stock = template_conn.execute('SELECT component, qty, warn_below FROM stock').fetchall()
+        recipes = template_conn.execute('SELECT item_id, component, qty FROM recipes').fetchall()
+    finally:
+        template_conn.close()
+
+    if os.path.exists(db_name):
+        raise FileExistsError(db_name)
+    # built next to the target and renamed when complete, a crash never leaves a half built event db
+    partial = db_name + '.partial'
+    if os.path.exists(partial):
+        os.remove(partial)  # left over from a crash while building
+    init_db(partial)
+    db_conn = sqlite3.connect(partial)
+    try:
+        with db_conn:
+            db_conn.execute('DELETE FROM food_list')
+            # EB keeps its one sold item, its price is the sum of the custom amounts of the event
+            db_conn.executemany('INSERT INTO food_list (id, name, name_short, price, sold, plu, barcode, category, '
+                                'position, color) VALUES (?,?,?,?,?,?,?,?,?,?)',
+                                [(item_id, name, short_name, 0 if short_name == 'EB' else price,
+                                  1 if short_name == 'EB' else 0) + tuple(layout)
+                                 for item_id, name, short_name, price, *layout in articles])
+            db_conn.executemany('INSERT INTO stock (component, qty, warn_below) VALUES (?,?,?)', stock)
+            db_conn.executemany('INSERT INTO recipes (item_id, component, qty) VALUES (?,?,?)', recipes)
+            db_conn.execute("INSERT INTO register_meta (key, value) VALUES ('terminal_id', ?)", (terminal_id,))
+            db_conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('transactions', ?)", (first_tr_id - 1,))
+    finally:
+        db_conn.close()
+    os.replace(partial, db_name)
+
+
+def open_event_db(event_dir, template_db, event=None) -> str:
+    """
+    Rotate to the db of the current event, creating it from the template on first use.
+    :param event_dir: Directory of the event dbs, created if missing
+    :param template_db: Register db whose articles a new event db starts with
+    :param event: Name of the event, the event day if not given
+    :return: Path of the event db
+    """
+    os.makedirs(event_dir, exist_ok=True)
+    db_name = event_db_name(event_dir, event)
+    if not os.path.exists(db_name):
+        earlier = glob.glob(os.path.join(glob.escape(event_dir), EVENT_DB_PREFIX + '-*.db')) + [template_db]
+        create_event_db(db_name, template_db, first_tr_id=last_tr_id(earlier) + 1)
+    return db_name
+
+
+def backup_db(db_name, target_dir, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP) -> str:
+    """
+    Copy a db with the online backup API. The copy is written next to the target and renamed when
+    complete, so the target always holds a complete backup.
+    :param db_name: Path of the db
+    :param target_dir: Directory of the backup, e.g. on a USB stick
+    :param pages: Pages copied per step, the db is only locked during a step
+    :param sleep: Seconds between two steps
+    :return: Path of the backup
+    """
+    target = os.path.join(target_dir, os.path.basename(db_name))
+    partial = target + '.partial'
+    src_conn = sqlite3.connect(db_name)
+    try:
+        dst_conn = sqlite3.connect(partial)
+        try:
+            src_conn.backup(dst_conn, pages=pages, sleep=sleep)
+        finally:
+            dst_conn.close()
+    finally:
+        src_conn.close()
+    os.replace(partial, target)
+    return target
+
+
+class BackupThread(threading.Thread):
+    """Backs up a db every interval seconds, also once right after the start"""
+
+    def __init__(self, db_name, target_dir, interval=BACKUP_INTERVAL):
+        super(BackupThread, self).__init__(name='BackupThread', daemon=True)
+        self._db_name = db_name
+        self._target_dir = target_dir
+        self._interval = interval
+        self._stopping = threading.Event()
+        self.last_backup = None
+        self.last_error = None
+
+    def run(self):
+        while True:
+            if os.path.isdir(self._target_dir):
+                try:
+                    backup_db(self._db_name, self._target_dir)
+                    self.last_backup = time.time()
+                    self.last_error = None
+                except (OSError, sqlite3.Error) as e:
+                    self.last_error = repr(e)
+            else:
+                self.last_error = 'backup dir missing: {}'.format(self._target_dir)
+            if self._stopping.wait(self._interval):
+                break
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.join(timeout)
+
+
+def event_totals(db_name) -> dict:
+    """
+    Totals of one event db, opened read-only. Uses the rollup tables if the db has them.
+    :param db_name: Path of the event db
+    :return: Dict with 'db', 'transactions', 'bill_cents', 'cash_cents', 'first_ts', 'last_ts'
+             and 'items' (dict of short name -> [name, qty, amount_cents])
+    """
+    db_conn = connect_read_only(db_name, timeout=5.0)
+    try:
+        transactions, bill_cents, cash_cents, first_ts, last_ts = db_conn.execute(
+            'SELECT count(*), ifnull(sum(bill_cents), 0), ifnull(sum(cash_cents), 0), min(ts), max(ts) '
+            'FROM transactions').fetchone()
+        if has_table(db_conn, 'sales_by_item'):
+            rows = db_conn.execute('SELECT f.name_short, f.name, r.qty, r.amount_cents FROM sales_by_item r '
+                                   'JOIN food_list f ON f.id = r.item_id').fetchall()
+        else:
+            rows = db_conn.execute('SELECT f.name_short, f.name, sum(i.qty), sum(i.qty * i.unit_price_cents) '
+                                   'FROM transaction_items i JOIN food_list f ON f.id = i.item_id '
+                                   'GROUP BY i.item_id').fetchall()
+    finally:
+        db_conn.close()
+    return {
+        'db': db_name,
+        'transactions': transactions,
+        'bill_cents': bill_cents,
+        'cash_cents': cash_cents,
+        'first_ts': first_ts,
+        'last_ts': last_ts,
+        'items': {short_name: [name, qty, amount] for short_name, name, qty, amount in rows}
+    }
+
+
+def season_report(db_files: list, processes=None) -> dict:
+    """
+    Sum up many event dbs, each one is read in its own worker process.
+    :param db_files: Paths of the event dbs
+    :param processes: Number of worker processes, the number of cpus if not given
+    :return: Dict with 'events' (list of event_totals() results, in the order of db_files) and
+             'items' (OrderedDict of short name -> [name, qty, amount_cents] over all events)
+             and the summed 'transactions', 'bill_cents' and 'cash_cents'
+    """
+    if len(db_files) > 1 and processes != 1:
+        with Pool(processes) as pool:
+            events = pool.map(event_totals, db_files)
+    else:
+        events = [event_totals(db_file) for db_file in db_files]
+
+    items = OrderedDict()
+    for event in events:
+        for short_name, (name, qty, amount) in event['items'].items():
+            total = items.setdefault(short_name, [name, 0, 0])
+            total[1] += qty
+            total[2] += amount
+    return {
+        'events': events,
+        'items': items,
+        'transactions': sum(e['transactions'] for e in events),
+        'bill_cents': sum(e['bill_cents'] for e in events),
+        'cash_cents': sum(e['cash_cents'] for e in events)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Event dbs: season report and backup')
+    commands = parser.add_subparsers(dest='command', required=True)
+    report_parser = commands.add_parser('report', help='totals over many event dbs')
+    report_parser.add_argument('db_files', nargs='+')
+    report_parser.add_argument('--processes', type=int)
+    backup_parser = commands.add_parser('backup', help='online backup of a db')
+    backup_parser.add_argument('db_file')
+    backup_parser.add_argument('target_dir')
+    args = parser.parse_args(argv)
+
+    if args.command == 'backup':
+        print(backup_db(args.db_file, args.target_dir))
+        return 0
+
+    report = season_report(args.db_files, processes=args.processes)
+    for event in report['events']:
+        print('{:40} {:6d} Verkäufe  Umsatz {:>10}€'.format(os.path.basename(event['db']), event['transactions'],
+                                                           format_cents(event['bill_cents'])))
+    print()
+    for short_name, (name, qty, amount) in report['items'].items():
+        print('{:8} {:30} {:7d} {:>10}€'.format(short_name, name, qty, format_cents(amount)))
+    print('{} Verkäufe, Umsatz {}€, erhalten {}€'.format(report['transactions'], format_cents(report['bill_cents']),
+                                                       format_cents(report['cash_cents'])))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
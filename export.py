@@ -0,0 +1,283 @@
+"""
+Export of the sales of a register db to CSV and to a compressed columnar archive, with a daily
+Z-report computed in the same pass.
+
+The sales are streamed from DBAccess.iter_transaction_lines, every output only holds the current
+sale, so memory stays the same for one day or for a whole season. The db is opened read-only, so
+the export can run next to a register that is selling; its schema must be up to date (db_schema.py).
+
+The columnar archive is a zip file with one zlib compressed file of native int64 values per
+column, written in two tables: 'transactions' (tr_id, ts, bill_cents, cash_cents) and 'lines'
+(tr_id, item_id, qty, unit_price_cents). catalog.csv holds the articles and manifest.json the
+columns and row counts. read_archive_column() reads a column back.
+
+Usage:
+    python export.py touchReg.db [--csv sales.csv] [--archive sales.zip] [--catalog catalog.csv]
+                     [--zreport zreport.csv] [--from 2026-06-01] [--to 2026-06-30] [--item KK]
+"""
+import io
+import os
+import sys
+import csv
+import json
+import zlib
+import array
+import shutil
+import sqlite3
+import zipfile
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from itertools import groupby
+from collections import OrderedDict
+from db_schema import to_cents
+from kasse_core import DBAccess, format_cents
+
+ARCHIVE_FORMAT_VERSION = 1
+ARCHIVE_TABLES = OrderedDict([
+    ('transactions', ('tr_id', 'ts', 'bill_cents', 'cash_cents')),
+    ('lines', ('tr_id', 'item_id', 'qty', 'unit_price_cents')),
+])
+CSV_HEADER = ['tr_id', 'datum', 'bill', 'cash', 'artikel', 'name', 'menge', 'einzelpreis', 'betrag']
+ZREPORT_HEADER = ['datum', 'verkaeufe', 'umsatz', 'eigenbetrag', 'erhalten', 'rueckgeld']
+
+
+class CsvSink:
+    """One CSV row per sold line, a sale without lines gets one row without article"""
+
+    def __init__(self, file_name, catalog_by_id: dict):
+        self._file = open(file_name, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(CSV_HEADER)
+        self._catalog_by_id = catalog_by_id
+
+    def add_transaction(self, tr_id, ts, bill_cents, cash_cents, lines: list):
+        date = datetime.fromtimestamp(ts).isoformat(sep=' ')
+        bill = format_cents(bill_cents)
+        cash = format_cents(cash_cents)
+        if not lines:
+            self._writer.writerow([tr_id, date, bill, cash, '', '', '', '', ''])
+        for item_id, qty, unit_price_cents in lines:
+            item = self._catalog_by_id.get(item_id)
+            self._writer.writerow([tr_id, date, bill, cash,
+                                   item.name_short if item else item_id, item.name if item else '',
+                                   qty, format_cents(unit_price_cents), format_cents(qty * unit_price_cents)])
+
+    def close(self):
+        self._file.close()
+
+
+class ColumnarSink:
+    """
+    Collects every column in a small array buffer, compresses full buffers into a temp file per
+    column and packs the compressed columns into a zip file on close.
+    """
+    BUFFER_ROWS = 8192
+
+    def __init__(self, file_name, catalog: OrderedDict):
+        self._file_name = file_name
+        self._catalog = catalog
+        self._tmp_dir = tempfile.mkdtemp(prefix='kasse_export_')
+        self._columns = {}
+        for table, columns in ARCHIVE_TABLES.items():
+            for column in columns:
+                self._columns[(table, column)] = [array.array('q'), zlib.compressobj(6),
+                                                  open(os.path.join(self._tmp_dir, table + '.' + column), 'wb')]
+        self._rows = dict.fromkeys(ARCHIVE_TABLES, 0)
+
+    def _append(self, table, values):
+        for column, value in zip(ARCHIVE_TABLES[table], values):
+            column_buffer = self._columns[(table, column)]
+            column_buffer[0].append(value)
+            if len(column_buffer[0]) >= self.BUFFER_ROWS:
+                self._flush(column_buffer)
+        self._rows[table] += 1
+
+    @staticmethod
+    def _flush(column_buffer):
+        values, compressor, f = column_buffer
+        f.write(compressor.compress(values.tobytes()))
+        del values[:]
+
+    def add_transaction(self, tr_id, ts, bill_cents, cash_cents, lines: list):
+        self._append('transactions', (tr_id, ts, bill_cents, cash_cents))
+        for item_id, qty, unit_price_cents in lines:
+            self._append('lines', (tr_id, item_id, qty, unit_price_cents))
+
+    def close(self):
+        try:
+            for column_buffer in self._columns.values():
+                self._flush(column_buffer)
+                column_buffer[2].write(column_buffer[1].flush())
+                column_buffer[2].close()
+            manifest = {
+                'version': ARCHIVE_FORMAT_VERSION,
+                'byteorder': sys.byteorder,
+                'dtype': 'int64',
+                'compression': 'zlib',
+                'tables': {table: {'rows': self._rows[table], 'columns': list(columns)}
+                           for table, columns in ARCHIVE_TABLES.items()}
+            }
+            with zipfile.ZipFile(self._file_name, 'w', zipfile.ZIP_STORED) as archive:
+                archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+                archive.writestr('catalog.csv', catalog_csv_text(self._catalog), zipfile.ZIP_DEFLATED)
+                for table, column in self._columns:
+                    archive.write(os.path.join(self._tmp_dir, table + '.' + column),
+                                  '{}/{}.zlib'.format(table, column))
+        finally:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+
+class ZReport:
+    """Totals per local day: sales, turnover, custom amounts (EB), cash received and change given"""
+
+    def __init__(self, custom_item_id=None):
+        self._custom_item_id = custom_item_id
+        self.days = OrderedDict()
+
+    def add_transaction(self, tr_id, ts, bill_cents, cash_cents, lines: list):
+        day = datetime.fromtimestamp(ts).strftime('%Y-%m-%d')
+        totals = self.days.get(day)
+        if totals is None:
+            totals = self.days[day] = [0, 0, 0, 0]
+        totals[0] += 1
+        totals[1] += bill_cents
+        totals[2] += sum(qty * unit_price_cents for item_id, qty, unit_price_cents in lines
+                         if item_id == self._custom_item_id)
+        totals[3] += cash_cents
+
+    def get_rows(self) -> list:
+        """
+        :return: List of (day, transactions, bill_cents, custom_cents, cash_cents, change_cents)
+        """
+        return [(day, count, bill, custom, cash, cash - bill) for day, (count, bill, custom, cash) in self.days.items()]
+
+    def write_csv(self, file_name):
+        with open(file_name, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(ZREPORT_HEADER)
+            for day, count, bill, custom, cash, change in self.get_rows():
+                writer.writerow([day, count, format_cents(bill), format_cents(custom), format_cents(cash),
+                                 format_cents(change)])
+
+    def close(self):
+        pass
+
+
+def catalog_csv_text(catalog: OrderedDict) -> str:
+    """
+    :param catalog: Catalog of DBAccess
+    :return: CSV text with the articles, prices in euro
+    """
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(['id', 'name_short', 'name', 'price', 'sold', 'category'])
+    for item in catalog.values():
+        writer.writerow([item.id, item.name_short, item.name, format_cents(to_cents(item.price)), item.sold,
+                         item.category or ''])
+    return text.getvalue()
+
+
+def export(db: DBAccess, sinks: list, ts_from=None, ts_to=None, item_short_name=None) -> int:
+    """
+    Stream the sales once and hand every sale to all sinks.
+    :param db: Register db
+    :param sinks: Objects with add_transaction(tr_id, ts, bill_cents, cash_cents, lines) and close()
+    :param ts_from: Unix time, inclusive lower bound
+    :param ts_to: Unix time, exclusive upper bound
+    :param item_short_name: Only sales containing this article
+    :return: Number of exported sales
+    """
+    count = 0
+    rows = db.iter_transaction_lines(ts_from=ts_from, ts_to=ts_to, item_short_name=item_short_name)
+    try:
+        for header, tr_rows in groupby(rows, key=lambda r: r[:4]):
+            lines = [r[4:] for r in tr_rows if r[4] is not None]
+            for sink in sinks:
+                sink.add_transaction(*header, lines)
+            count += 1
+    finally:
+        rows.close()
+        for sink in sinks:
+            sink.close()
+    return count
+
+
+def read_archive_column(file_name, table, column) -> array.array:
+    """
+    :param file_name: Archive written by ColumnarSink
+    :param table: 'transactions' or 'lines'
+    :param column: Column of the table, see ARCHIVE_TABLES
+    :return: Values of the column
+    """
+    with zipfile.ZipFile(file_name) as archive:
+        manifest = json.loads(archive.read('manifest.json'))
+        values = array.array('q', zlib.decompress(archive.read('{}/{}.zlib'.format(table, column))))
+    if manifest['byteorder'] != sys.byteorder:
+        values.byteswap()
+    return values
+
+
+def day_start(date_text) -> int:
+    """
+    :param date_text: Local date as 'YYYY-MM-DD'
+    :return: Unix time of the start of the day
+    """
+    return int(datetime.strptime(date_text, '%Y-%m-%d').timestamp())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the sales of a register db')
+    parser.add_argument('db_file')
+    parser.add_argument('--csv', help='one row per sold line')
+    parser.add_argument('--archive', help='compressed columnar zip archive')
+    parser.add_argument('--catalog', help='articles as CSV')
+    parser.add_argument('--zreport', help='totals per day as CSV, printed if no file is given',
+                        nargs='?', const='-')
+    parser.add_argument('--from', dest='date_from', help='first day, YYYY-MM-DD')
+    parser.add_argument('--to', dest='date_to', help='last day, YYYY-MM-DD')
+    parser.add_argument('--item', help='only sales containing this article (short name)')
+    args = parser.parse_args(argv)
+
+    try:
+        db = DBAccess(args.db_file, read_pool_size=1, read_only=True)
+    except sqlite3.Error as e:
+        parser.error(str(e))
+    try:
+        catalog = db.get_catalog()
+        if args.item is not None and args.item not in catalog:
+            parser.error('unknown article {!r}, known are: {}'.format(args.item, ', '.join(catalog)))
+        if args.catalog:
+            with open(args.catalog, 'w', encoding='utf-8') as f:
+                f.write(catalog_csv_text(catalog))
+
+        sinks = []
+        if args.csv:
+            sinks.append(CsvSink(args.csv, {item.id: item for item in catalog.values()}))
+        if args.archive:
+            sinks.append(ColumnarSink(args.archive, catalog))
+        zreport = ZReport(custom_item_id=catalog['EB'].id if 'EB' in catalog else None)
+        if args.zreport:
+            sinks.append(zreport)
+        if not sinks:
+            return 0
+
+        ts_from = day_start(args.date_from) if args.date_from else None
+        ts_to = None
+        if args.date_to:
+            ts_to = int((datetime.strptime(args.date_to, '%Y-%m-%d') + timedelta(days=1)).timestamp())
+        count = export(db, sinks, ts_from=ts_from, ts_to=ts_to, item_short_name=args.item)
+    finally:
+        db.close()
+
+    if args.zreport == '-':
+        for day, transactions, bill, custom, cash, change in zreport.get_rows():
+            print('{}  {:5d} Verkäufe  Umsatz {:>10}€  EB {:>8}€  erhalten {:>10}€  Rückgeld {:>9}€'.format(
+                day, transactions, format_cents(bill), format_cents(custom), format_cents(cash), format_cents(change)))
+    elif args.zreport:
+        zreport.write_csv(args.zreport)
+    print('{} sales exported'.format(count), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Layout of the food buttons: one tab per category, every tab has one or more pages of a fixed grid.
+
+An article with a position takes that slot of its category (counted from 1 over all pages of the
+category, so position 25 on a 3x6 grid is the 7th button of the second page). Articles without a
+position, or whose slot is taken, fill the free slots in the order of their ids. Articles without
+a category share the tab DEFAULT_CATEGORY. The layout is computed without any widget, the UI builds
+the buttons of a page on its first visit.
+"""
+import itertools
+from collections import OrderedDict
+
+FOOD_GRID_COLUMNS = 3
+FOOD_GRID_ROWS = 6
+DEFAULT_CATEGORY = 'Artikel'
+
+
+def food_pages(catalog: OrderedDict, columns=FOOD_GRID_COLUMNS, rows=FOOD_GRID_ROWS) -> OrderedDict:
+    """
+    :param catalog: Catalog of DBAccess, articles without a name (EB) get no button
+    :param columns: Buttons per row
+    :param rows: Rows per page
+    :return: OrderedDict of (category, page number from 0) -> list of (row, column, CatalogItem), the
+             categories in the order of their first article, the buttons of a page in slot order
+    """
+    per_page = columns * rows
+    categories = OrderedDict()
+    for item in catalog.values():
+        if item.name != '':
+            categories.setdefault(item.category or DEFAULT_CATEGORY, []).append(item)
+
+    pages = OrderedDict()
+    for category, items in categories.items():
+        slots = {}
+        unplaced = []
+        for item in sorted(items, key=lambda i: (i.position is None, i.position or 0, i.id)):
+            if item.position is not None and item.position >= 1 and item.position - 1 not in slots:
+                slots[item.position - 1] = item
+            else:
+                unplaced.append(item)
+        free_slots = (slot for slot in itertools.count() if slot not in slots)
+        for item in unplaced:
+            slots[next(free_slots)] = item
+        for page in range(max(slots) // per_page + 1):
+            pages[(category, page)] = []
+        for slot in sorted(slots):
+            pages[(category, slot // per_page)].append((slot % per_page // columns, slot % columns, slots[slot]))
+    return pages
+
+
+def page_count(pages: OrderedDict, category) -> int:
+    """
+    :param pages: Result of food_pages()
+    :param category: Name of a category
+    :return: Number of pages of the category
+    """
+    return sum(1 for page_category, _ in pages if page_category == category)
+
+
+def placement(pages: OrderedDict, key) -> list:
+    """
+    :param pages: Result of food_pages()
+    :param key: (category, page number)
+    :return: List of (row, column, short name) of the page, empty if there is no such page
+    """
+    return [(row, column, item.name_short) for row, column, item in pages.get(key, ())]
@@ -0,0 +1,275 @@
+"""
+Opt-in timing of the register hot paths and sampling of its memory use.
+
+Instrumentation keeps the most recent durations of every measured function in a ring buffer
+(a deque with maxlen, appending is cheap and thread safe) and writes their statistics to a
+rotating log file. Functions are measured by replacing them with timing wrappers on the instance,
+which only happens when instrumentation is switched on, so a register started without it runs the
+unchanged code.
+
+ResourceSampler takes a sample of the resident set size, the number of Python objects, the Python
+memory traced by tracemalloc (if it was started) and the live Tk widgets, canvas items and Tcl
+commands. A register running for a whole weekend must keep these flat; growth shows up in the log
+and on the diagnostics screen long before the register gets sluggish.
+"""
+import gc
+import time
+import logging
+import logging.handlers
+import tracemalloc
+from functools import wraps
+from collections import OrderedDict, deque
+from kasse_core import latency_stats
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+INSTRUMENTATION_LOG = 'kasse_diag.log'
+"""Seconds between two resource samples of the register"""
+RESOURCE_SAMPLE_INTERVAL = 60
+
+"""DBAccess methods measured when a DBAccess object is instrumented"""
+DB_METHODS = ('get_catalog', 'db_get', 'db_update_sold', 'db_update_custom_sum', 'db_checkout', 'db_get_item_rollup',
+              'db_get_hour_rollup', 'db_get_day_rollup', 'db_get_transactions', 'db_get_transaction_items')
+
+
+class Instrumentation:
+
+    def __init__(self, ring_size=1024, log_file=INSTRUMENTATION_LOG, max_bytes=1024 * 1024, backup_count=3):
+        """
+        :param ring_size: Number of durations kept per measured function
+        :param log_file: Path of the rotating log, no log if None
+        :param max_bytes: Size at which the log is rotated
+        :param backup_count: Number of rotated logs kept
+        """
+        self._ring_size = ring_size
+        self._rings = OrderedDict()
+        self._counts = {}
+        self._read_pools = OrderedDict()
+        self._logger = None
+        if log_file is not None:
+            self._logger = logging.getLogger('kasse.instrumentation')
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                                           encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self._logger.addHandler(handler)
+
+    def _ring(self, name) -> deque:
+        ring = self._rings.get(name)
+        if ring is None:
+            ring = self._rings[name] = deque(maxlen=self._ring_size)
+            self._counts[name] = 0
+        return ring
+
+    def record(self, name, seconds):
+        """
+        :param name: Name of the measurement
+        :param seconds: Duration or lag in seconds
+        :return: Nothing
+        """
+        self._ring(name).append(seconds)
+        self._counts[name] += 1
+
+    def wrap(self, name, func):
+        """
+        :param name: Name the durations are recorded under
+        :param func: Function to measure
+        :return: Function recording the duration of every call of func, also if it raises
+        """
+        ring = self._ring(name)
+        counts = self._counts
+        perf_counter = time.perf_counter
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            t_start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                ring.append(perf_counter() - t_start)
+                counts[name] += 1
+
+        return timed
+
+    def wrap_methods(self, obj, method_names, prefix):
+        """
+        Replace methods of one object by measured ones. Callbacks bound before this call keep the
+        unmeasured method, so call it before widgets or threads take references.
+        :param obj: Object whose methods are measured
+        :param method_names: Names of the methods
+        :param prefix: Prefix of the measurement names, e.g. 'ui'
+        :return: Nothing
+        """
+        for method_name in method_names:
+            setattr(obj, method_name, self.wrap('{}.{}'.format(prefix, method_name), getattr(obj, method_name)))
+
+    def wrap_db(self, db, prefix='db'):
+        """
+        Measure the DB_METHODS of a DBAccess object.
+        :param db: DBAccess object
+        :param prefix: Prefix of the measurement names
+        :return: Nothing
+        """
+        self.wrap_methods(db, DB_METHODS, prefix)
+
+    def watch_read_pool(self, pool, prefix='read_pool'):
+        """
+        Report the lock waits of a ReadPool along with the measurements.
+        :param pool: ReadPool of a DBAccess object
+        :param prefix: Prefix of the measurement names
+        :return: Nothing
+        """
+        self._read_pools[prefix] = pool
+
+    def get_stats(self) -> OrderedDict:
+        """
+        :return: Dict of measurement name -> latency stats of the ring buffer plus 'total' (calls
+                 since start), names in order of first use. Watched read pools add
+                 '<prefix>.acquire_wait' (total: queries) and '<prefix>.busy_wait' (total: busy retries)
+        """
+        stats = OrderedDict()
+        for name, ring in list(self._rings.items()):
+            stats[name] = latency_stats(list(ring))
+            stats[name]['total'] = self._counts[name]
+        for prefix, pool in self._read_pools.items():
+            pool_stats = pool.get_stats()
+            stats[prefix + '.acquire_wait'] = dict(pool_stats['acquire_wait'], total=pool_stats['queries'])
+            stats[prefix + '.busy_wait'] = dict(pool_stats['busy_wait'], total=pool_stats['busy_retries'])
+        return stats
+
+    def log(self, message, *args):
+        """
+        Write a line to the log.
+        :param message: Format string, formatted with args only if the line is written
+        :return: Nothing
+        """
+        if self._logger is not None:
+            self._logger.info(message, *args)
+
+    def dump(self):
+        """
+        Write one line per measurement to the log.
+        :return: Nothing
+        """
+        if self._logger is None:
+            return
+        for name, stats in self.get_stats().items():
+            if stats['count'] == 0:
+                continue
+            self._logger.info('%s total=%d n=%d p50=%.2fms p95=%.2fms p99=%.2fms max=%.2fms', name, stats['total'],
+                              stats['count'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['max_ms'])
+
+
+def current_rss_kib() -> int:
+    """
+    :return: Resident set size of this process in KiB, the peak if the current one is unknown
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else 0
+
+
+def widget_stats(tk_root) -> dict:
+    """
+    :param tk_root: Tk root, or any widget whose subtree is counted
+    :return: Dict with 'widgets' (below tk_root), 'widget_depth', 'canvas_items' and 'tcl_commands'
+             (of the whole interpreter, every Python callback given to Tk registers one)
+    """
+    widgets = 0
+    depth = 0
+    canvas_items = 0
+    stack = [(tk_root, 0)]
+    while stack:
+        widget, level = stack.pop()
+        if widget.winfo_class() == 'Canvas':
+            canvas_items += len(widget.find_all())
+        for child in widget.winfo_children():
+            widgets += 1
+            depth = max(depth, level + 1)
+            stack.append((child, level + 1))
+    return {
+        'widgets': widgets,
+        'widget_depth': depth,
+        'canvas_items': canvas_items,
+        'tcl_commands': len(tk_root.tk.splitlist(tk_root.tk.call('info', 'commands')))
+    }
+
+
+class ResourceSampler:
+
+    def __init__(self, tk_root=None, instrumentation: Instrumentation = None, ring_size=1440, top_every=10,
+                 top_count=5):
+        """
+        :param tk_root: Tk root whose widgets are counted, no widget counts if None
+        :param instrumentation: Instrumentation logging the samples and timing sample(), optional
+        :param ring_size: Number of samples kept, a day at one sample per minute
+        :param top_every: Every top_every-th sample lists the code lines whose allocations grew most since
+                          the first sample, if tracemalloc is tracing
+        :param top_count: Number of code lines listed
+        """
+        self._tk_root = tk_root
+        self._instrumentation = instrumentation
+        self._samples = deque(maxlen=ring_size)
+        self._top_every = top_every
+        self._top_count = top_count
+        self._first = None
+        self._first_snapshot = None
+        self._taken = 0
+
+    def sample(self) -> dict:
+        """
+        Take a sample, log it and keep it. Costs a few milliseconds, plus the tracemalloc snapshot
+        every top_every-th sample.
+        :return: Sample dict with 'ts', 'rss_kib', 'python_objects', 'traced_kib' (None if tracemalloc
+                 is not tracing), the values of widget_stats() and 'top_growth' (list of (code line,
+                 KiB, blocks) or None)
+        """
+        t_start = time.perf_counter()
+        sample = OrderedDict([('ts', time.time()), ('rss_kib', current_rss_kib()),
+                              ('python_objects', len(gc.get_objects())), ('traced_kib', None)])
+        if self._tk_root is not None:
+            sample.update(widget_stats(self._tk_root))
+        sample['top_growth'] = None
+        if tracemalloc.is_tracing():
+            sample['traced_kib'] = tracemalloc.get_traced_memory()[0] // 1024
+            if self._first_snapshot is None:
+                self._first_snapshot = tracemalloc.take_snapshot()
+            elif self._taken % self._top_every == 0:
+                top = tracemalloc.take_snapshot().compare_to(self._first_snapshot, 'lineno')[:self._top_count]
+                sample['top_growth'] = [(str(stat.traceback), stat.size_diff // 1024, stat.count_diff)
+                                        for stat in top]
+        self._taken += 1
+        if self._first is None:
+            self._first = sample
+        self._samples.append(sample)
+
+        if self._instrumentation is not None:
+            self._instrumentation.record('resource.sample', time.perf_counter() - t_start)
+            self._instrumentation.log('resources %s', ' '.join('{}={}'.format(key, value)
+                                                               for key, value in sample.items()
+                                                               if key not in ('ts', 'top_growth')))
+            for line, size_kib, blocks in sample['top_growth'] or ():
+                self._instrumentation.log('resources growth %s %+d KiB %+d blocks', line, size_kib, blocks)
+        return sample
+
+    def get_samples(self) -> list:
+        return list(self._samples)
+
+    def growth(self) -> dict:
+        """
+        :return: Dict of value name -> change from the first to the last sample, for the numeric values
+        """
+        if not self._samples:
+            return {}
+        last = self._samples[-1]
+        return OrderedDict((key, last[key] - value) for key, value in self._first.items()
+                           if key != 'ts' and isinstance(value, int) and isinstance(last.get(key), int))
@@ -0,0 +1,1274 @@
+"""
+Register core: db access, catalog, cart, checkout and summary. Imports no tkinter, so it can be
+used from scripts, benchmarks and tests without a display.
+"""
+import os
+import queue
+import pathlib
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from db_schema import ensure_schema, schema_is_current, to_cents, CatalogItem, CATALOG_COLUMNS
+from replication import Replicator
+from cart_journal import CartJournal
+from catalog_watcher import CatalogWatcher
+from stock import StockLevels, read_stock
+
+"""
+SQLite durability profiles. 'safe' is the sqlite default (rollback journal, fsync on every commit),
+'balanced' uses WAL with synchronous=NORMAL (no fsync on commit, only on checkpoint; a power loss
+may lose the last sales but never corrupts the db), 'fast' does not fsync at all.
+"""
+DB_PROFILES = OrderedDict([
+    ('safe', {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'cache_size': -2000, 'mmap_size': 0}),
+    ('balanced', {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -8000,
+                  'mmap_size': 64 * 1024 * 1024}),
+    ('fast', {'journal_mode': 'WAL', 'synchronous': 'OFF', 'cache_size': -16000,
+              'mmap_size': 256 * 1024 * 1024}),
+])
+DB_DEFAULT_PROFILE = 'balanced'
+
+"""
+Read-only connections of a ReadPool. With a WAL profile readers never block the writer and the
+writer never blocks readers; SQLITE_BUSY can still show up briefly (e.g. while another process
+recovers the WAL), then the query is retried with a growing pause.
+"""
+READ_POOL_SIZE = 2
+READ_BUSY_TIMEOUT = 0.05
+READ_BUSY_RETRIES = 5
+READ_RETRY_PAUSE = 0.01
+
+
+def connect_read_only(db_name, timeout=READ_BUSY_TIMEOUT) -> sqlite3.Connection:
+    """
+    :param db_name: Path of the register db
+    :param timeout: Seconds sqlite waits for a lock before raising SQLITE_BUSY
+    :return: Connection that cannot write, usable from any thread (one at a time)
+    """
+    db_conn = sqlite3.connect(pathlib.Path(db_name).resolve().as_uri() + '?mode=ro', uri=True, timeout=timeout,
+                              check_same_thread=False)
+    db_conn.execute('PRAGMA query_only=1')
+    return db_conn
+
+
+def is_busy_error(error: sqlite3.OperationalError) -> bool:
+    """
+    :param error: Error raised by sqlite
+    :return: True if the db was locked by another connection (SQLITE_BUSY or SQLITE_LOCKED)
+    """
+    message = str(error)
+    return 'locked' in message or 'busy' in message
+
+
+class ReadPool:
+    """
+    Small pool of read-only connections for reports, so long queries never share a connection
+    with the checkout writes. Connections are opened on first use, at most size of them. The time
+    spent waiting for a free connection and the SQLITE_BUSY retries are counted, see get_stats().
+    """
+
+    def __init__(self, db_name, size=READ_POOL_SIZE, timeout=READ_BUSY_TIMEOUT, retries=READ_BUSY_RETRIES):
+        """
+        :param db_name: Path of the register db
+        :param size: Maximum number of connections
+        :param timeout: Seconds sqlite waits for a lock before a query is retried
+        :param retries: Retries of a query failing with SQLITE_BUSY before the error is raised
+        """
+        self._db_name = db_name
+        self._size = size
+        self._timeout = timeout
+        self._retries = retries
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=1000)
+        self._busy_waits = deque(maxlen=1000)
+        self.queries = 0
+        self.busy_retries = 0
+        self.busy_failures = 0
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self._size:
+                self._opened += 1
+                try:
+                    return connect_read_only(self._db_name, timeout=self._timeout)
+                except sqlite3.Error:
+                    self._opened -= 1
+                    raise
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection, it goes back to the pool when the with block ends.
+        :return: Context manager yielding a read-only sqlite connection
+        """
+        t_start = time.perf_counter()
+        db_conn = self._acquire()
+        self._waits.append(time.perf_counter() - t_start)
+        try:
+            yield db_conn
+        finally:
+            self._idle.put(db_conn)
+
+    def execute(self, cmd, params=()) -> list:
+        """
+        :param cmd: Sql query
+        :param params: Query parameters
+        :return: All result rows
+        """
+        with self.connection() as db_conn:
+            return self.retry(lambda: db_conn.execute(cmd, params).fetchall())
+
+    def retry(self, read):
+        """
+        Run a read, retrying it while the db is busy.
+        :param read: Function doing the read
+        :return: Result of read
+        """
+        self.queries += 1
+        t_start = time.perf_counter()
+        for attempt in range(self._retries + 1):
+            try:
+                result = read()
+                if attempt:
+                    self._busy_waits.append(time.perf_counter() - t_start)
+                return result
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e):
+                    raise
+                if attempt == self._retries:
+                    self.busy_failures += 1
+                    self._busy_waits.append(time.perf_counter() - t_start)
+                    raise
+                self.busy_retries += 1
+                time.sleep(READ_RETRY_PAUSE * 2 ** attempt)
+
+    def get_stats(self) -> dict:
+        """
+        :return: Dict with 'connections', 'queries', 'busy_retries', 'busy_failures', 'acquire_wait'
+                 (latency stats of waiting for a free connection) and 'busy_wait' (latency stats of
+                 the queries that had to be retried)
+        """
+        return {
+            'connections': self._opened,
+            'queries': self.queries,
+            'busy_retries': self.busy_retries,
+            'busy_failures': self.busy_failures,
+            'acquire_wait': latency_stats(list(self._waits)),
+            'busy_wait': latency_stats(list(self._busy_waits))
+        }
+
+    def close(self):
+        """
+        Close the connections not borrowed at the moment.
+        :return: Nothing
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class DBAccess:
+
+    def __init__(self, db_name, profile=DB_DEFAULT_PROFILE, read_pool_size=0, timeout=5.0, read_only=False):
+        """
+        :param db_name: Path of the register db
+        :param profile: Durability profile, see DB_PROFILES
+        :param read_pool_size: Connections of a ReadPool the report queries use, 0 to run them on the
+                               connection of this object
+        :param timeout: Seconds a write waits for the lock of another connection before SQLITE_BUSY
+        :param read_only: Open the db read-only, e.g. for reports next to a running register: no profile,
+                          index or schema changes, so the schema must be up to date already
+        """
+        self._db_name = db_name
+        self._catalog = None
+        self._sql_cache = {}
+        self._commit_latencies = deque(maxlen=1000)
+        if read_only:
+            self._db_conn = connect_read_only(self._db_name, timeout=timeout)
+            self._cursor = self._db_conn.cursor()
+            self._profile = None
+            if not schema_is_current(self._db_conn):
+                self._db_conn.close()
+                raise sqlite3.OperationalError('schema of {} is not up to date, run python db_schema.py {} '
+                                               'first'.format(db_name, db_name))
+        else:
+            self._db_conn = sqlite3.connect(self._db_name, timeout=timeout)
+            self._cursor = self._db_conn.cursor()
+            self.apply_profile(profile)
+            self._db_conn.execute('CREATE INDEX IF NOT EXISTS food_list_name_short ON food_list (name_short)')
+            self._db_conn.commit()
+            ensure_schema(self._db_conn)
+        self.read_pool = ReadPool(db_name, size=read_pool_size) if read_pool_size > 0 else None
+
+    def _read(self, cmd, params=()) -> list:
+        """
+        :param cmd: Sql query
+        :param params: Query parameters
+        :return: All result rows, read through the read pool if there is one
+        """
+        if self.read_pool is not None:
+            return self.read_pool.execute(cmd, params)
+        self._cursor.execute(cmd, params)
+        return self._cursor.fetchall()
+
+    def _sql(self, template, **kwargs) -> str:
+        """
+        Format a sql template once and keep the result, so hot paths do not format the same
+        command string again on every call.
+        :param template: Command template with format placeholders
+        :param kwargs: Values for the placeholders
+        :return: Formatted sql command
+        """
+        key = (template, tuple(sorted(kwargs.items())))
+        cmd = self._sql_cache.get(key)
+        if cmd is None:
+            cmd = template.format(**kwargs)
+            self._sql_cache[key] = cmd
+        return cmd
+
+    def get_catalog(self) -> OrderedDict:
+        """
+        In-memory copy of food_list, loaded on first use and kept in sync by the write methods
+        of this class. Changes made to food_list from outside need a call to invalidate_catalog().
+        :return: OrderedDict of short name -> CatalogItem, in db order
+        """
+        if self._catalog is None:
+            self._cursor.execute('SELECT {} FROM food_list ORDER BY id'.format(CATALOG_COLUMNS))
+            self._catalog = OrderedDict((row[2], CatalogItem(*row)) for row in self._cursor.fetchall())
+        return self._catalog
+
+    def get_stock(self) -> StockLevels:
+        """
+        :return: Stock levels and recipes as stored in the db now
+        """
+        return read_stock(self._db_conn)
+
+    def get_catalog_item(self, item_short_name) -> CatalogItem:
+        """
+        :param item_short_name: Short name of the item
+        :return: Cached catalog entry of the item
+        """
+        return self.get_catalog()[item_short_name]
+
+    def invalidate_catalog(self):
+        """
+        Drop the in-memory catalog, it is reloaded from the db on next access.
+        :return: Nothing
+        """
+        self._catalog = None
+
+    def apply_catalog_changes(self, items: list, removed: list = ()):
+        """
+        Apply articles changed outside of this connection to the in-memory catalog, in place, so
+        references to the catalog stay valid. The sold counters of known articles are kept.
+        :param items: Changed or new CatalogItem objects
+        :param removed: Short names of deleted articles
+        :return: Nothing
+        """
+        catalog = self.get_catalog()
+        for item in items:
+            if item.name_short in catalog:
+                catalog[item.name_short] = item._replace(sold=catalog[item.name_short].sold)
+            else:
+                catalog[item.name_short] = item
+        for short_name in removed:
+            catalog.pop(short_name, None)
+
+    def _catalog_update(self, item_short_name, **fields):
+        if self._catalog is not None and item_short_name in self._catalog:
+            self._catalog[item_short_name] = self._catalog[item_short_name]._replace(**fields)
+
+    def apply_profile(self, profile):
+        """
+        Set the sqlite pragmas of a durability profile on the open connection.
+        :param profile: Name of the profile in DB_PROFILES
+        :return: Nothing
+        """
+        if profile not in DB_PROFILES:
+            raise ValueError('Unknown db profile: {}'.format(profile))
+        for pragma, value in DB_PROFILES[profile].items():
+            self._db_conn.execute('PRAGMA {pragma}={value}'.format(pragma=pragma, value=value))
+        self._profile = profile
+
+    def get_profile(self):
+        """
+        :return: Name of the active durability profile
+        """
+        return self._profile
+
+    def db_get(self, table_name, item_name: str = '', value: str = '*') -> list:
+        """
+        Get db entries by name of item
+        :param table_name: Name of the sqlite table
+        :param value: Specific value to query
+        :param item_name: Name of the db item to be queried
+        :return: List of all db entries belonging to the item
+        """
+        if item_name != '':
+            cmd = self._sql("SELECT ({val}) FROM {table_name} WHERE name_short=?",
+                            val=value,
+                            table_name=table_name)
+            self._cursor.execute(cmd, (item_name,))
+        else:
+            cmd = self._sql("SELECT {val} FROM {table_name}",
+                            val=value,
+                            table_name=table_name)
+            self._cursor.execute(cmd)
+        return self._cursor.fetchall()
+
+    def db_update_sold(self, table_name, item_short_name, sold=0):
+        """
+        Set db entry for sold items.
+        :param table_name: Name of the sqlite table
+        :param item_short_name: Short name of the db item to be queried
+        :param sold: How many sold items
+        :return: Nothing
+        """
+        cmd = self._sql("UPDATE {table_name} SET sold=? WHERE name_short=?", table_name=table_name)
+        self._db_conn.execute(cmd, (sold, item_short_name))
+        self._db_conn.commit()
+        if table_name == 'food_list':
+            self._catalog_update(item_short_name, sold=sold)
+
+    def db_update_custom_sum(self, table_name, item_short_name, custom_sum=0):
+        """
+        Set db entry for custom sum.
+        :param table_name: Name of the sqlite table
+        :param item_short_name: Short name of the db item to be queried
+        :param custom_sum: Custom sum value
+        :return: Nothing
+        """
+        cmd = self._sql("UPDATE {table_name} SET price=? WHERE name_short=?", table_name=table_name)
+        self._db_conn.execute(cmd, (custom_sum, item_short_name))
+        self._db_conn.commit()
+        if table_name == 'food_list':
+            self._catalog_update(item_short_name, price=custom_sum)
+
+    def db_checkout(self, bill_cents, cash_cents, sold: dict, custom_amounts: list = (), timestamp=None,
+                    lines: list = None, sale_id=None) -> int:
+        """
+        Write a complete sale in one transaction with a single commit: the transaction header, one
+        line per sold article, relative updates of the sold counters and the custom sum in food_list,
+        of the sales rollups per item, hour and day and of the stock of the components the articles
+        consume, and the entry in the replication outbox.
+        :param bill_cents: Total of the sale in cents
+        :param cash_cents: Cash received in cents
+        :param sold: Dict of short name -> number of items sold in this transaction (EB is ignored)
+        :param custom_amounts: List of custom amounts (EB) in cents, each one is stored as its own line
+        :param timestamp: Unix time of the sale, now if not given
+        :param lines: List of (short name, qty, unit_price_cents) of the articles (EB is ignored), the
+                      prices they were rung up at. One line per article at the catalog price if not given.
+        :param sale_id: Unique id of the checkout, see RegisterEngine.pay
+        :return: Id of the new transaction
+        """
+        catalog = self.get_catalog()
+        sold_params = [(count, short_name) for short_name, count in sold.items()
+                       if short_name != 'EB' and count != 0]
+        if any(short_name not in catalog for count, short_name in sold_params):
+            # article added to food_list by another connection since the catalog was loaded
+            self.invalidate_catalog()
+            catalog = self.get_catalog()
+        if lines is None:
+            item_params = [(catalog[short_name].id, count, to_cents(catalog[short_name].price))
+                           for count, short_name in sold_params]
+        else:
+            item_params = [(catalog[short_name].id, qty, price_cents) for short_name, qty, price_cents in lines
+                           if short_name != 'EB' and qty != 0]
+        item_params += [(catalog['EB'].id, 1, amount) for amount in custom_amounts]
+        custom_sum = sum(custom_amounts) / 100.0
+        ts = int(time.time() if timestamp is None else timestamp)
+
+        rollup = {}
+        for item_id, qty, price_cents in item_params:
+            item_qty, item_amount = rollup.get(item_id, (0, 0))
+            rollup[item_id] = (item_qty + qty, item_amount + qty * price_cents)
+        hour_ts = ts - ts % 3600
+        day = time.strftime('%Y-%m-%d', time.localtime(ts))
+
+        t_start = time.perf_counter()
+        with self._db_conn:  # commits once on success, rolls back on error
+            tr_id = self._db_conn.execute('INSERT INTO transactions (ts, bill_cents, cash_cents, sale_id) '
+                                          'VALUES (?,?,?,?)', (ts, bill_cents, cash_cents, sale_id)).lastrowid
+            self._db_conn.executemany('INSERT INTO transaction_items (tr_id, item_id, qty, unit_price_cents) '
+                                      'VALUES (?,?,?,?)', [(tr_id,) + p for p in item_params])
+            self._db_conn.execute('INSERT INTO replication_outbox (tr_id) VALUES (?)', (tr_id,))
+            self._db_conn.executemany('UPDATE food_list SET sold = sold + ? WHERE name_short=?', sold_params)
+            if custom_sum != 0:
+                self._db_conn.execute("UPDATE food_list SET price = price + ? WHERE name_short='EB'",
+                                      (custom_sum,))
+            self._db_conn.executemany(
+                'INSERT INTO sales_by_item (item_id, qty, amount_cents) VALUES (?,?,?) '
+                'ON CONFLICT (item_id) DO UPDATE SET qty = qty + excluded.qty, '
+                'amount_cents = amount_cents + excluded.amount_cents',
+                [(item_id, qty, amount) for item_id, (qty, amount) in rollup.items()])
+            self._db_conn.executemany(
+                'INSERT INTO sales_by_hour (hour_ts, item_id, qty, amount_cents) VALUES (?,?,?,?) '
+                'ON CONFLICT (hour_ts, item_id) DO UPDATE SET qty = qty + excluded.qty, '
+                'amount_cents = amount_cents + excluded.amount_cents',
+                # custom amounts (EB) count to the hour's amount, not to its pieces, like in the summary items
+                [(hour_ts, item_id, 0 if item_id == catalog['EB'].id else qty, amount)
+                 for item_id, (qty, amount) in rollup.items()])
+            self._db_conn.execute(
+                'INSERT INTO sales_by_day (day, transactions, bill_cents, cash_cents) VALUES (?,1,?,?) '
+                'ON CONFLICT (day) DO UPDATE SET transactions = transactions + 1, '
+                'bill_cents = bill_cents + excluded.bill_cents, cash_cents = cash_cents + excluded.cash_cents',
+                (day, bill_cents, cash_cents))
+            # one indexed update per article, untracked articles have no recipe rows and change nothing
+            self._db_conn.executemany(
+                'UPDATE stock SET qty = qty - ? * (SELECT r.qty FROM recipes r WHERE r.item_id = ? '
+                'AND r.component = stock.component) '
+                'WHERE component IN (SELECT component FROM recipes WHERE item_id = ?)',
+                [(qty, item_id, item_id) for item_id, (qty, _) in rollup.items() if item_id != catalog['EB'].id])
+        self._commit_latencies.append(time.perf_counter() - t_start)
+
+        self.update_catalog_sold(sold, custom_amounts)
+        return tr_id
+
+    def db_has_transaction(self, ts, bill_cents, cash_cents, sale_id=None) -> bool:
+        """
+        :param ts: Unix time of the sale
+        :param bill_cents: Total of the sale in cents
+        :param cash_cents: Cash received in cents
+        :param sale_id: Id of the checkout; if given only the id is compared, two equal sales in the
+                        same second are still two sales
+        :return: True if the sale is stored
+        """
+        if sale_id is not None:
+            self._cursor.execute('SELECT 1 FROM transactions WHERE sale_id=?', (sale_id,))
+        else:
+            self._cursor.execute('SELECT 1 FROM transactions WHERE ts=? AND bill_cents=? AND cash_cents=?',
+                                 (ts, bill_cents, cash_cents))
+        return self._cursor.fetchone() is not None
+
+    def db_get_item_rollup(self) -> list:
+        """
+        :return: List of (short name, qty, amount_cents) of all articles, unsold ones with 0, in db order
+        """
+        return self._read('SELECT f.name_short, ifnull(r.qty, 0), ifnull(r.amount_cents, 0) FROM food_list f '
+                          'LEFT JOIN sales_by_item r ON r.item_id = f.id ORDER BY f.id')
+
+    def db_get_hour_rollup(self, ts_from, ts_to) -> list:
+        """
+        :param ts_from: Unix time, inclusive lower bound
+        :param ts_to: Unix time, exclusive upper bound
+        :return: List of (hour_ts, qty, amount_cents) per hour with sales, summed over all articles
+        """
+        return self._read('SELECT hour_ts, sum(qty), sum(amount_cents) FROM sales_by_hour '
+                          'WHERE hour_ts >= ? AND hour_ts < ? GROUP BY hour_ts ORDER BY hour_ts', (ts_from, ts_to))
+
+    def db_get_day_rollup(self, day) -> tuple:
+        """
+        :param day: Local date as 'YYYY-MM-DD'
+        :return: (transactions, bill_cents, cash_cents) of the day
+        """
+        rows = self._read('SELECT transactions, bill_cents, cash_cents FROM sales_by_day WHERE day=?', (day,))
+        return rows[0] if rows else (0, 0, 0)
+
+    def update_catalog_sold(self, sold: dict, custom_amounts: list = ()):
+        """
+        Apply a sale to the in-memory catalog only. Used by connections that did not write the sale
+        themselves, e.g. when the checkout was written by the PersistenceWriter thread.
+        :param sold: Dict of short name -> number of items sold (EB is ignored)
+        :param custom_amounts: List of custom amounts (EB) in cents
+        :return: Nothing
+        """
+        catalog = self.get_catalog()
+        for short_name, count in sold.items():
+            if short_name != 'EB' and count != 0:
+                catalog[short_name] = catalog[short_name]._replace(sold=catalog[short_name].sold + count)
+        custom_sum = sum(custom_amounts) / 100.0
+        if custom_sum != 0:
+            catalog['EB'] = catalog['EB']._replace(price=catalog['EB'].price + custom_sum)
+
+    def db_get_transactions(self, ts_from=None, ts_to=None, item_short_name=None) -> list:
+        """
+        Get transactions by time range and/or article, using the ts and item_id indexes.
+        :param ts_from: Unix time, inclusive lower bound
+        :param ts_to: Unix time, exclusive upper bound
+        :param item_short_name: Only transactions containing this article
+        :return: List of (tr_id, ts, bill_cents, cash_cents) tuples, ordered by time
+        """
+        conditions = []
+        params = []
+        if ts_from is not None:
+            conditions.append('ts >= ?')
+            params.append(ts_from)
+        if ts_to is not None:
+            conditions.append('ts < ?')
+            params.append(ts_to)
+        if item_short_name is not None:
+            conditions.append('tr_id IN (SELECT tr_id FROM transaction_items WHERE item_id=?)')
+            params.append(self.get_catalog_item(item_short_name).id)
+        cmd = 'SELECT tr_id, ts, bill_cents, cash_cents FROM transactions'
+        if conditions:
+            cmd += ' WHERE ' + ' AND '.join(conditions)
+        return self._read(cmd + ' ORDER BY ts, tr_id', params)
+
+    def db_get_transaction_items(self, tr_id) -> list:
+        """
+        :param tr_id: Id of the transaction
+        :return: List of (short name, qty, unit_price_cents) tuples of the transaction
+        """
+        return self._read('SELECT f.name_short, t.qty, t.unit_price_cents FROM transaction_items t '
+                          'JOIN food_list f ON f.id = t.item_id WHERE t.tr_id=?', (tr_id,))
+
+    def iter_transaction_lines(self, ts_from=None, ts_to=None, item_short_name=None, chunk_size=1000):
+        """
+        Stream the sales with their lines, read in chunks of chunk_size rows with an own cursor, so
+        memory does not grow with the history.
+        :param ts_from: Unix time, inclusive lower bound
+        :param ts_to: Unix time, exclusive upper bound
+        :param item_short_name: Only transactions containing this article, with all of their lines
+        :param chunk_size: Number of rows fetched at once
+        :return: Generator of (tr_id, ts, bill_cents, cash_cents, item_id, qty, unit_price_cents) tuples,
+                 ordered by time, item_id etc. are None for a sale without lines
+        """
+        conditions = []
+        params = []
+        if ts_from is not None:
+            conditions.append('t.ts >= ?')
+            params.append(ts_from)
+        if ts_to is not None:
+            conditions.append('t.ts < ?')
+            params.append(ts_to)
+        if item_short_name is not None:
+            conditions.append('t.tr_id IN (SELECT tr_id FROM transaction_items WHERE item_id=?)')
+            params.append(self.get_catalog_item(item_short_name).id)
+        cmd = ('SELECT t.tr_id, t.ts, t.bill_cents, t.cash_cents, i.item_id, i.qty, i.unit_price_cents '
+               'FROM transactions t LEFT JOIN transaction_items i ON i.tr_id = t.tr_id')
+        if conditions:
+            cmd += ' WHERE ' + ' AND '.join(conditions)
+        cmd += ' ORDER BY t.ts, t.tr_id'
+        if self.read_pool is None:
+            yield from self._iter_rows(self._db_conn, cmd, params, chunk_size)
+            return
+        with self.read_pool.connection() as db_conn:
+            yield from self._iter_rows(db_conn, cmd, params, chunk_size)
+
+    def _iter_rows(self, db_conn, cmd, params, chunk_size):
+        cursor = db_conn.cursor()
+        try:
+            if self.read_pool is not None:
+                self.read_pool.retry(lambda: cursor.execute(cmd, params))
+            else:
+                cursor.execute(cmd, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    def close(self):
+        """
+        Close the db connection and the read pool
+        :return: Nothing
+        """
+        if self.read_pool is not None:
+            self.read_pool.close()
+        self._db_conn.close()
+
+    def get_commit_latencies(self) -> list:
+        """
+        :return: Durations in seconds of the most recent checkout commits
+        """
+        return list(self._commit_latencies)
+
+
+class WriterBusyError(Exception):
+    """The queue of the PersistenceWriter stayed full, the write was not accepted"""
+
+
+class PersistenceWriter(threading.Thread):
+    """
+    Writer thread owning its own DBAccess connection. Writes are queued by submit() and executed in
+    order. Their results are collected and handed to the callbacks by dispatch_results(), which the
+    UI calls from its own thread (via after()), so no callback ever runs in the writer thread.
+    """
+
+    def __init__(self, db_name, profile=DB_DEFAULT_PROFILE, max_pending=32, submit_timeout=0.5,
+                 instrumentation=None):
+        super(PersistenceWriter, self).__init__(name='PersistenceWriter', daemon=True)
+        self._db_name = db_name
+        self._profile = profile
+        self._instrumentation = instrumentation
+        self._jobs = queue.Queue(maxsize=max_pending)
+        self._results = queue.Queue()
+        self._submit_timeout = submit_timeout
+        self._opened = threading.Event()
+        self._open_error = None
+
+    def start(self):
+        """
+        Start the thread and wait until it has opened the db.
+        :return: Nothing, raises the error of opening the db in the writer thread
+        """
+        super(PersistenceWriter, self).start()
+        self._opened.wait()
+        if self._open_error is not None:
+            self.join()
+            raise self._open_error
+
+    def run(self):
+        try:
+            db = DBAccess(self._db_name, profile=self._profile)
+            if self._instrumentation is not None:
+                self._instrumentation.wrap_db(db, 'writer')
+        except Exception as e:
+            self._open_error = e
+            return
+        finally:
+            self._opened.set()
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                method_name, args, kwargs, on_done, on_error = job
+                try:
+                    result = getattr(db, method_name)(*args, **kwargs)
+                except Exception as e:
+                    self._results.put((on_error, e))
+                else:
+                    self._results.put((on_done, result))
+        finally:
+            db.close()
+
+    def submit(self, method_name, *args, on_done=None, on_error=None, **kwargs):
+        """
+        Queue a call of a DBAccess write method. Blocks at most submit_timeout seconds if the queue
+        is full, then raises WriterBusyError.
+        :param method_name: Name of the DBAccess method, e.g. 'db_checkout'
+        :param on_done: Called with the return value of the method
+        :param on_error: Called with the exception raised by the method
+        :return: Nothing
+        """
+        try:
+            self._jobs.put((method_name, args, kwargs, on_done, on_error), timeout=self._submit_timeout)
+        except queue.Full:
+            raise WriterBusyError('{} pending writes'.format(self._jobs.qsize()))
+
+    def dispatch_results(self):
+        """
+        Run the callbacks of all finished writes in the calling thread.
+        :return: Number of dispatched results
+        """
+        count = 0
+        while True:
+            try:
+                callback, value = self._results.get_nowait()
+            except queue.Empty:
+                return count
+            count += 1
+            if callback is not None:
+                callback(value)
+
+    def pending(self):
+        """
+        :return: Number of queued writes not yet started
+        """
+        return self._jobs.qsize()
+
+    def stop(self, timeout=None):
+        """
+        Write everything still queued, then end the thread and close its connection.
+        :param timeout: Seconds to wait for the thread
+        :return: Nothing
+        """
+        if self.is_alive():
+            self._jobs.put(None)
+            self.join(timeout)
+
+
+def latency_stats(samples: list) -> dict:
+    """
+    Summarize latency samples given in seconds.
+    :param samples: List of durations in seconds
+    :return: Dict with count, mean, p50, p95, p99 and max in milliseconds
+    """
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'max_ms': ordered[-1] * 1000
+    }
+
+
+def measure_commit_latency(db_name, profiles=None, rounds=200) -> dict:
+    """
+    Measure checkout commit latency for each durability profile. Every profile runs against its own
+    temporary copy of the db, so the original file is never touched.
+    :param db_name: Path of the db to copy
+    :param profiles: Profile names to measure, all of DB_PROFILES by default
+    :param rounds: Number of synthetic checkouts per profile
+    :return: Dict of profile name -> latency stats
+    """
+    results = OrderedDict()
+    for profile in profiles or DB_PROFILES.keys():
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_db = os.path.join(tmp_dir, 'measure.db')
+            shutil.copyfile(db_name, tmp_db)
+            db = DBAccess(tmp_db, profile=profile)
+            short_names = list(db.get_catalog().keys())
+            sold = {short_names[0]: 2, short_names[1]: 1}
+            for _ in range(rounds):
+                db.db_checkout(0, 0, sold)
+            results[profile] = latency_stats(db.get_commit_latencies())
+            db.close()
+    return results
+
+
+def format_cents(cents) -> str:
+    """
+    :param cents: Amount in integer cents
+    :return: Amount in euro with two decimals, e.g. '-1.05'
+    """
+    return '{sign}{euro}.{cent:02d}'.format(sign='-' if cents < 0 else '', euro=abs(cents) // 100, cent=abs(cents) % 100)
+
+
+class CartLine:
+    """One line of the cart: pieces of an article at one price"""
+    __slots__ = ('name', 'short_name', 'price_cents', 'quantity')
+
+    def __init__(self, name, short_name, price_cents, quantity=0):
+        self.name = name
+        self.short_name = short_name
+        self.price_cents = price_cents
+        self.quantity = quantity
+
+    @property
+    def key(self):
+        return self.short_name, self.price_cents
+
+    @property
+    def amount_cents(self):
+        return self.price_cents * self.quantity
+
+
+class Cart:
+    """
+    Order being rung up. All money is in integer cents, the totals, the pieces per article and the
+    custom amount (EB) subtotal are updated on every change, so no operation has to walk all lines.
+    """
+    __slots__ = ('_lines', '_counts', '_total_cents', '_custom_cents')
+
+    def __init__(self):
+        self._lines = OrderedDict()  # (short_name, price_cents) -> CartLine
+        self._counts = Counter()
+        self._total_cents = 0
+        self._custom_cents = 0
+
+    def _change(self, line: CartLine, quantity):
+        line.quantity += quantity
+        self._counts[line.short_name] += quantity
+        self._total_cents += line.price_cents * quantity
+        if line.short_name == 'EB':
+            self._custom_cents += line.price_cents * quantity
+        if self._counts[line.short_name] == 0:
+            del self._counts[line.short_name]
+        if line.quantity == 0:
+            del self._lines[line.key]
+
+    def add(self, name, short_name, price_cents, quantity=1) -> CartLine:
+        """
+        Add pieces of an article, pieces at the same price share one line.
+        :param name: Name of the article
+        :param short_name: Short name of the article
+        :param price_cents: Price of one piece in cents
+        :param quantity: Number of pieces
+        :return: Changed line
+        """
+        line = self._lines.get((short_name, price_cents))
+        if line is None:
+            line = CartLine(name, short_name, price_cents)
+            self._lines[line.key] = line
+        self._change(line, quantity)
+        return line
+
+    def decrement(self, key) -> CartLine:
+        """
+        Remove one piece from a line, the line is removed with its last piece.
+        :param key: Key of the line, (short_name, price_cents)
+        :return: Changed line, its quantity is 0 if it was removed
+        """
+        line = self._lines[key]
+        self._change(line, -1)
+        return line
+
+    def void(self, key) -> CartLine:
+        """
+        Remove a line completely.
+        :param key: Key of the line, (short_name, price_cents)
+        :return: Removed line, with quantity 0
+        """
+        line = self._lines[key]
+        self._change(line, -line.quantity)
+        return line
+
+    def clear(self):
+        self._lines.clear()
+        self._counts.clear()
+        self._total_cents = 0
+        self._custom_cents = 0
+
+    def get_lines(self) -> list:
+        """
+        :return: Lines in the order they were first added
+        """
+        return list(self._lines.values())
+
+    def get_counts(self) -> dict:
+        """
+        :return: Dict of short name -> number of pieces
+        """
+        return dict(self._counts)
+
+    def get_item_lines(self) -> list:
+        """
+        :return: List of (short name, pieces, price_cents) of all lines except the custom amounts (EB)
+        """
+        return [(line.short_name, line.quantity, line.price_cents) for line in self._lines.values()
+                if line.short_name != 'EB']
+
+    def get_custom_amounts(self) -> list:
+        """
+        :return: List of all custom amounts (EB) in cents, one entry per piece
+        """
+        return [line.price_cents for line in self._lines.values() if line.short_name == 'EB'
+                for _ in range(line.quantity)]
+
+    def get_total_cents(self):
+        return self._total_cents
+
+    def get_custom_cents(self):
+        return self._custom_cents
+
+    def __len__(self):
+        return len(self._lines)
+
+
+class InsufficientCashError(Exception):
+    """Less cash was given than the total of the cart"""
+
+
+class OutOfStockError(Exception):
+    """More pieces of an article were added than the stock has left"""
+
+    def __init__(self, short_name, state, pieces_left):
+        super().__init__('{}: {} pieces left'.format(short_name, pieces_left))
+        self.short_name = short_name
+        self.state = state
+        self.pieces_left = pieces_left
+
+
+class RegisterEngine:
+    """
+    Headless register: catalog, cart, checkout and summary without any UI. The touch UI is a front-end
+    of this class, scripts can drive it directly:
+
+        engine = RegisterEngine('touchReg.db')
+        engine.add_item('KK', quantity=2)
+        change = engine.pay(5000)
+        engine.summary()
+    """
+
+    def __init__(self, db_name, profile=DB_DEFAULT_PROFILE, background_writes=False, replicate_url=None,
+                 instrumentation=None, journal_file=None, watch_catalog=False, catalog_file=None,
+                 read_pool_size=READ_POOL_SIZE):
+        """
+        :param db_name: Path of the register db
+        :param profile: Durability profile, see DB_PROFILES
+        :param background_writes: Write checkouts in a PersistenceWriter thread instead of synchronously
+        :param replicate_url: Base url of an aggregator the sales are replicated to, see replication.py
+        :param instrumentation: Instrumentation measuring all db calls, see instrumentation.py
+        :param journal_file: Cart journal, an unfinished order found in it is restored, see cart_journal.py
+        :param watch_catalog: Apply changes of food_list made while running, see catalog_watcher.py
+        :param catalog_file: CSV catalog file imported whenever it changes, implies watch_catalog
+        :param read_pool_size: Read-only connections the summary reads from, see ReadPool; 0 to read on
+                               the connection the sales are written with
+        """
+        self.db_interface = DBAccess(db_name, profile=profile, read_pool_size=read_pool_size)
+        self._closed = False
+        if instrumentation is not None:
+            instrumentation.wrap_db(self.db_interface)
+            if self.db_interface.read_pool is not None:
+                instrumentation.watch_read_pool(self.db_interface.read_pool)
+        self.cart = Cart()
+        self.cash_cents = 0
+        self.transaction_done = False
+        self.journal = None
+        self.recovered_sales = 0
+        if journal_file is not None:
+            self.journal = CartJournal(journal_file)
+            self.recovered_sales = self._replay_journal()
+        self.stock = self.db_interface.get_stock()
+        self.stock_listener = None
+        self._stock_pending = []  # [tr_id or None while queued, consumption] of sales the db stock may lack
+        self.writer = None
+        if background_writes:
+            self.writer = PersistenceWriter(db_name, profile=profile, instrumentation=instrumentation)
+            try:
+                self.writer.start()
+            except Exception:
+                if self.journal is not None:
+                    self.journal.close()
+                self.db_interface.close()
+                raise
+        self.replicator = None
+        if replicate_url is not None:
+            self.replicator = Replicator(db_name, replicate_url)
+            self.replicator.start()
+        self.catalog_watcher = None
+        self.catalog_listener = None
+        if watch_catalog or catalog_file is not None:
+            self.catalog_watcher = CatalogWatcher(db_name, self.get_catalog(), catalog_file=catalog_file)
+            self.catalog_watcher.start()
+
+    def get_catalog(self) -> OrderedDict:
+        return self.db_interface.get_catalog()
+
+    def _start_new_cart(self):
+        if self.transaction_done:
+            self.cancel()
+
+    def _journal(self, kind, *args, sync=False):
+        if self.journal is not None:
+            return self.journal.append(kind, *args, sync=sync)
+
+    def _replay_journal(self) -> int:
+        """
+        Rebuild the cart and the cash given from the journal. Sales whose checkout is journaled but
+        not found in the db (power loss before the write) are written now, sales whose write failed
+        (a checkout_rejected record with their sale id) are not.
+        :return: Number of sales written
+        """
+        written = 0
+        last_checkout = 0
+        checkout = None
+        records = self.journal.get_records()
+        # a failed background write is journaled later, after the records of the next order
+        rejected = {args[0] for seq, kind, *args in records if kind == 'checkout_rejected' and args}
+        for seq, kind, *args in records + [[None, None]]:
+            # journals written before sale ids were journaled lack the fifth value
+            sale_id = checkout[4] if checkout is not None and len(checkout) > 4 else None
+            if checkout is not None and kind != 'checkout_rejected' and sale_id not in rejected:
+                ts, bill_cents, cash_cents = checkout[1:4]
+                if not self.db_interface.db_has_transaction(ts, bill_cents, cash_cents, sale_id):
+                    self.db_interface.db_checkout(bill_cents, cash_cents, self.cart.get_counts(),
+                                                  custom_amounts=self.cart.get_custom_amounts(), timestamp=ts,
+                                                  lines=self.cart.get_item_lines(), sale_id=sale_id)
+                    written += 1
+                self.cart.clear()
+                self.cash_cents = 0
+                last_checkout = checkout[0]
+            checkout = None
+            if kind == 'add':
+                self.cart.add(*args)
+            elif kind == 'decrement':
+                self.cart.decrement(tuple(args))
+            elif kind == 'void':
+                self.cart.void(tuple(args))
+            elif kind == 'cash':
+                self.cash_cents = args[0]
+            elif kind == 'cancel':
+                self.cart.clear()
+                self.cash_cents = 0
+            elif kind == 'checkout':
+                # applied with the next record, unless that one or a later one says the checkout failed
+                checkout = [seq] + args
+        if last_checkout:
+            self.journal.compact(last_checkout)
+        return written
+
+    def add_item(self, short_name, quantity=1, price_cents=None) -> CartLine:
+        """
+        Add an article of the catalog to the cart. A paid cart is replaced by a new one first.
+        :param short_name: Short name of the article
+        :param quantity: Number of pieces
+        :param price_cents: Price of one piece, the catalog price if not given
+        :return: Changed cart line
+        :raises ValueError: If the quantity is below 1
+        :raises OutOfStockError: If the stock has fewer pieces left, nothing is added
+        """
+        if quantity < 1:
+            raise ValueError('Invalid quantity: {}'.format(quantity))
+        self._start_new_cart()
+        item = self.get_catalog()[short_name]
+        state, pieces_left = self.stock_states([short_name]).get(short_name, (None, None))
+        if pieces_left is not None and pieces_left < quantity:
+            raise OutOfStockError(short_name, state, pieces_left)
+        if price_cents is None:
+            price_cents = to_cents(item.price)
+        self._journal('add', item.name, short_name, price_cents, quantity)
+        return self.cart.add(item.name, short_name, price_cents, quantity)
+
+    def add_custom_amount(self, amount_cents, name='Eigener Betrag', quantity=1) -> CartLine:
+        """
+        Add a custom amount (EB) to the cart.
+        :param amount_cents: Amount in cents
+        :param name: Name shown for the line
+        :param quantity: Number of times the amount is added
+        :return: Changed cart line
+        :raises ValueError: If the quantity is below 1
+        """
+        if quantity < 1:
+            raise ValueError('Invalid quantity: {}'.format(quantity))
+        self._start_new_cart()
+        self._journal('add', name, 'EB', amount_cents, quantity)
+        return self.cart.add(name, 'EB', amount_cents, quantity)
+
+    def decrement(self, key) -> CartLine:
+        self._journal('decrement', *key)
+        return self.cart.decrement(key)
+
+    def void(self, key) -> CartLine:
+        self._journal('void', *key)
+        return self.cart.void(key)
+
+    def set_cash(self, cash_cents):
+        """
+        Remember the cash tapped so far, only for the journal.
+        :param cash_cents: Cash received in cents
+        :return: Nothing
+        """
+        if cash_cents != self.cash_cents:
+            self.cash_cents = cash_cents
+            self._journal('cash', cash_cents)
+
+    def _stock_used(self, counts: dict) -> dict:
+        catalog = self.get_catalog()
+        return self.stock.consumption((catalog[short_name].id, count) for short_name, count in counts.items()
+                                      if short_name != 'EB' and short_name in catalog)
+
+    def stock_states(self, short_names) -> dict:
+        """
+        Stock of articles with the open order taken into account, computed from memory only.
+        :param short_names: Short names of the articles
+        :return: Dict of short name -> (state, pieces left) of the tracked ones, see StockLevels.state
+        """
+        if not self.stock.recipes:
+            return {}
+        catalog = self.get_catalog()
+        reserved = {} if self.transaction_done else self._stock_used(self.cart.get_counts())
+        states = {}
+        for short_name in short_names:
+            item = catalog.get(short_name)
+            if item is not None and item.id in self.stock.recipes:
+                states[short_name] = (self.stock.state(item.id, reserved),
+                                      self.stock.pieces_left(item.id, reserved))
+        return states
+
+    def stock_affected(self, short_name) -> list:
+        """
+        :param short_name: Short name of an article
+        :return: Short names of the articles sharing a stock component with it, empty if it is not tracked
+        """
+        item = self.get_catalog().get(short_name)
+        ids = self.stock.affected(item.id) if item is not None else ()
+        if not ids:
+            return []
+        return [item.name_short for item in self.get_catalog().values() if item.id in ids]
+
+    def _stock_written(self, pending, tr_id):
+        if self.catalog_watcher is None:
+            self._stock_pending.remove(pending)
+        else:
+            # kept until a stock snapshot of the watcher includes the sale
+            pending[0] = tr_id
+
+    def _stock_failed(self, pending):
+        self._stock_pending.remove(pending)
+        self.stock.take({component: -qty for component, qty in pending[1].items()})
+
+    def _apply_stock(self, stock: StockLevels):
+        """
+        Replace the stock by a snapshot of the db, minus the sales of this register not in it yet.
+        :param stock: StockLevels read by the CatalogWatcher
+        :return: Nothing
+        """
+        self._stock_pending = [p for p in self._stock_pending if p[0] is None or p[0] > stock.last_tr_id]
+        for _, used in self._stock_pending:
+            stock.take(used)
+        self.stock = stock
+        if self.stock_listener is not None:
+            self.stock_listener()
+
+    def cancel(self):
+        """
+        Drop the cart
+        :return: Nothing
+        """
+        self._journal('cancel')
+        self.cart.clear()
+        self.cash_cents = 0
+        self.transaction_done = False
+
+    def pay(self, cash_cents, on_done=None, on_error=None, timestamp=None) -> int:
+        """
+        Check out the cart. Without background writes the sale is written before returning, otherwise
+        it is queued and on_done/on_error are called from process_results().
+        :param cash_cents: Cash received in cents
+        :param on_done: Called with the transaction id once the sale is written
+        :param on_error: Called with the exception if writing in the background failed
+        :param timestamp: Unix time of the sale, now if not given
+        :return: Change in cents
+        """
+        change_cents = cash_cents - self.cart.get_total_cents()
+        if change_cents < 0:
+            raise InsufficientCashError('{} cents missing'.format(-change_cents))
+
+        bill_cents = self.cart.get_total_cents()
+        counts = self.cart.get_counts()
+        custom_amounts = self.cart.get_custom_amounts()
+        lines = self.cart.get_item_lines()
+        timestamp = int(time.time() if timestamp is None else timestamp)
+        stock_pending = [None, self._stock_used(counts)]
+        sale_id = uuid.uuid4().hex
+        checkout_seq = self._journal('checkout', timestamp, bill_cents, cash_cents, sale_id, sync=True)
+        if self.writer is None:
+            try:
+                tr_id = self.db_interface.db_checkout(bill_cents, cash_cents, counts, custom_amounts=custom_amounts,
+                                                      timestamp=timestamp, lines=lines, sale_id=sale_id)
+            except Exception:
+                self._journal('checkout_rejected', sale_id, sync=True)
+                raise
+            self.stock.take(stock_pending[1])
+            self._stock_pending.append(stock_pending)
+            self._stock_written(stock_pending, tr_id)
+            if checkout_seq is not None:
+                self.journal.compact(checkout_seq)
+            if self.replicator is not None:
+                self.replicator.notify()
+            if on_done is not None:
+                on_done(tr_id)
+        else:
+            def written(tr_id):
+                self.db_interface.update_catalog_sold(counts, custom_amounts)
+                self._stock_written(stock_pending, tr_id)
+                if checkout_seq is not None:
+                    self.journal.compact(checkout_seq)
+                if self.replicator is not None:
+                    self.replicator.notify()
+                if on_done is not None:
+                    on_done(tr_id)
+
+            def failed(error):
+                self._journal('checkout_rejected', sale_id, sync=True)
+                self._stock_failed(stock_pending)
+                if on_error is not None:
+                    on_error(error)
+
+            try:
+                self.writer.submit('db_checkout', bill_cents, cash_cents, counts,
+                                   custom_amounts=custom_amounts, timestamp=timestamp, lines=lines,
+                                   sale_id=sale_id, on_done=written, on_error=failed)
+            except WriterBusyError:
+                self._journal('checkout_rejected', sale_id, sync=True)
+                raise
+            # taken right away, the next order must not sell what is already sold
+            self.stock.take(stock_pending[1])
+            self._stock_pending.append(stock_pending)
+        self.transaction_done = True
+        return change_cents
+
+    def process_results(self):
+        """
+        Run the callbacks of finished background writes in the calling thread, apply catalog and
+        stock changes and flush the cart journal.
+        :return: Nothing
+        """
+        if self.writer is not None:
+            self.writer.dispatch_results()
+        if self.catalog_watcher is not None:
+            for changes in self.catalog_watcher.get_changes():
+                if 'error' not in changes:
+                    self.db_interface.apply_catalog_changes(changes['changed'] + changes['added'], changes['removed'])
+                if self.catalog_listener is not None:
+                    self.catalog_listener(changes)
+            stock = self.catalog_watcher.get_stock()
+            if stock is not None:
+                self._apply_stock(stock)
+        if self.journal is not None:
+            self.journal.sync()
+
+    def summary(self, day_ts=None) -> dict:
+        """
+        Sales figures read from the rollup tables, all amounts in cents.
+        :param day_ts: Any unix time of the day for the day figures, now if not given
+        :return: Dict with 'items' (list of (short_name, name, sold, amount)), 'income',
+                 'custom_income', 'expenses', 'total', 'day' ((transactions, bill, cash) of the day)
+                 and 'hours' (list of (hour_ts, qty, amount) of the day)
+        """
+        catalog = self.get_catalog()
+        items = []
+        income = 0
+        expenses = 0
+        custom_income = 0
+        for short_name, sold, amount in self.db_interface.db_get_item_rollup():
+            if short_name == 'EB':
+                custom_income = amount
+                continue
+            if amount >= 0:
+                income += amount
+            else:
+                expenses += amount
+            item = catalog.get(short_name)
+            items.append((short_name, item.name if item is not None else short_name, sold, amount))
+
+        day_start = time.localtime(time.time() if day_ts is None else day_ts)
+        day_start = int(time.mktime((day_start.tm_year, day_start.tm_mon, day_start.tm_mday, 0, 0, 0, 0, 0, -1)))
+        return {
+            'items': items,
+            'income': income,
+            'custom_income': custom_income,
+            'expenses': expenses,
+            'total': income + expenses + custom_income,
+            'day': self.db_interface.db_get_day_rollup(time.strftime('%Y-%m-%d', time.localtime(day_start))),
+            'hours': self.db_interface.db_get_hour_rollup(day_start, day_start + 24 * 3600)
+        }
+
+    def close(self):
+        """
+        Write pending sales and close the db connections. Sales not yet replicated stay in the outbox.
+        Calling it again does nothing.
+        :return: Nothing
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer.dispatch_results()
+        if self.replicator is not None:
+            self.replicator.stop(timeout=5.0)
+        if self.catalog_watcher is not None:
+            self.catalog_watcher.stop()
+            self.catalog_watcher = None
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self.db_interface.close()
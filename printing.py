@@ -0,0 +1,279 @@
+"""
+Receipts (Kassenbon) and kitchen tickets (Küchenbon) on ESC/POS printers.
+
+A finished sale is rendered from the data close_transaction already has, no db read is needed.
+Every printer has its own PrintSpool thread: jobs are queued and written in order, a job failing
+with OSError is tried again after a pause that grows with every try. A slow, jammed or missing
+printer therefore only delays its own bons, never the next sale, and a jammed kitchen printer does
+not hold up the receipts.
+
+Printers are plain objects with write(data) raising OSError on failure, open_printer() creates
+them from a target:
+    /dev/usb/lp0, /dev/pts/5, bon.bin   device, pseudo terminal or file the bytes are appended to
+    tcp://192.168.1.20:9100             network printer (raw port)
+
+Usage (print a demo receipt and kitchen ticket and show them as text):
+    python printing.py [TARGET]
+"""
+import re
+import sys
+import time
+import queue
+import socket
+import threading
+from datetime import datetime
+from collections import namedtuple
+from kasse_core import format_cents
+
+"""A finished sale as printed, lines are (name, short name, qty, price_cents) without the custom amounts"""
+Sale = namedtuple('Sale', ['tr_id', 'timestamp', 'lines', 'custom_cents', 'bill_cents', 'cash_cents'])
+
+RECEIPT_WIDTH = 48
+RECEIPT_HEADER = ('TouchKasse',)
+PRINT_MAX_PENDING = 100
+PRINT_RETRIES = 5
+PRINT_RETRY_INTERVAL = 2.0
+
+"""ESC/POS commands"""
+ESC_INIT = b'\x1b@'
+ESC_CODE_PAGE = b'\x1bt\x13'  # PC858: umlauts and the euro sign
+ESC_CENTER = b'\x1ba\x01'
+ESC_LEFT = b'\x1ba\x00'
+ESC_BOLD_ON = b'\x1bE\x01'
+ESC_BOLD_OFF = b'\x1bE\x00'
+GS_DOUBLE = b'\x1d!\x11'
+GS_NORMAL = b'\x1d!\x00'
+GS_CUT = b'\x1dVB\x03'  # feed 3 lines and cut partially
+ESCPOS_ENCODING = 'cp858'
+_ESCPOS_COMMAND = re.compile(rb'\x1b[@]|\x1b[taE!d].|\x1d[!].|\x1dVB.|\x1dV.')
+
+
+def _text(text) -> bytes:
+    return text.encode(ESCPOS_ENCODING, errors='replace') + b'\n'
+
+
+def _columns(left, right, width) -> str:
+    """
+    :return: left and right in one line of width characters, left is shortened if both do not fit
+    """
+    left = left[:max(0, width - len(right) - 1)]
+    return left + ' ' * (width - len(left) - len(right)) + right
+
+
+def render_receipt(sale: Sale, width=RECEIPT_WIDTH, header=RECEIPT_HEADER) -> bytes:
+    """
+    :param sale: Sale to print
+    :param width: Characters per line of the printer
+    :param header: Lines printed centered above the sale, e.g. the name of the club
+    :return: ESC/POS data of the receipt, ending with a cut
+    """
+    data = [ESC_INIT, ESC_CODE_PAGE, ESC_CENTER, ESC_BOLD_ON]
+    data += [_text(line) for line in header]
+    data += [ESC_BOLD_OFF, _text(datetime.fromtimestamp(sale.timestamp).strftime('%d.%m.%Y %H:%M')),
+             _text('Bon-Nr. {}'.format(sale.tr_id)), ESC_LEFT, _text('-' * width)]
+    for name, short_name, qty, price_cents in sale.lines:
+        data.append(_text(_columns('{} x {}'.format(qty, name), format_cents(qty * price_cents), width)))
+    if sale.custom_cents:
+        data.append(_text(_columns('Eigener Betrag', format_cents(sale.custom_cents), width)))
+    data += [_text('-' * width), ESC_BOLD_ON,
+             _text(_columns('SUMME EUR', format_cents(sale.bill_cents), width)), ESC_BOLD_OFF,
+             _text(_columns('BAR', format_cents(sale.cash_cents), width)),
+             _text(_columns('ZURÜCK', format_cents(sale.cash_cents - sale.bill_cents), width)),
+             ESC_CENTER, _text(''), _text('Vielen Dank!'), GS_CUT]
+    return b''.join(data)
+
+
+def render_kitchen_ticket(sale: Sale, short_names=None) -> bytes:
+    """
+    :param sale: Sale to print
+    :param short_names: Articles the kitchen prepares, all if None
+    :return: ESC/POS data of the ticket in large letters, empty if the sale has nothing for the kitchen
+    """
+    lines = [line for line in sale.lines if short_names is None or line[1] in short_names]
+    if not lines:
+        return b''
+    data = [ESC_INIT, ESC_CODE_PAGE, ESC_LEFT, GS_DOUBLE, ESC_BOLD_ON,
+            _text('Nr. {}  {}'.format(sale.tr_id, datetime.fromtimestamp(sale.timestamp).strftime('%H:%M'))),
+            ESC_BOLD_OFF]
+    data += [_text('{:2d} x {}'.format(qty, name)) for name, short_name, qty, price_cents in lines]
+    data += [GS_NORMAL, GS_CUT]
+    return b''.join(data)
+
+
+def to_text(data: bytes) -> str:
+    """
+    :param data: ESC/POS data as rendered by this module
+    :return: The printed text, for previews and for checking what a file or pseudo terminal received
+    """
+    return _ESCPOS_COMMAND.sub(b'', data).decode(ESCPOS_ENCODING, errors='replace')
+
+
+class FilePrinter:
+    """Printer device (e.g. /dev/usb/lp0), pseudo terminal or file, the data is appended"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, data: bytes):
+        with open(self.path, 'ab', buffering=0) as f:
+            f.write(data)
+
+    def __repr__(self):
+        return 'FilePrinter({!r})'.format(self.path)
+
+
+class NetworkPrinter:
+    """Printer on the network, the data is sent to its raw port (usually 9100)"""
+
+    def __init__(self, host, port=9100, timeout=5.0):
+        self.address = (host, port)
+        self.timeout = timeout
+
+    def write(self, data: bytes):
+        with socket.create_connection(self.address, timeout=self.timeout) as conn:
+            conn.sendall(data)
+
+    def __repr__(self):
+        return 'NetworkPrinter({!r}, {})'.format(*self.address)
+
+
+def open_printer(target):
+    """
+    :param target: tcp://host[:port] for a network printer, otherwise the path of a device or file
+    :return: Printer object
+    """
+    if target.startswith('tcp://'):
+        host, _, port = target[len('tcp://'):].partition(':')
+        return NetworkPrinter(host, int(port) if port else 9100)
+    return FilePrinter(target)
+
+
+class PrintSpool(threading.Thread):
+    """
+    Background thread writing the queued bons of one printer in order.
+    """
+
+    def __init__(self, printer, name='PrintSpool', max_pending=PRINT_MAX_PENDING, retries=PRINT_RETRIES,
+                 retry_interval=PRINT_RETRY_INTERVAL):
+        """
+        :param printer: Object with write(data), e.g. from open_printer()
+        :param name: Name of the thread
+        :param max_pending: Jobs queued at most, submit() drops further ones
+        :param retries: Tries of a job after the first one before it is given up
+        :param retry_interval: Seconds before the first retry, each further one waits one interval more
+        """
+        threading.Thread.__init__(self, name=name, daemon=True)
+        self.printer = printer
+        self._jobs = queue.Queue(maxsize=max_pending)
+        self._retries = retries
+        self._retry_interval = retry_interval
+        self._stopping = threading.Event()
+        self._errors = queue.Queue()
+        self._status_lock = threading.Lock()
+        self._status = {'printed': 0, 'retries': 0, 'failed': 0, 'dropped': 0, 'last_error': None}
+
+    def submit(self, render, *args) -> bool:
+        """
+        Queue a bon, never blocks. Rendering happens in the spool thread.
+        :param render: Function returning the ESC/POS data, e.g. render_receipt
+        :param args: Arguments of render
+        :return: False if the queue is full and the bon was dropped
+        """
+        try:
+            self._jobs.put_nowait((render, args))
+        except queue.Full:
+            with self._status_lock:
+                self._status['dropped'] += 1
+            self._errors.put('Druckerwarteschlange voll')
+            return False
+        return True
+
+    def run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            render, args = job
+            try:
+                data = render(*args)
+                if data:
+                    self._print(data)
+            except Exception as e:  # a broken bon must not stop the bons queued after it
+                self._set_status(last_error=repr(e))
+                with self._status_lock:
+                    self._status['failed'] += 1
+                self._errors.put('Bon nicht gedruckt: {!r}'.format(e))
+
+    def _print(self, data):
+        for attempt in range(self._retries + 1):
+            try:
+                self.printer.write(data)
+            except OSError as e:
+                self._set_status(last_error=repr(e))
+                if attempt == self._retries or self._stopping.is_set():
+                    break
+                with self._status_lock:
+                    self._status['retries'] += 1
+                if self._stopping.wait(self._retry_interval * (attempt + 1)):
+                    break
+                continue
+            with self._status_lock:
+                self._status['printed'] += 1
+                self._status['last_error'] = None
+            return
+        with self._status_lock:
+            self._status['failed'] += 1
+        self._errors.put('Drucker {}: {}'.format(self.printer, self._status['last_error']))
+
+    def _set_status(self, **fields):
+        with self._status_lock:
+            self._status.update(fields)
+
+    def get_status(self) -> dict:
+        """
+        :return: Dict with 'printed', 'retries', 'failed' (given up or not renderable), 'dropped' (queue full),
+                 'pending' and 'last_error'
+        """
+        with self._status_lock:
+            status = dict(self._status)
+        status['pending'] = self._jobs.qsize()
+        return status
+
+    def get_errors(self) -> list:
+        """
+        :return: Messages of the bons given up or dropped since the last call
+        """
+        errors = []
+        while True:
+            try:
+                errors.append(self._errors.get_nowait())
+            except queue.Empty:
+                return errors
+
+    def stop(self, timeout=None):
+        """
+        Print what is queued, a job still failing is given up at once.
+        :param timeout: Seconds to wait for the thread
+        :return: Nothing
+        """
+        self._stopping.set()
+        try:
+            self._jobs.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.join(timeout)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    sale = Sale(1, time.time(), [('Knöchle mit Kraut & Brot', 'KK', 2, 1000),
+                                 ('Cappuccino à la FFÜ', 'CAPPFUE', 1, 250)], 150, 2400, 5000)
+    for data in (render_receipt(sale), render_kitchen_ticket(sale)):
+        if argv:
+            open_printer(argv[0]).write(data)
+        print(to_text(data))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Keyboard and barcode scanner entry: resolves typed short names (KK, LKW), numeric PLUs and scanned
+barcodes to catalog articles and searches article names while typing.
+
+All lookups go through tries. Every trie node keeps the first few values below it, so completing a
+prefix costs one step per typed character, no matter how many articles the catalog has.
+
+An entry may start with a quantity: '3*LKW', '3xLKW' or '3×LKW'. A quantity below 1 is rejected, one
+above MAX_QUANTITY is cut to it, like on the quantity pad.
+"""
+import re
+import unicodedata
+from collections import OrderedDict
+
+QUICK_ENTRY_LIMIT = 8
+MAX_QUANTITY = 999
+_QUANTITY_PREFIX = re.compile(r'^\s*([-+]?\d+)\s*[*xX×]\s*(.*)$')
+_WORD_SPLIT = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text) -> str:
+    """
+    :param text: Typed text or article name
+    :return: Lower case text without accents, 'Käse' -> 'kase'
+    """
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def parse_entry(text) -> tuple:
+    """
+    :param text: Typed entry, e.g. '3*LKW'
+    :return: (quantity, code), quantity is None without a quantity prefix
+    :raises ValueError: If the quantity is below 1
+    """
+    match = _QUANTITY_PREFIX.match(text)
+    if match is None:
+        return None, text.strip()
+    quantity = int(match.group(1))
+    if quantity < 1:
+        raise ValueError('Invalid quantity: {}'.format(quantity))
+    return min(quantity, MAX_QUANTITY), match.group(2).strip()
+
+
+class _TrieNode:
+    __slots__ = ('children', 'values', 'exact')
+
+    def __init__(self):
+        self.children = {}
+        self.values = []
+        self.exact = []
+
+
+class PrefixIndex:
+    """Trie of strings, every node keeps the first `limit` values inserted below it"""
+
+    def __init__(self, limit=QUICK_ENTRY_LIMIT):
+        self._root = _TrieNode()
+        self._limit = limit
+
+    def insert(self, key, value):
+        """
+        :param key: String the value is found by
+        :param value: Value, values inserted first are returned first
+        :return: Nothing
+        """
+        node = self._root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            if len(node.values) < self._limit and value not in node.values:
+                node.values.append(value)
+        if value not in node.exact:
+            node.exact.append(value)
+
+    def _node(self, key):
+        node = self._root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def get(self, key) -> list:
+        """
+        :param key: Complete key
+        :return: Values inserted with exactly this key
+        """
+        node = self._node(key)
+        return list(node.exact) if node is not None else []
+
+    def complete(self, prefix) -> list:
+        """
+        :param prefix: Beginning of a key, not empty
+        :return: Up to `limit` values whose key starts with prefix
+        """
+        node = self._node(prefix)
+        return list(node.values) if node is not None and prefix else []
+
+
+class CatalogIndex:
+    """
+    Codes and name words of the catalog articles. The custom amount (EB) and articles without a name
+    are not indexed.
+    """
+
+    def __init__(self, catalog: OrderedDict, limit=QUICK_ENTRY_LIMIT):
+        """
+        :param catalog: Catalog of DBAccess
+        :param limit: Maximum number of search results
+        """
+        self._limit = limit
+        self._codes = PrefixIndex(limit)
+        self._words = PrefixIndex(limit)
+        items = [item for item in catalog.values() if item.name != '']
+        # a barcode wins over a plu, a plu over a short name
+        for item in items:
+            if item.barcode:
+                self._codes.insert(normalize(item.barcode), item)
+        for item in items:
+            if item.plu is not None:
+                self._codes.insert(str(item.plu), item)
+        for item in items:
+            self._codes.insert(normalize(item.name_short), item)
+            for word in _WORD_SPLIT.split(normalize(item.name)):
+                if word:
+                    self._words.insert(word, item)
+
+    def lookup(self, code):
+        """
+        :param code: Barcode, PLU or short name
+        :return: Catalog item with exactly this code, None if there is none
+        """
+        items = self._codes.get(normalize(code))
+        return items[0] if items else None
+
+    def search(self, text) -> list:
+        """
+        Articles whose code starts with the text, followed by those with a name word starting with
+        each of the typed words.
+        :param text: Typed text without quantity prefix
+        :return: Up to `limit` catalog items
+        """
+        words = [w for w in _WORD_SPLIT.split(normalize(text)) if w]
+        if not words:
+            return []
+        results = self._codes.complete(normalize(text.strip())) if len(words) == 1 else []
+        matches = self._words.complete(words[0])
+        for word in words[1:]:
+            candidates = self._words.complete(word)
+            matches = [item for item in matches if item in candidates]
+        for item in matches:
+            if item not in results:
+                results.append(item)
+        return results[:self._limit]
+
+    def resolve(self, text) -> tuple:
+        """
+        :param text: Typed entry, e.g. '3*LKW', 'kaff' or a scanned barcode
+        :return: (catalog item or None, quantity or None), the exact code first, otherwise the
+                 first search result
+        :raises ValueError: If the quantity is below 1
+        """
+        quantity, code = parse_entry(text)
+        item = self.lookup(code)
+        if item is None:
+            results = self.search(code)
+            item = results[0] if results else None
+        return item, quantity
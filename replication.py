@@ -0,0 +1,143 @@
+"""
+Terminal side of the transaction replication to a central aggregator (see aggregator.py).
+
+Every checkout puts its tr_id into replication_outbox in the same db transaction as the sale. The
+Replicator thread reads the outbox with its own connection, sends the sales in batches as JSON over
+HTTP and removes them from the outbox once the aggregator acknowledged them. While the aggregator
+cannot be reached the sales simply stay in the outbox (store and forward), so the checkout path never
+waits for the network. A sale is identified by (terminal id, tr_id), the aggregator ignores sales it
+already has, so sending a batch twice is harmless.
+
+Protocol:
+    POST /batch   {"terminal": id, "transactions": [{"tr_id", "ts", "bill_cents", "cash_cents",
+                   "items": [[short name, qty, unit_price_cents], ...]}, ...]}
+                  -> {"stored": number of new sales}
+    GET /summary  -> combined summary of all terminals
+"""
+import json
+import sqlite3
+import threading
+import time
+import urllib.request
+from db_schema import ensure_schema, get_terminal_id
+
+REPLICATION_BATCH_SIZE = 200
+REPLICATION_INTERVAL = 2.0
+REPLICATION_MAX_BACKOFF = 60.0
+
+
+def read_outbox(db_conn: sqlite3.Connection, limit=REPLICATION_BATCH_SIZE) -> list:
+    """
+    :param db_conn: Open sqlite connection of the register db
+    :param limit: Maximum number of sales
+    :return: List of the oldest not yet acknowledged sales as dicts of the batch protocol
+    """
+    headers = db_conn.execute('SELECT t.tr_id, t.ts, t.bill_cents, t.cash_cents FROM replication_outbox o '
+                              'JOIN transactions t ON t.tr_id = o.tr_id ORDER BY o.tr_id LIMIT ?',
+                              (limit,)).fetchall()
+    if not headers:
+        return []
+    transactions = {}
+    for tr_id, ts, bill_cents, cash_cents in headers:
+        transactions[tr_id] = {'tr_id': tr_id, 'ts': ts, 'bill_cents': bill_cents, 'cash_cents': cash_cents,
+                               'items': []}
+    rows = db_conn.execute('SELECT i.tr_id, f.name_short, i.qty, i.unit_price_cents FROM transaction_items i '
+                           'JOIN food_list f ON f.id = i.item_id WHERE i.tr_id BETWEEN ? AND ?',
+                           (headers[0][0], headers[-1][0]))
+    for tr_id, short_name, qty, unit_price_cents in rows:
+        if tr_id in transactions:
+            transactions[tr_id]['items'].append([short_name, qty, unit_price_cents])
+    return list(transactions.values())
+
+
+class Replicator(threading.Thread):
+    """
+    Background thread sending the replication outbox of a register db to the aggregator.
+    """
+
+    def __init__(self, db_name, url, batch_size=REPLICATION_BATCH_SIZE, interval=REPLICATION_INTERVAL,
+                 timeout=5.0):
+        """
+        :param db_name: Path of the register db
+        :param url: Base url of the aggregator, e.g. http://192.168.1.10:8750
+        :param batch_size: Maximum number of sales per request
+        :param interval: Seconds between two looks at the outbox if notify() is not called
+        :param timeout: Network timeout of one request in seconds
+        """
+        threading.Thread.__init__(self, name='Replicator', daemon=True)
+        self._db_name = db_name
+        self._url = url.rstrip('/') + '/batch'
+        self._batch_size = batch_size
+        self._interval = interval
+        self._timeout = timeout
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._status_lock = threading.Lock()
+        self._status = {'sent': 0, 'pending': None, 'last_error': None, 'last_success': None}
+
+    def run(self):
+        db_conn = sqlite3.connect(self._db_name)
+        try:
+            ensure_schema(db_conn)
+            terminal_id = get_terminal_id(db_conn)
+            backoff = self._interval
+            while not self._stopping:
+                try:
+                    self._send_outbox(db_conn, terminal_id)
+                    backoff = self._interval
+                except (OSError, ValueError, sqlite3.Error) as e:
+                    self._set_status(last_error=repr(e))
+                    backoff = min(backoff * 2, REPLICATION_MAX_BACKOFF)
+                self._wakeup.wait(backoff)
+                self._wakeup.clear()
+        finally:
+            db_conn.close()
+
+    def _send_outbox(self, db_conn: sqlite3.Connection, terminal_id):
+        """
+        Send batches until the outbox is empty or the stop was requested.
+        """
+        while not self._stopping:
+            batch = read_outbox(db_conn, self._batch_size)
+            if not batch:
+                break
+            body = json.dumps({'terminal': terminal_id, 'transactions': batch}).encode('utf-8')
+            request = urllib.request.Request(self._url, data=body, headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request, timeout=self._timeout) as response:
+                json.loads(response.read().decode('utf-8'))
+            with db_conn:
+                db_conn.executemany('DELETE FROM replication_outbox WHERE tr_id=?', [(t['tr_id'],) for t in batch])
+            with self._status_lock:
+                self._status['sent'] += len(batch)
+            self._set_status(last_error=None, last_success=time.time())
+        pending = db_conn.execute('SELECT count(*) FROM replication_outbox').fetchone()[0]
+        self._set_status(pending=pending)
+
+    def _set_status(self, **fields):
+        with self._status_lock:
+            self._status.update(fields)
+
+    def get_status(self) -> dict:
+        """
+        :return: Dict with 'sent' (sales sent since start), 'pending' (sales in the outbox at the last
+                 look), 'last_error' and 'last_success' (unix time)
+        """
+        with self._status_lock:
+            return dict(self._status)
+
+    def notify(self):
+        """
+        Look at the outbox now, e.g. after a checkout was written
+        :return: Nothing
+        """
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        """
+        Stop the thread after the current request, unsent sales stay in the outbox.
+        :param timeout: Seconds to wait for the thread
+        :return: Nothing
+        """
+        self._stopping = True
+        self._wakeup.set()
+        self.join(timeout)
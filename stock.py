@@ -0,0 +1,214 @@
+"""
+Stock of the articles, kept in memory so the register knows at every tap whether an article is
+running out without asking the db.
+
+An article is tracked if it has a recipe: the components one piece of it consumes, e.g. a KK one
+Knöchle and one portion of Kraut. db_checkout decrements the stock table in the checkout
+transaction, the register applies the same consumption to its StockLevels. The CatalogWatcher
+reads the stock whenever another connection has committed, so restocking and the sales of other
+terminals reach the register without a read on the tap path. A component sold by two terminals at
+once can go below 0, the level then shows the shortfall.
+
+Usage (show the stock, optionally change it first):
+    python stock.py touchReg.db [--set Knöchle=40] [--add Kraut=20] [--warn Knöchle=10]
+                                [--recipe KK=Knöchle:1,Kraut:1]
+"""
+import sys
+import sqlite3
+import argparse
+from collections import OrderedDict
+from db_schema import ensure_schema
+
+STOCK_OK = 'ok'
+STOCK_LOW = 'low'
+STOCK_OUT = 'out'
+
+
+class StockLevels:
+
+    def __init__(self, recipes: dict, levels: dict, warn_below: dict, last_tr_id=0):
+        """
+        :param recipes: Item id -> tuple of (component, pieces consumed by one piece of the article)
+        :param levels: Component -> pieces on hand
+        :param warn_below: Component -> level below which the component is low
+        :param last_tr_id: Id of the last sale the levels include
+        """
+        self.recipes = recipes
+        self.levels = levels
+        self.warn_below = warn_below
+        self.last_tr_id = last_tr_id
+        self._users = {}  # component -> ids of the articles consuming it
+        for item_id, recipe in recipes.items():
+            for component, _ in recipe:
+                self._users.setdefault(component, set()).add(item_id)
+
+    def consumption(self, lines) -> dict:
+        """
+        :param lines: Iterable of (item id, pieces)
+        :return: Dict of component -> pieces consumed, cost linear in the lines
+        """
+        used = {}
+        for item_id, qty in lines:
+            for component, per_piece in self.recipes.get(item_id, ()):
+                used[component] = used.get(component, 0) + qty * per_piece
+        return used
+
+    def take(self, used: dict):
+        """
+        :param used: Consumption, see consumption(); negative to put pieces back
+        :return: Nothing
+        """
+        for component, qty in used.items():
+            self.levels[component] = self.levels.get(component, 0) - qty
+
+    def pieces_left(self, item_id, reserved: dict = None):
+        """
+        :param item_id: Id of the article
+        :param reserved: Consumption not yet taken, e.g. of the open order
+        :return: Pieces of the article that can still be sold, None if the article is not tracked
+        """
+        reserved = reserved or {}
+        left = [(self.levels.get(component, 0) - reserved.get(component, 0)) // per_piece
+                for component, per_piece in self.recipes.get(item_id, ()) if per_piece > 0]
+        return max(0, min(left)) if left else None
+
+    def state(self, item_id, reserved: dict = None):
+        """
+        :param item_id: Id of the article
+        :param reserved: Consumption not yet taken, e.g. of the open order
+        :return: STOCK_OUT, STOCK_LOW if a component is below its warning level, STOCK_OK, or None if
+                 the article is not tracked
+        """
+        left = self.pieces_left(item_id, reserved)
+        if left is None:
+            return None
+        if left == 0:
+            return STOCK_OUT
+        reserved = reserved or {}
+        for component, _ in self.recipes[item_id]:
+            if self.levels.get(component, 0) - reserved.get(component, 0) < self.warn_below.get(component, 0):
+                return STOCK_LOW
+        return STOCK_OK
+
+    def affected(self, item_id) -> set:
+        """
+        :param item_id: Id of an article
+        :return: Ids of all articles sharing a component with it, including itself if tracked
+        """
+        ids = set()
+        for component, _ in self.recipes.get(item_id, ()):
+            ids |= self._users[component]
+        return ids
+
+    def tracked(self) -> set:
+        """
+        :return: Ids of all articles with a recipe
+        """
+        return set(self.recipes)
+
+
+def read_stock(db_conn: sqlite3.Connection) -> StockLevels:
+    """
+    Read the stock, the recipes and the id of the last sale in one read transaction.
+    :param db_conn: Open sqlite connection of a db passed through ensure_schema
+    :return: StockLevels
+    """
+    in_transaction = db_conn.in_transaction
+    if not in_transaction:
+        db_conn.execute('BEGIN')
+    try:
+        stock = db_conn.execute('SELECT component, qty, warn_below FROM stock').fetchall()
+        rows = db_conn.execute('SELECT item_id, component, qty FROM recipes ORDER BY item_id, component').fetchall()
+        last_tr_id = db_conn.execute("SELECT ifnull(max(tr_id), 0) FROM transactions").fetchone()[0]
+    finally:
+        if not in_transaction:
+            db_conn.commit()
+    recipes = {}
+    for item_id, component, qty in rows:
+        recipes[item_id] = recipes.get(item_id, ()) + ((component, qty),)
+    return StockLevels(recipes, {component: qty for component, qty, _ in stock},
+                       {component: warn_below for component, _, warn_below in stock}, last_tr_id)
+
+
+def change_stock(db_conn: sqlite3.Connection, levels: dict = None, added: dict = None, warn_below: dict = None):
+    """
+    Restock in one transaction, unknown components are created.
+    :param db_conn: Open sqlite connection of the register db
+    :param levels: Component -> new pieces on hand
+    :param added: Component -> pieces added to the current level
+    :param warn_below: Component -> new warning level
+    :return: Nothing
+    """
+    with db_conn:
+        for component, qty in (levels or {}).items():
+            db_conn.execute('INSERT INTO stock (component, qty) VALUES (?,?) '
+                            'ON CONFLICT (component) DO UPDATE SET qty = excluded.qty', (component, qty))
+        for component, qty in (added or {}).items():
+            db_conn.execute('INSERT INTO stock (component, qty) VALUES (?,?) '
+                            'ON CONFLICT (component) DO UPDATE SET qty = qty + excluded.qty', (component, qty))
+        for component, qty in (warn_below or {}).items():
+            db_conn.execute('INSERT INTO stock (component, qty, warn_below) VALUES (?,0,?) '
+                            'ON CONFLICT (component) DO UPDATE SET warn_below = excluded.warn_below',
+                            (component, qty))
+
+
+def set_recipe(db_conn: sqlite3.Connection, item_short_name, recipe: dict):
+    """
+    Replace the recipe of an article, unknown components are created with 0 pieces.
+    :param db_conn: Open sqlite connection of the register db
+    :param item_short_name: Short name of the article
+    :param recipe: Component -> pieces consumed by one piece of the article, empty to stop tracking it
+    :return: Nothing
+    """
+    row = db_conn.execute('SELECT id FROM food_list WHERE name_short=?', (item_short_name,)).fetchone()
+    if row is None:
+        raise KeyError(item_short_name)
+    with db_conn:
+        db_conn.execute('DELETE FROM recipes WHERE item_id=?', row)
+        for component, qty in recipe.items():
+            db_conn.execute('INSERT OR IGNORE INTO stock (component, qty) VALUES (?,0)', (component,))
+            db_conn.execute('INSERT INTO recipes (item_id, component, qty) VALUES (?,?,?)', (row[0], component, qty))
+
+
+def _assignments(values: list, separator='=') -> OrderedDict:
+    result = OrderedDict()
+    for value in values or ():
+        name, _, qty = value.rpartition(separator)
+        if not name:
+            raise ValueError('expected NAME{}NUMBER: {}'.format(separator, value))
+        result[name.strip()] = int(qty)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show and change the stock of a register db')
+    parser.add_argument('db_file')
+    parser.add_argument('--set', action='append', metavar='COMPONENT=PIECES', help='set the pieces on hand')
+    parser.add_argument('--add', action='append', metavar='COMPONENT=PIECES', help='add pieces')
+    parser.add_argument('--warn', action='append', metavar='COMPONENT=PIECES', help='warn below this level')
+    parser.add_argument('--recipe', action='append', metavar='ARTICLE=COMPONENT:PIECES,...',
+                        help='components one piece of an article consumes, ARTICLE= stops tracking it')
+    args = parser.parse_args(argv)
+
+    db_conn = sqlite3.connect(args.db_file)
+    try:
+        ensure_schema(db_conn)
+        for value in args.recipe or ():
+            short_name, _, components = value.partition('=')
+            set_recipe(db_conn, short_name.strip(), _assignments([c for c in components.split(',') if c], ':'))
+        change_stock(db_conn, _assignments(args.set), _assignments(args.add), _assignments(args.warn))
+
+        stock = read_stock(db_conn)
+        names = dict(db_conn.execute('SELECT id, name_short FROM food_list').fetchall())
+        for component in sorted(stock.levels):
+            articles = sorted(names.get(item_id, item_id) for item_id, recipe in stock.recipes.items()
+                              if component in dict(recipe))
+            print('{:20} {:6d}  (Warnung unter {})  {}'.format(component, stock.levels[component],
+                                                              stock.warn_below[component], ', '.join(articles)))
+    finally:
+        db_conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_schema import init_db  # noqa: E402
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    """Path of a new register db with the articles of db_init_script.sqlite"""
+    name = str(tmp_path / 'kasse.db')
+    init_db(name)
+    return name
@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+
+from kasse_core import RegisterEngine, DBAccess
+
+
+def open_engine(db_name, **kwargs):
+    return RegisterEngine(db_name, journal_file=db_name + '.cart', **kwargs)
+
+
+def test_crashed_checkout_is_written_on_restart(db_name):
+    engine = open_engine(db_name)
+    engine.add_item('KK')
+    bill = engine.cart.get_total_cents()
+    # power loss after the checkout was journaled, before the db write
+    engine._journal('checkout', 1790000000, bill, 2000, 'sale-1', sync=True)
+    engine.close()
+
+    engine = open_engine(db_name)
+    assert engine.recovered_sales == 1
+    assert engine.db_interface.db_get_transactions() == [(1, 1790000000, bill, 2000)]
+    assert len(engine.cart) == 0
+    engine.close()
+
+    engine = open_engine(db_name)
+    assert engine.recovered_sales == 0
+    engine.close()
+
+
+def test_identical_sale_in_the_same_second_is_not_taken_for_a_duplicate(db_name):
+    engine = open_engine(db_name)
+    engine.add_item('CAPP')
+    bill = engine.cart.get_total_cents()
+    engine.pay(bill, timestamp=1790000000)
+    engine.add_item('CAPP')
+    engine._journal('checkout', 1790000000, bill, bill, 'sale-2', sync=True)
+    engine.close()
+
+    engine = open_engine(db_name)
+    assert engine.recovered_sales == 1
+    assert [t[1:] for t in engine.db_interface.db_get_transactions()] == [(1790000000, bill, bill)] * 2
+    engine.close()
+
+
+def test_failed_then_cancelled_sale_is_not_written_on_restart(db_name, monkeypatch):
+    engine = open_engine(db_name)
+    engine.add_item('KK')
+
+    def locked(*args, **kwargs):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(engine.db_interface, 'db_checkout', locked)
+    with pytest.raises(sqlite3.OperationalError):
+        engine.pay(5000)
+    engine.cancel()
+    engine.close()
+    monkeypatch.undo()
+
+    engine = open_engine(db_name)
+    assert engine.recovered_sales == 0
+    assert engine.db_interface.db_get_transactions() == []
+    assert len(engine.cart) == 0
+    engine.close()
+
+
+def test_failed_background_write_is_not_written_on_restart(db_name, monkeypatch):
+    def locked(*args, **kwargs):
+        raise sqlite3.OperationalError('database is locked')
+
+    engine = open_engine(db_name, background_writes=True)
+    monkeypatch.setattr(DBAccess, 'db_checkout', locked)  # the writer thread has its own DBAccess
+    errors = []
+    engine.add_item('KK')
+    engine.pay(5000, on_error=errors.append)
+    engine.close()  # waits for the writer and runs the callbacks
+    monkeypatch.undo()
+    assert len(errors) == 1
+
+    engine = open_engine(db_name)
+    assert engine.recovered_sales == 0
+    assert engine.db_interface.db_get_transactions() == []
+    engine.close()
+
+
+def test_failed_write_rejected_after_the_next_order_started(db_name):
+    engine = open_engine(db_name)
+    engine.add_item('KK')
+    bill = engine.cart.get_total_cents()
+    engine._journal('checkout', 1790000000, bill, bill, 'sale-3', sync=True)
+    engine._journal('cancel')
+    engine.add_item('LK')
+    engine._journal('checkout_rejected', 'sale-3', sync=True)
+    engine.close()
+
+    engine = open_engine(db_name)
+    assert engine.recovered_sales == 0
+    assert [line.short_name for line in engine.cart.get_lines()] == ['LK']
+    engine.close()
@@ -0,0 +1,44 @@
+import pytest
+
+from kasse_core import RegisterEngine
+from quick_entry import CatalogIndex, parse_entry, MAX_QUANTITY
+
+
+def test_parse_entry_quantity_prefix():
+    assert parse_entry('3*LKW') == (3, 'LKW')
+    assert parse_entry(' 2 x KK ') == (2, 'KK')
+    assert parse_entry('4×kaff') == (4, 'kaff')
+    assert parse_entry('KK') == (None, 'KK')
+
+
+@pytest.mark.parametrize('text', ['0*KK', '00xKK', '-3*KK', '-1×KK'])
+def test_parse_entry_rejects_quantities_below_one(text):
+    with pytest.raises(ValueError):
+        parse_entry(text)
+
+
+def test_parse_entry_caps_the_quantity():
+    assert parse_entry('1000*KK') == (MAX_QUANTITY, 'KK')
+    assert parse_entry('99999999999999999999xKK') == (MAX_QUANTITY, 'KK')
+    assert parse_entry('999*KK') == (999, 'KK')
+
+
+def test_resolve(db_name):
+    engine = RegisterEngine(db_name)
+    index = CatalogIndex(engine.get_catalog())
+    item, quantity = index.resolve('2*KK')
+    assert (item.name_short, quantity) == ('KK', 2)
+    with pytest.raises(ValueError):
+        index.resolve('0*KK')
+    engine.close()
+
+
+def test_zero_quantity_is_neither_added_nor_journaled(db_name):
+    engine = RegisterEngine(db_name, journal_file=db_name + '.cart')
+    with pytest.raises(ValueError):
+        engine.add_item('KK', 0)
+    with pytest.raises(ValueError):
+        engine.add_custom_amount(100, quantity=-1)
+    assert len(engine.cart) == 0
+    assert engine.journal.get_records() == []
+    engine.close()
@@ -0,0 +1,43 @@
+"""
+Soak check of bench_soak.py: thousands of orders through one register, failing if the traced Python
+memory or the objects the garbage collector tracks keep growing. Takes about 20 seconds.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import bench_soak  # noqa: E402
+
+MAX_PYTHON_GROWTH_KIB = 256
+MAX_OBJECT_GROWTH = 1000
+
+
+def check(result):
+    assert result['failures'] == []
+    assert result['growth']['traced_kib'] <= MAX_PYTHON_GROWTH_KIB, result['top_growth']
+    assert result['growth']['python_objects'] <= MAX_OBJECT_GROWTH
+
+
+def test_engine_stays_flat():
+    result = bench_soak.run(orders=10000, warmup=1000, driver='engine', max_python_growth=MAX_PYTHON_GROWTH_KIB,
+                            max_object_growth=MAX_OBJECT_GROWTH)
+    assert result['meta']['driver'] == 'engine'
+    assert len(result['samples']) == 11
+    check(result)
+
+
+def test_widgets_stay_flat():
+    tk = pytest.importorskip('tkinter')
+    try:
+        tk.Tk().destroy()
+    except tk.TclError as e:
+        pytest.skip('no display: {}'.format(e))
+    result = bench_soak.run(orders=2000, warmup=200, sample_every=200, driver='ui',
+                            max_python_growth=MAX_PYTHON_GROWTH_KIB, max_object_growth=MAX_OBJECT_GROWTH)
+    assert result['meta']['driver'] == 'ui'
+    for key in ('widgets', 'canvas_items', 'tcl_commands'):
+        assert result['growth'][key] == 0
+    check(result)
@@ -0,0 +1,69 @@
+import sqlite3
+
+import pytest
+
+from kasse_core import RegisterEngine, OutOfStockError
+from stock import change_stock, set_recipe, STOCK_OUT, STOCK_LOW, STOCK_OK
+
+
+@pytest.fixture
+def stocked_db(db_name):
+    """KK and LK share the cups, two KK use up a sausage"""
+    with sqlite3.connect(db_name) as db_conn:
+        set_recipe(db_conn, 'KK', {'Becher': 1, 'Wurst': 1})
+        set_recipe(db_conn, 'LK', {'Becher': 1})
+        change_stock(db_conn, levels={'Becher': 3, 'Wurst': 2}, warn_below={'Becher': 2})
+    db_conn.close()
+    return db_name
+
+
+def test_more_pieces_than_left_are_rejected(stocked_db):
+    engine = RegisterEngine(stocked_db, journal_file=stocked_db + '.cart')
+    with pytest.raises(OutOfStockError) as e:
+        engine.add_item('KK', 3)
+    assert (e.value.short_name, e.value.state, e.value.pieces_left) == ('KK', STOCK_OK, 2)
+    assert len(engine.cart) == 0
+    assert engine.journal.get_records() == []
+
+    engine.add_item('KK', 2)
+    assert engine.stock_states(['KK', 'LK']) == {'KK': (STOCK_OUT, 0), 'LK': (STOCK_LOW, 1)}
+    with pytest.raises(OutOfStockError) as e:
+        engine.add_item('KK')
+    assert (e.value.state, e.value.pieces_left) == (STOCK_OUT, 0)
+    assert engine.cart.get_counts() == {'KK': 2}
+    assert len(engine.journal.get_records()) == 1
+    engine.close()
+
+
+def test_shared_component_limits_the_other_article(stocked_db):
+    engine = RegisterEngine(stocked_db)
+    engine.add_item('KK', 2)
+    with pytest.raises(OutOfStockError):
+        engine.add_item('LK', 2)
+    engine.add_item('LK')
+    assert engine.cart.get_counts() == {'KK': 2, 'LK': 1}
+    engine.close()
+
+
+def test_sold_pieces_stay_taken_in_the_next_order(stocked_db):
+    engine = RegisterEngine(stocked_db)
+    engine.add_item('KK', 2)
+    engine.pay(5000)
+    with pytest.raises(OutOfStockError):
+        engine.add_item('KK')  # starts the next order
+    assert len(engine.cart) == 0
+    engine.close()
+
+    engine = RegisterEngine(stocked_db)
+    assert engine.stock_states(['KK'])['KK'] == (STOCK_OUT, 0)
+    with pytest.raises(OutOfStockError):
+        engine.add_item('KK')
+    engine.close()
+
+
+def test_untracked_articles_and_custom_amounts_are_not_limited(stocked_db):
+    engine = RegisterEngine(stocked_db)
+    engine.add_item('CAPP', 50)
+    engine.add_custom_amount(100, quantity=50)
+    assert engine.cart.get_counts() == {'CAPP': 50, 'EB': 50}
+    engine.close()